@@ -85,6 +85,7 @@ def parse_cmd(chunks):
 # main
 def main():
     """main boilerplate"""
+    utils.configure_logging('GPIO/admin')
     # initialize client
     ps2 = config.CLI_Config.PS2
     client = Client()
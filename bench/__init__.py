@@ -0,0 +1,11 @@
+"""
+@name   Benchmarks
+@desc   Benchmarks of the GPIO server and the control loop.
+
+Run from the repository root, e.g.:
+
+    $ python3 -m bench.load --workers 1,5,10 --clients 16 --duration 10
+    $ python3 -m bench.compare bench/results/load-a.json bench/results/load-b.json
+
+Each run writes its results as JSON under `bench/results/`, see `doc/bench.md`.
+"""
@@ -0,0 +1,193 @@
+"""
+@name   Common
+@desc   Starting a stub GPIO server to benchmark, and recording the results.
+
+The server runs in an interpreter of its own, started afresh for every
+configuration (see `server.py`), so the load generator neither shares its
+interpreter lock nor the module-level GPIO state. It always uses the
+`stub.Stub` backend, on the Pi too.
+"""
+
+import os
+import sys
+import json
+import math
+import socket
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from time import time, sleep, monotonic
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+
+# load processes are spawned, not forked, so none inherits the parent's
+# connections or threads
+MP = multiprocessing.get_context('spawn')
+
+def free_port():
+    """
+    @return     int     a TCP port nothing listens on, at the moment
+    """
+    with socket.socket() as sck:
+        sck.bind(('localhost', 0))
+        return sck.getsockname()[1]
+
+def wait_until_up(address, timeout=10):
+    """
+    Waits for the server to accept connections.
+
+    @raises     TimeoutError    if it does not within `timeout` seconds
+
+    @param      obj     address     the unix socket path, or (host, port)
+    @return     None
+    """
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            with socket.socket(family) as sck:
+                sck.connect(address)
+            return
+        except OSError:
+            if monotonic() > deadline:
+                raise TimeoutError("the server did not start in {}s".format(timeout))
+            sleep(0.05)
+
+@contextmanager
+def stub_server(engine='thread', workers=None, unix=True, sync=False, log=False, gpio=None):
+    """
+    Runs a GPIO server in a new process, on a free port and a temporary unix
+    socket, with its state file in a temporary directory.
+
+    ex.
+    >>> with stub_server(workers=5) as address:
+    ...     gpio = Client(path=address['path'])
+
+    @param      str     engine      'thread' or 'asyncio'
+    @param      int     workers     the size of its worker pool
+    @param      bool    unix        whether to listen on a unix socket too
+    @param      bool    sync        whether to sync the journal on every change
+    @param      bool    log         whether to keep the server's request log
+    @param      dict    gpio        `GPIOConfig` layouts to override, e.g.
+    {"PINS": {name : GPIO}, "CHNL_NUMBERS": {name : GPIO}}
+    @return     dict    {"port": port, "path": unix socket path or None}
+    """
+    with tempfile.TemporaryDirectory(prefix='herbert-bench-') as tmp:
+        port = free_port()
+        path = os.path.join(tmp, 'gpio.sock') if unix else ''
+        spec = {
+            "engine" : engine, "workers" : workers, "port" : port, "path" : path,
+            "fname" : os.path.join(tmp, 'gpio_states.json'), "sync" : sync, "log" : log,
+            "gpio" : {
+                attr : [[name, gpio.type, gpio.num] for name, gpio in gpios.items()]
+                for attr, gpios in (gpio if gpio else {}).items()
+            }
+        }
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'bench.server', json.dumps(spec)], cwd=ROOT
+        )
+        try:
+            wait_until_up(path if unix else ('localhost', port))
+            yield {"port" : port, "path" : path or None}
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+def percentile(ordered, q):
+    """
+    The nearest-rank percentile of sorted samples.
+
+    @param      list    ordered     the samples, sorted
+    @param      float   q           the percentile, between 0 and 100
+    @return     float   the percentile, or None without samples
+    """
+    if not ordered:
+        return None
+    rank = max(int(math.ceil(q / 100 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+def summarize(samples, duration=None):
+    """
+    Summarizes latencies.
+
+    @param      list    samples     the latencies, in seconds
+    @param      float   duration    the seconds they were measured over, to
+    compute a throughput
+    @return     dict    {"count", "mean_ms", "p50_ms", "p95_ms", "p99_ms",
+    "max_ms"} and "per_s" given a duration
+    """
+    ordered = sorted(samples)
+    ms = lambda val: None if val is None else round(val * 1000, 4)
+    summary = {
+        "count" : len(ordered),
+        "mean_ms" : ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms" : ms(percentile(ordered, 50)),
+        "p95_ms" : ms(percentile(ordered, 95)),
+        "p99_ms" : ms(percentile(ordered, 99)),
+        "max_ms" : ms(ordered[-1]) if ordered else None,
+    }
+    if duration:
+        summary["per_s"] = round(len(ordered) / duration, 2)
+    return summary
+
+def git_commit():
+    """
+    @return     str     the commit checked out, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name, params, runs, out=None):
+    """
+    Writes a benchmark's results as JSON, with what is needed to compare them
+    to other runs: the commit, host, and parameters.
+
+    @param      str     name        the benchmark, e.g. 'load'
+    @param      dict    params      the parameters it was run with
+    @param      list    runs        the result of each configuration
+    @param      str     out         the file to write, defaults to
+    `bench/results/<name>-<commit>-<time>.json`
+    @return     str     the file written
+    """
+    commit = git_commit()
+    started = time()
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, '{}-{}-{}.json'.format(
+            name, commit or 'nogit', int(started)
+        ))
+
+    with open(out, 'w') as file:
+        json.dump({
+            "benchmark" : name,
+            "commit" : commit,
+            "time" : started,
+            "host" : platform.node(),
+            "machine" : platform.machine(),
+            "python" : sys.version.split()[0],
+            "params" : params,
+            "runs" : runs
+        }, file, indent=2)
+        file.write('\n')
+    return out
+
+def print_table(header, rows):
+    """Prints rows of values as aligned columns."""
+    rows = [[('-' if val is None else str(val)) for val in row] for row in rows]
+    widths = [max([len(str(col))] + [len(row[i]) for row in rows]) for i, col in enumerate(header)]
+    print('  '.join(str(col).rjust(width) for col, width in zip(header, widths)))
+    for row in rows:
+        print('  '.join(val.rjust(width) for val, width in zip(row, widths)))
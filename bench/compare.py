@@ -0,0 +1,99 @@
+"""
+@name   Compare
+@desc   Compares two benchmark result files, e.g. from two commits.
+
+Runs are matched by their configuration (engine, workers, ...), and each
+latency summary in them by its path (e.g. 'actions/PGET', 'phases/read').
+Prints the throughput and latency percentiles of both, and the change.
+
+ex.
+    $ python3 -m bench.compare bench/results/load-1a2b3c4-*.json bench/results/load-5d6e7f8-*.json
+"""
+
+import json
+import argparse
+
+from . import common
+
+METRICS = ['per_s', 'p50_ms', 'p95_ms', 'p99_ms']
+
+def run_key(run):
+    """
+    @return     tuple   what identifies a run's configuration: its scalar fields
+    """
+    return tuple(sorted((name, val) for name, val in run.items() if not isinstance(val, (dict, list))))
+
+def summaries(obj, path=''):
+    """
+    Finds every latency summary (see `common.summarize()`) nested in a run.
+
+    @return     dict    {path : summary}
+    """
+    if not isinstance(obj, dict):
+        return {}
+    if 'p50_ms' in obj:
+        return {path : obj}
+
+    found = {}
+    for name, val in obj.items():
+        found.update(summaries(val, '{}/{}'.format(path, name) if path else name))
+    return found
+
+def change(old, new):
+    """@return  str     the relative change from `old` to `new`, e.g. '+12.5%'"""
+    if old is None or new is None or not old:
+        return None
+    return '{:+.1f}%'.format((new - old) / old * 100)
+
+def compare(old, new):
+    """
+    Compares two results.
+
+    @param      dict    old         the results to compare against
+    @param      dict    new         the results to compare
+    @return     list    rows of (configuration, path, metric, old, new, change)
+    """
+    old_runs = {run_key(run) : run for run in old["runs"]}
+    rows = []
+    for run in new["runs"]:
+        key = run_key(run)
+        if key not in old_runs:
+            continue
+        old_summaries = summaries(old_runs[key])
+        for path, summary in sorted(summaries(run).items()):
+            if path not in old_summaries:
+                continue
+            for metric in METRICS:
+                before, after = old_summaries[path].get(metric), summary.get(metric)
+                if before is None and after is None:
+                    continue
+                rows.append([
+                    ' '.join('{}={}'.format(name, val) for name, val in key),
+                    path, metric, before, after, change(before, after)
+                ])
+    return rows
+
+def main():
+    """Main boilerplate."""
+    parser = argparse.ArgumentParser(description="Compares two benchmark result files.")
+    parser.add_argument('old', help="the results to compare against")
+    parser.add_argument('new', help="the results to compare")
+    args = parser.parse_args()
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    if old.get("benchmark") != new.get("benchmark"):
+        parser.error("cannot compare `{}` results to `{}` results".format(
+            old.get("benchmark"), new.get("benchmark")))
+
+    print("{} ({}) -> {} ({})".format(old.get("commit"), args.old, new.get("commit"), args.new))
+    rows = compare(old, new)
+    if not rows:
+        print("no runs with the same configuration")
+        return
+    common.print_table(["run", "summary", "metric", "old", "new", "change"], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+@name   Load
+@desc   Load-generation benchmark of the GPIO server.
+
+Starts a stub GPIO server for every combination of `--engine` and `--workers`,
+then drives it with `--clients` concurrent clients, spread over `--processes`
+processes, each sending actions drawn from `--mix` back to back for
+`--duration` seconds (after `--warmup` seconds not measured). Reports the
+throughput, latency percentiles and errors per action type, and writes them
+as JSON, see `common.write_results()`.
+
+ex.
+    $ python3 -m bench.load --mix PGET=60,PSET=20,CLIST=20 --workers 1,5,10
+"""
+
+import random
+import logging
+import argparse
+import threading
+from time import perf_counter, sleep
+
+from embed import config
+from embed.gpio import actions
+from . import common
+
+PINS = [gpio.num for gpio in config.GPIOConfig.PINS.values() if gpio.num is not None]
+CHNLS = sorted({
+    gpio.num for gpio in config.GPIOConfig.CHNL_NUMBERS.values() if gpio.num is not None
+})
+
+# actions the benchmark can send, and how to make their parameters
+ACTIONS = {
+    actions.Types.GET_PIN   : lambda rng, max_age: {"pin" : rng.choice(PINS)},
+    actions.Types.SET_PIN   : lambda rng, max_age: {"pin" : rng.choice(PINS), "val" : rng.randint(0, 1)},
+    actions.Types.LIST_PINS : lambda rng, max_age: {},
+    actions.Types.GET_CHNL  : lambda rng, max_age: _max_age({"channel" : rng.choice(CHNLS)}, max_age),
+    actions.Types.LIST_CNLS : lambda rng, max_age: _max_age({}, max_age),
+    actions.Types.MULTI_GET : lambda rng, max_age: _max_age({"pins" : PINS, "channels" : CHNLS}, max_age),
+}
+
+def _max_age(params, max_age):
+    if max_age is not None:
+        params["max_age"] = max_age
+    return params
+
+def parse_mix(mix):
+    """
+    Parses an action mix, e.g. 'PGET=60,PSET=20,CLIST=20'.
+
+    @raises     ValueError  if an action is unknown or a weight invalid
+
+    @param      str     mix     comma-separated action=weight pairs
+    @return     dict    {action : weight}
+    """
+    weights = {}
+    for pair in mix.split(','):
+        act_type, _, weight = pair.strip().partition('=')
+        act_type = act_type.upper()
+        if act_type not in ACTIONS:
+            raise ValueError("unknown action `{}`, expected one of {}".format(
+                act_type, ', '.join(sorted(ACTIONS))))
+        weights[act_type] = float(weight) if weight else 1.0
+        if weights[act_type] < 0:
+            raise ValueError("negative weight for `{}`".format(act_type))
+    if not sum(weights.values()):
+        raise ValueError("the mix is empty")
+    return weights
+
+def _drive(address, clients, mix, codecs, max_age, warmup, duration, seed, results):
+    """
+    Drives the server from `clients` threads of one process, and puts their
+    measurements on `results`. The target of the load processes.
+    """
+    from embed import utils
+    from embed.gpio.client import Client
+    utils.configure_logging('bench/load')
+    # the client logs every request at INFO
+    logging.disable(logging.INFO)
+
+    act_types, weights = list(mix.keys()), list(mix.values())
+    latencies = [{act_type : [] for act_type in act_types} for _ in range(clients)]
+    errors = [{act_type : 0 for act_type in act_types} for _ in range(clients)]
+    refused = []
+    window = {}
+
+    def start_clock():
+        window['start'] = perf_counter() + warmup
+        window['end'] = window['start'] + duration
+
+    # the clock starts once every client is connected
+    barrier = threading.Barrier(clients + 1, action=start_clock)
+
+    def client(i):
+        rng = random.Random(seed * 1000 + i)
+        gpio = Client(
+            addr='localhost', port=address['port'], path=address['path'],
+            codecs=codecs, pool_size=1
+        )
+        try:
+            try:
+                gpio.send(actions.Types.LIST_PINS)     # connect before the clock starts
+            except OSError as err:
+                logging.error("Client %d could not connect: %s", i, err)
+                refused.append(i)
+                barrier.wait()
+                return
+            barrier.wait()
+            while True:
+                act_type = rng.choices(act_types, weights)[0]
+                params = ACTIONS[act_type](rng, max_age)
+                start = perf_counter()
+                if start >= window['end']:
+                    break
+                try:
+                    ok = gpio.send(act_type, params).get('ok')
+                except OSError:
+                    ok = False
+                end = perf_counter()
+                if start >= window['start']:
+                    if ok:
+                        latencies[i][act_type].append(end - start)
+                    else:
+                        errors[i][act_type] += 1
+        finally:
+            gpio.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    results.put((
+        {act_type : [val for lat in latencies for val in lat[act_type]] for act_type in act_types},
+        {act_type : sum(err[act_type] for err in errors) for act_type in act_types},
+        len(refused)
+    ))
+
+def run(engine, workers, args, mix):
+    """
+    Benchmarks one server configuration.
+
+    @param      str         engine      the server engine
+    @param      int         workers     the size of its worker pool
+    @param      Namespace   args        the command line arguments
+    @param      dict        mix         {action : weight}
+    @return     dict        the run's results
+    """
+    with common.stub_server(engine, workers, unix=args.transport == 'unix', sync=args.sync) as address:
+        results = common.MP.Queue()
+        per_proc = [args.clients // args.processes + (i < args.clients % args.processes)
+                    for i in range(args.processes)]
+        procs = [
+            common.MP.Process(target=_drive, args=(
+                address, num, mix, args.codecs, args.max_age, args.warmup, args.duration,
+                args.seed + i, results
+            ), daemon=True)
+            for i, num in enumerate(per_proc) if num
+        ]
+        for proc in procs:
+            proc.start()
+        measured = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+    per_action, total = {}, []
+    for act_type in mix:
+        samples = [val for lat, _, _ in measured for val in lat[act_type]]
+        total.extend(samples)
+        per_action[act_type] = common.summarize(samples, args.duration)
+        per_action[act_type]["errors"] = sum(err[act_type] for _, err, _ in measured)
+
+    summary = common.summarize(total, args.duration)
+    summary["errors"] = sum(action["errors"] for action in per_action.values())
+    # clients turned away, e.g. past `NetworkConfig.MAX_CONNECTIONS`
+    summary["refused"] = sum(num for _, _, num in measured)
+    if summary["refused"]:
+        print("{} of {} clients could not connect".format(summary["refused"], args.clients))
+    return {
+        "engine" : engine,
+        "workers" : workers,
+        "clients" : args.clients,
+        "total" : summary,
+        "actions" : per_action
+    }
+
+def report(runs):
+    """Prints the results of every run as a table."""
+    rows = []
+    for result in runs:
+        for act_type, summary in list(result["actions"].items()) + [("all", result["total"])]:
+            rows.append([
+                result["engine"], result["workers"], result["clients"], act_type,
+                summary["count"], summary.get("per_s"), summary["p50_ms"],
+                summary["p95_ms"], summary["p99_ms"], summary["max_ms"], summary["errors"]
+            ])
+    common.print_table(
+        ["engine", "workers", "clients", "action", "count", "per_s",
+         "p50_ms", "p95_ms", "p99_ms", "max_ms", "errors"],
+        rows
+    )
+
+def main():
+    """Main boilerplate."""
+    parser = argparse.ArgumentParser(description="Load-generation benchmark of the GPIO server.")
+    parser.add_argument('--engine', default='thread',
+                        help="comma-separated server engines, 'thread' and/or 'asyncio'")
+    parser.add_argument('--workers', default=str(config.NetworkConfig.MAX_THREADS),
+                        help="comma-separated worker pool sizes to compare")
+    parser.add_argument('--mix', default='PGET=50,PSET=20,CGET=20,CLIST=10',
+                        help="actions to send and their weights, e.g. PGET=60,PSET=40")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--processes', type=int, default=2,
+                        help="processes the clients are spread over")
+    parser.add_argument('--duration', type=float, default=10, help="seconds measured")
+    parser.add_argument('--warmup', type=float, default=1, help="seconds before measuring")
+    parser.add_argument('--transport', choices=['unix', 'tcp'], default='unix')
+    parser.add_argument('--codecs', default=','.join(config.NetworkConfig.CODECS),
+                        help="encodings the clients offer, e.g. json")
+    parser.add_argument('--max-age', type=float, default=None,
+                        help="max_age of channel reads, 0 to read the hardware every time")
+    parser.add_argument('--sync', action='store_true',
+                        help="sync the journal on every pin change, rather than in groups")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="the JSON results file")
+    args = parser.parse_args()
+
+    engines = [engine.strip() for engine in args.engine.split(',')]
+    if not set(engines) <= {'thread', 'asyncio'}:
+        parser.error("--engine must be 'thread' and/or 'asyncio'")
+    try:
+        mix = parse_mix(args.mix)
+        workers = [int(num) for num in args.workers.split(',')]
+    except ValueError as err:
+        parser.error(str(err))
+    args.codecs = [name.strip() for name in args.codecs.split(',')]
+    args.processes = max(1, min(args.processes, args.clients))
+
+    runs = []
+    for engine in engines:
+        for num in workers:
+            print("{} engine, {} workers, {} clients, {}s...".format(
+                engine, num, args.clients, args.duration))
+            runs.append(run(engine, num, args, mix))
+            sleep(0.5)
+
+    report(runs)
+    params = dict(vars(args), mix=mix, engine=engines, workers=workers)
+    print("results written to", common.write_results('load', params, runs, args.out))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        exit()
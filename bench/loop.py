@@ -0,0 +1,260 @@
+"""
+@name   Loop
+@desc   End-to-end benchmark of the control loop, with generated sensors.
+
+Generates a layout of N sensors (ADC channels) and M instruments (pins),
+starts a stub GPIO server with it, and runs the control loop of `run.py`
+(`embed.control.loop`) against it for a fixed number of cycles, back to back.
+Reports the time each cycle takes, broken down into reading the sensors,
+predicting the outputs and dispatching them to the instruments (until every
+dispatched instrument is switched on at the server), for every
+combination of `--sensors` and `--instruments`, to size how many zones one Pi
+can handle.
+
+ex.
+    $ python3 -m bench.loop --sensors 4,16,64 --instruments 2,8,32 --cycles 500
+"""
+
+import io
+import queue
+import logging
+import argparse
+from time import perf_counter, sleep
+from collections import OrderedDict
+from contextlib import redirect_stdout
+
+from embed import config, utils
+from embed.config import GPIO
+from embed.control import loop, System, NaiveSystem
+from . import common
+
+# the binary codec, and the shared-memory state, number GPIOs with one byte
+MAX_GPIOS = 256
+
+# the outputs `NaiveSystem` predicts, given to the first instruments
+NAIVE_OUTPUTS = ['fan/enable', 'heat/enable']
+
+def generate_config(num_sensors, num_instruments):
+    """
+    Generates a GPIO layout.
+
+    @param      int     num_sensors         the number of sensors, on channels
+    0 to N-1
+    @param      int     num_instruments     the number of instruments, on pins
+    0 to M-1
+    @return     tuple   ({name : GPIO} of the channels, {name : GPIO} of the
+    pins, {sensor : instrument} mapping each sensor to the instrument it
+    controls)
+    """
+    chnls = OrderedDict(
+        ('sensor/{}'.format(i), GPIO(type='channel', num=i)) for i in range(num_sensors)
+    )
+    names = NAIVE_OUTPUTS + ['instrument/{}'.format(j) for j in range(len(NAIVE_OUTPUTS), num_instruments)]
+    pins = OrderedDict(
+        (name, GPIO(type='pin', num=j)) for j, name in enumerate(names[:num_instruments])
+    )
+    io_map = {sensor : names[i % num_instruments] for i, sensor in enumerate(chnls)} \
+        if num_instruments else {}
+    return chnls, pins, io_map
+
+class ThresholdSystem(System):
+    """
+    Turns on every instrument whose sensors read above a threshold, on
+    average. Its cost grows with the number of sensors and instruments, like a
+    real controller's would.
+    """
+
+    def __init__(self, io_map, threshold=0.5, on_time=0.01):
+        """
+        @param      dict    io_map      {sensor : instrument}
+        @param      float   threshold   the average reading turning it on
+        @param      float   on_time     how long to turn it on, in seconds
+        """
+        super().__init__()
+        self.io_map = io_map
+        self.threshold = threshold
+        self.on_time = on_time
+
+    def predict(self, inputs):
+        readings = {}
+        for sensor, val in inputs.items():
+            if val is not None and sensor in self.io_map:
+                readings.setdefault(self.io_map[sensor], []).append(val)
+        return {
+            instrument : self.on_time
+            for instrument, vals in readings.items() if sum(vals) / len(vals) > self.threshold
+        }
+
+def time_turn_on(instruments, switched):
+    """
+    Makes every instrument put when its request to be switched on started and
+    was answered on `switched`: the instruments run in threads of their own,
+    so returning from `loop.dispatch_outputs()` does not mean they are on.
+
+    @param      dict    instruments     {name : InstrumentController}
+    @param      Queue   switched        gets a (start, end) pair of
+    `perf_counter()` times per switch
+    @return     None
+    """
+    for controller in instruments.values():
+        def turn_on(turn_on=controller.gpio.turn_on):
+            start = perf_counter()
+            res = turn_on()
+            switched.put((start, perf_counter()))
+            return res
+        controller.gpio.turn_on = turn_on
+
+class QuietNaiveSystem(NaiveSystem):
+    """`NaiveSystem`, with what it prints discarded, and outputs held for `on_time`."""
+
+    def __init__(self, io_map, on_time=0.01):
+        super().__init__(io_map=io_map)
+        self.on_time = on_time
+
+    def predict(self, inputs):
+        with redirect_stdout(io.StringIO()):
+            outputs = super().predict(inputs)
+        return {name : self.on_time for name in outputs}
+
+def run(num_sensors, num_instruments, args):
+    """
+    Benchmarks the loop with one layout.
+
+    @param      int         num_sensors         the number of sensors
+    @param      int         num_instruments     the number of instruments
+    @param      Namespace   args        the command line arguments
+    @return     dict        the run's results
+    """
+    from embed.gpio.client import Client
+
+    chnls, pins, io_map = generate_config(num_sensors, num_instruments)
+    gpio = {"PINS" : pins, "PIN_NUMBERS" : pins, "CHNL_NUMBERS" : chnls}
+
+    with common.stub_server(args.engine, args.workers, gpio=gpio) as address:
+        client = Client(path=address['path'], codecs=args.codecs)
+        sensors = loop.build_sensors(chnls, client=client)
+        instruments = loop.build_instruments(pins, client=client)
+        switched = queue.Queue()
+        time_turn_on(instruments, switched)
+        if args.system == 'naive':
+            controller = QuietNaiveSystem(io_map, on_time=args.on_time)
+        else:
+            controller = ThresholdSystem(io_map, threshold=args.threshold, on_time=args.on_time)
+
+        phases = {"read" : [], "predict" : [], "dispatch" : [], "switch" : [], "cycle" : []}
+        workers = []
+        try:
+            for cycle in range(args.warmup + args.cycles):
+                # an instrument holds its lock while it stays on, so switching
+                # it again would wait out the last cycle's on-time: let those
+                # end first, untimed, so the dispatch only times the requests
+                for worker in workers:
+                    worker.join()
+                start = perf_counter()
+                inputs = loop.read_inputs(sensors, max_age=args.max_age)
+                read = perf_counter()
+                outputs = loop.predict_outputs(controller, inputs)
+                predicted = perf_counter()
+                dispatched = loop.dispatch_outputs(instruments, outputs)
+                # the dispatch is done once every instrument is switched on
+                switches = [switched.get() for _ in dispatched]
+                end = max([perf_counter()] + [switch_end for _, switch_end in switches])
+                workers = dispatched
+
+                if cycle >= args.warmup:
+                    phases["read"].append(read - start)
+                    phases["predict"].append(predicted - read)
+                    phases["dispatch"].append(end - predicted)
+                    if switches:
+                        # the slowest of the requests switching them on
+                        phases["switch"].append(max(e - s for s, e in switches))
+                    phases["cycle"].append(end - start)
+                if args.interval:
+                    sleep(args.interval)
+
+            # let the instruments finish before the server goes away
+            for worker in workers:
+                worker.join()
+        finally:
+            client.close()
+
+    elapsed = sum(phases["cycle"])
+    return {
+        "sensors" : num_sensors,
+        "instruments" : num_instruments,
+        "engine" : args.engine,
+        "workers" : args.workers,
+        "cycles" : args.cycles,
+        "cycles_per_s" : round(len(phases["cycle"]) / elapsed, 2) if elapsed else None,
+        "phases" : {name : common.summarize(samples) for name, samples in phases.items()}
+    }
+
+def report(runs):
+    """Prints the results of every run as a table."""
+    rows = []
+    for result in runs:
+        for name, summary in result["phases"].items():
+            rows.append([
+                result["sensors"], result["instruments"], name, summary["mean_ms"],
+                summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], summary["max_ms"],
+                result["cycles_per_s"] if name == "cycle" else None
+            ])
+    common.print_table(
+        ["sensors", "instruments", "phase", "mean_ms", "p50_ms", "p95_ms", "p99_ms",
+         "max_ms", "cycles_per_s"],
+        rows
+    )
+
+def main():
+    """Main boilerplate."""
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the control loop.")
+    parser.add_argument('--sensors', default='8',
+                        help="comma-separated numbers of sensors to compare")
+    parser.add_argument('--instruments', default='8',
+                        help="comma-separated numbers of instruments to compare")
+    parser.add_argument('--cycles', type=int, default=200, help="cycles measured")
+    parser.add_argument('--warmup', type=int, default=10, help="cycles before measuring")
+    parser.add_argument('--interval', type=float, default=0,
+                        help="seconds to sleep between cycles, 0 to run them back to back")
+    parser.add_argument('--system', choices=['threshold', 'naive'], default='threshold',
+                        help="the controller: instruments driven by their sensors, or run.py's")
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="the average reading turning an instrument on")
+    parser.add_argument('--on-time', type=float, default=0.01,
+                        help="seconds each dispatched instrument stays on")
+    parser.add_argument('--max-age', type=float, default=None,
+                        help="max_age of sensor reads, 0 to read the hardware every cycle")
+    parser.add_argument('--engine', choices=['thread', 'asyncio'], default='thread')
+    parser.add_argument('--workers', type=int, default=config.NetworkConfig.MAX_THREADS)
+    parser.add_argument('--codecs', default=','.join(config.NetworkConfig.CODECS),
+                        help="encodings the client offers")
+    parser.add_argument('--out', default=None, help="the JSON results file")
+    args = parser.parse_args()
+
+    try:
+        layouts = [(int(n), int(m)) for n in args.sensors.split(',') for m in args.instruments.split(',')]
+    except ValueError as err:
+        parser.error(str(err))
+    if any(not 0 <= num <= MAX_GPIOS for layout in layouts for num in layout):
+        parser.error("at most {} sensors and {} instruments".format(MAX_GPIOS, MAX_GPIOS))
+    args.codecs = [name.strip() for name in args.codecs.split(',')]
+
+    utils.configure_logging('bench/loop')
+    # the client logs every request at INFO
+    logging.disable(logging.INFO)
+
+    runs = []
+    for num_sensors, num_instruments in layouts:
+        print("{} sensors, {} instruments, {} cycles...".format(
+            num_sensors, num_instruments, args.cycles))
+        runs.append(run(num_sensors, num_instruments, args))
+
+    report(runs)
+    params = dict(vars(args), layouts=layouts)
+    print("results written to", common.write_results('loop', params, runs, args.out))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        exit()
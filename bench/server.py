@@ -0,0 +1,61 @@
+"""
+@name   Server
+@desc   Runs a stub GPIO server for the benchmarks, see `common.stub_server()`.
+
+Started as an interpreter of its own, `python3 -m bench.server <spec>`, so the
+configuration in the JSON spec, including a generated pin and channel layout,
+is in place before the GPIO server module reads it.
+"""
+
+import sys
+import json
+import logging
+from collections import OrderedDict
+
+def configure(spec):
+    """
+    Applies the spec to the configuration.
+
+    @param      dict    spec        {"sync": bool, "gpio": {attr: [[name,
+    type, num], ...]}}
+    @return     None
+    """
+    from embed import config
+
+    # never the Pi's pins or ADC, which the load would toggle and read
+    config.GPIOConfig.BACKEND = 'stub'
+    # nothing but the server itself: no shared memory, metrics or traces
+    config.GPIOConfig.SHM_PATH = None
+    config.GPIOConfig.METRICS_FILE = None
+    config.GPIOConfig.TRACE_FILE = None
+    config.GPIOConfig.JOURNAL_SYNC = spec['sync']
+
+    for attr, gpios in spec['gpio'].items():
+        setattr(config.GPIOConfig, attr, OrderedDict(
+            (name, config.GPIO(type=kind, num=num)) for name, kind, num in gpios
+        ))
+
+def main():
+    """Main boilerplate."""
+    spec = json.loads(sys.argv[1])
+    configure(spec)
+
+    from embed import utils
+    from embed.gpio import Server, AsyncServer
+    utils.configure_logging('GPIO/server')
+    if not spec['log']:
+        # the server logs every request at INFO
+        logging.disable(logging.INFO)
+
+    cls = AsyncServer if spec['engine'] == 'asyncio' else Server
+    server = cls.from_file(spec['fname'], num_workers=spec['workers'], path=spec['path'])
+    try:
+        server.listen(port=spec['port'])
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,153 @@
+"""
+@name   Startup
+@desc   Startup-time benchmark: importing the client, and starting the server.
+
+Every probe runs `--runs` times, each in a fresh interpreter, and measures:
+
+- `client`: importing `embed.gpio` for its `Client`, and making one
+- `control`: importing `embed.control`, which makes its own clients
+- `server`: importing the server, opening the hardware and constructing a
+  `Server` (against the stub backend off the Pi), with the hardware part on
+  its own, as the server measures it
+
+and whether the probe loaded the server module or opened any hardware, which
+the client and control probes must not. Results are written as JSON like the
+other benchmarks', see `common.write_results()`.
+
+ex.
+    $ python3 -m bench.startup --runs 20
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+
+from . import common
+
+PROBES = ['client', 'control', 'server']
+
+def probe(name):
+    """
+    Runs one probe in this interpreter, which must be fresh.
+
+    @param      str     name        one of `PROBES`
+    @return     dict    {phase : seconds, ..., "server_loaded": bool,
+    "hardware_opened": bool}
+    """
+    times = {}
+    start = perf_counter()
+    if name == 'client':
+        from embed.gpio import Client
+        times["import"] = perf_counter() - start
+        Client(path='')
+    elif name == 'control':
+        import embed.control
+        times["import"] = perf_counter() - start
+    elif name == 'server':
+        from . import server as bench_server
+        bench_server.configure({"sync" : False, "gpio" : {}})
+
+        with tempfile.TemporaryDirectory(prefix='herbert-bench-') as tmp:
+            from embed.gpio import Server
+            from embed.gpio import server
+            times["import"] = perf_counter() - start
+            gpio = Server.from_file(
+                os.path.join(tmp, 'gpio_states.json'), path=os.path.join(tmp, 'gpio.sock')
+            )
+            times["total"] = perf_counter() - start
+            times["hardware"] = server.METRICS.snapshot()['gpio_startup_seconds']['phase=hardware']
+            gpio.close()
+    if "total" not in times:
+        times["total"] = perf_counter() - start
+
+    server = sys.modules.get('embed.gpio.server')
+    times["server_loaded"] = server is not None
+    times["hardware_opened"] = server is not None and server.SAMPLER is not None
+    return times
+
+def run(name, args):
+    """
+    Benchmarks one probe.
+
+    @param      str         name        one of `PROBES`
+    @param      Namespace   args        the command line arguments
+    @return     dict        the run's results
+    """
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, '-m', 'bench.startup', '--probe', name],
+            cwd=common.ROOT, check=True, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+
+    phases = [phase for phase in samples[0] if phase not in ('server_loaded', 'hardware_opened')]
+    return {
+        "probe" : name,
+        "runs" : args.runs,
+        "server_loaded" : any(sample["server_loaded"] for sample in samples),
+        "hardware_opened" : any(sample["hardware_opened"] for sample in samples),
+        "phases" : {
+            phase : common.summarize([sample[phase] for sample in samples])
+            for phase in phases
+        }
+    }
+
+def report(runs):
+    """Prints the results of every run as a table."""
+    rows = []
+    for result in runs:
+        for phase, summary in result["phases"].items():
+            rows.append([
+                result["probe"], phase, summary["mean_ms"], summary["p50_ms"],
+                summary["p95_ms"], summary["max_ms"], result["server_loaded"],
+                result["hardware_opened"]
+            ])
+    common.print_table(
+        ["probe", "phase", "mean_ms", "p50_ms", "p95_ms", "max_ms", "server_loaded",
+         "hardware_opened"],
+        rows
+    )
+
+def main():
+    """Main boilerplate."""
+    parser = argparse.ArgumentParser(description="Startup-time benchmark.")
+    parser.add_argument('--probes', default=','.join(PROBES),
+                        help="comma-separated probes, of {}".format(', '.join(PROBES)))
+    parser.add_argument('--runs', type=int, default=10, help="fresh interpreters per probe")
+    parser.add_argument('--out', default=None, help="the JSON results file")
+    parser.add_argument('--probe', choices=PROBES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        # in a fresh interpreter, started by `run()`
+        print(json.dumps(probe(args.probe)))
+        return
+
+    probes = [name.strip() for name in args.probes.split(',')]
+    if not set(probes) <= set(PROBES):
+        parser.error("--probes must be of {}".format(', '.join(PROBES)))
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    runs = []
+    for name in probes:
+        print("{}, {} runs...".format(name, args.runs))
+        runs.append(run(name, args))
+
+    report(runs)
+    for result in runs:
+        if result["probe"] != 'server' and result["hardware_opened"]:
+            print("warning: the `{}` probe opened the hardware".format(result["probe"]))
+    print("results written to", common.write_results('startup', vars(args), runs, args.out))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        exit()
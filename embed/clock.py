@@ -0,0 +1,217 @@
+"""
+@name   clock.py
+@desc   Clocks the control loop and the simulated greenhouse run on.
+
+On the Pi everything runs on real time. With the simulator backend (see
+`embed/gpio/sim.py`) it runs on a virtual clock going `SimConfig.SPEED` times
+faster than real time, so days of operation replay in minutes: waits are
+shortened by that factor, and the simulation advances by it.
+
+`CLOCK` is the clock of this process, chosen from the configuration. The GPIO
+server's clock is the simulation's, and clients follow it (see `follow()` and
+`Client.clock()`), so they agree on the time with it rather than each starting
+virtual time when it starts.
+"""
+
+import threading
+import time as _time
+from time import monotonic
+
+from embed import config
+
+DAY = 24 * 60 * 60
+
+class Clock(object):
+    """
+    Real time.
+    """
+
+    speed = 1
+
+    def time(self):
+        """
+        @return     float   the current time, in seconds since the epoch
+        """
+        return _time.time()
+
+    def sleep(self, secs):
+        """
+        Waits for `secs` seconds of this clock's time.
+
+        @param      float   secs        the seconds to wait
+        @return     None
+        """
+        _time.sleep(secs)
+
+    def at(self, stamp):
+        """
+        @param      float   stamp       a `monotonic()` time, in the past
+        @return     float   this clock's time then
+        """
+        return self.time() - (monotonic() - stamp) * self.speed
+
+    def params(self):
+        """
+        @return     dict    {"speed", "start", "origin"}, for another process's
+        clock to `follow()`; None for real time
+        """
+        return {"speed" : self.speed, "start" : None, "origin" : None}
+
+    def follow(self, params):
+        """
+        Makes this clock tell the same time as another's. Real time is the same
+        everywhere already.
+
+        @param      dict    params      the other clock's `params()`
+        @return     None
+        """
+        pass
+
+class ScaledClock(Clock):
+    """
+    Virtual time, going `speed` times faster than real time.
+
+    @attr   float   speed       virtual seconds per real second
+    @attr   float   start       the virtual time at `origin`
+    @attr   float   origin      the real time virtual time started at
+    """
+
+    def __init__(self, speed=1, start=None, origin=None):
+        """
+        @param      float   speed       virtual seconds per real second
+        @param      float   start       the virtual time to start at, in
+        seconds since the epoch, defaults to now
+        @param      float   origin      the real time the virtual time is
+        `start` at, defaults to now; processes sharing a simulation should
+        share it, or `follow()` the GPIO server's clock, to agree on the time
+        """
+        assert speed > 0
+
+        self.speed = speed
+        self.origin = _time.time() if origin is None else origin
+        self.start = self.origin if start is None else start
+
+    def time(self):
+        return self.start + (_time.time() - self.origin) * self.speed
+
+    def sleep(self, secs):
+        _time.sleep(secs / self.speed)
+
+    def params(self):
+        return {"speed" : self.speed, "start" : self.start, "origin" : self.origin}
+
+    def follow(self, params):
+        if params.get("origin") is None:
+            # the other clock is real time
+            self.speed, self.origin = 1, _time.time()
+            self.start = self.origin
+            return
+        self.speed = params["speed"]
+        self.start = params["start"]
+        self.origin = params["origin"]
+
+class ManualClock(Clock):
+    """
+    Virtual time that only moves when told to, for deterministic replays in a
+    single thread: `sleep()` advances the clock instead of waiting.
+    """
+
+    def __init__(self, start=0):
+        """
+        @param      float   start       the virtual time to start at
+        """
+        self.now = start
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def advance(self, secs):
+        """
+        Moves the clock forward.
+
+        @param      float   secs        the seconds to move it by
+        @return     float   the new time
+        """
+        assert secs >= 0
+
+        with self.lock:
+            self.now += secs
+            return self.now
+
+    def sleep(self, secs):
+        self.advance(secs)
+
+class Daily(object):
+    """
+    Jobs run once a day at a given time of day, on a clock, e.g.
+
+    >>> jobs = Daily(CLOCK)
+    >>> jobs.at("06:00", turn_lights_on)
+    >>> while True:
+    ...     jobs.run_pending()
+    ...     CLOCK.sleep(5)
+
+    Like `schedule`'s `every().day.at()`, which only knows real time. A job
+    whose time passed since the last `run_pending()` runs once, however many
+    days passed. Times of day are local.
+    """
+
+    def __init__(self, clock):
+        """
+        @param      Clock   clock       the clock to run the jobs on
+        """
+        self.clock = clock
+        self.jobs = []
+        self.last = clock.time()
+
+    def at(self, time_of_day, job):
+        """
+        Adds a job.
+
+        @param      str     time_of_day     'HH:MM' or 'HH:MM:SS'
+        @param      func    job             called without arguments
+        @return     None
+        """
+        parts = [int(part) for part in time_of_day.split(':')]
+        assert 2 <= len(parts) <= 3
+
+        hours, mins, secs = (parts + [0])[:3]
+        self.jobs.append((hours * 3600 + mins * 60 + secs, job))
+
+    def run_pending(self):
+        """
+        Runs the jobs whose time passed since the last call, in order.
+
+        @return     None
+        """
+        last, now = self.last, self.clock.time()
+        self.last = now
+
+        local = _time.localtime(last)
+        midnight = last - (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec + last % 1)
+
+        due = []
+        for offset, job in self.jobs:
+            # the latest time the job was due at, not after now
+            when = midnight + offset + ((now - midnight - offset) // DAY) * DAY
+            if last < when <= now:
+                due.append((when, job))
+
+        for _, job in sorted(due, key=lambda pair: pair[0]):
+            job()
+
+def from_config():
+    """
+    @return     Clock   the clock the configuration asks for: virtual time
+    with the simulator backend, real time otherwise
+    """
+    if config.GPIOConfig.BACKEND == 'sim':
+        return ScaledClock(
+            speed=config.SimConfig.SPEED,
+            start=config.SimConfig.START,
+            origin=config.SimConfig.ORIGIN
+        )
+    return Clock()
+
+CLOCK = from_config()
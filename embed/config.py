@@ -21,9 +21,21 @@ class NetworkConfig(Config):
     
     HOST = 'localhost'
     PORT = 50007
+    SOCKET_PATH = '/tmp/herbert-gpio.sock'  # unix socket for same-host clients, None to disable
     ENCODING = 'utf-8'
+    CODECS = ['bin', 'json']    # wire encodings clients offer, by preference
     
     MAX_THREADS = 5
+    MAX_PENDING = 64            # requests queued or running at once, beyond that the server is busy
+    MAX_CONNECTIONS = 32        # open connections at once, beyond that they are refused
+    ASYNC_MAX_CONNECTIONS = 512 # the same for the asyncio engine, where a connection costs no thread
+    REFUSE_LINGER = 1.0         # seconds a refused connection is drained before closing, so its client reads the busy reply
+    ENGINE = 'thread'           # server engine, 'thread' or 'asyncio'
+    MAX_MSG_SIZE = 1 << 20      # largest framed message accepted, in bytes
+    
+    POOL_SIZE = 4               # connections each client keeps open
+    POOL_TIMEOUT = 10           # seconds to wait for a free pooled connection
+    ASYNC_CONNECTIONS = 2       # connections each async client multiplexes over
     
 GPIO = namedtuple('GPIO', ['type', 'num']) 
 
@@ -53,7 +65,67 @@ class GPIOConfig(Config):
     })
     CHNL_NAMES = {out.num:name for name, out in CHNL_NUMBERS.items() if out is not None}
     
+    BACKEND = 'auto'                # 'gpiozero', 'stub', 'sim', or 'auto' for gpiozero if installed, else stub
+    SPI_PORT = 0                    # the MCP3008's SPI port, see `embed/gpio/drivers.py`
+    SPI_DEVICE = 0                  # and its chip select
+    SPI_SPEED = 1350000             # SPI clock in Hz, the MCP3008's maximum at 3.3V
     FILENAME = 'gpio_states.json'    # filename to load/store state from
+    JOURNAL_SYNC = False            # fsync every journaled pin change, in the request path
+    JOURNAL_COMMIT_INTERVAL = 1.0   # otherwise, seconds after a change to fsync the journal, in the background
+    COMPACT_INTERVAL = 60           # seconds after a change to compact the journal
+    SHM_PATH = '/dev/shm/herbert-gpio'  # shared-memory state for local readers, None to disable
+    METRICS_FILE = '/tmp/herbert-gpio.prom' # Prometheus text-format metrics, None to disable
+    METRICS_INTERVAL = 15           # seconds between metrics file writes
+    TRACE_FILE = '/tmp/herbert-gpio.trace'  # sampled request timelines, None to disable
+    TRACE_RATE = 0.01               # fraction of requests traced
+    TRACE_MAX_SIZE = 10 << 20       # bytes, before the trace file is rotated
+    
+    # channel sampling
+    SAMPLE_RATE = 10                # default samples per second, per channel
+    SAMPLE_RATES = {}               # per channel number overrides, 0 to only read on demand
+    HISTORY_SIZE = 3000             # samples kept per channel, for `CHIST`
+    
+    # subscriptions
+    SUB_INTERVAL = 1.0              # default seconds between updates
+    SUB_MIN_INTERVAL = 0.05         # fastest update rate a client may ask for
+
+class SimConfig(Config):
+    """Greenhouse simulator configuration, see `embed/gpio/sim.py`"""
+    
+    # virtual time, see `embed/clock.py`
+    SPEED = 60                      # virtual seconds per real second
+    START = None                    # virtual time to start at, in seconds since the epoch, None for now
+    ORIGIN = None                   # real time the virtual time is START at, None for when the process starts; clients follow the server's
+    STEP = 1.0                      # virtual seconds per simulation step
+    SEED = 0                        # seeds the sensor noise
+    
+    # what the simulated pins drive and the simulated channels measure, by name prefix
+    OUTPUTS = {
+        "heat/enable"   : "heat",
+        "fan/enable"    : "fan",
+        "pump/enable"   : "pump",
+        "lights/enable" : "lights",
+    }
+    INPUTS = {
+        "temp"          : "temp",
+        "moist"         : "moist",
+        "tank"          : "tank",
+    }
+    
+    # the greenhouse
+    OUTSIDE_TEMP = 15.0             # mean outside temperature, in C
+    OUTSIDE_SWING = 6.0             # outside temperature swing over the day, +/- C, peaking at 15:00
+    TEMP = 20.0                     # starting temperature, in C
+    LEAK_RATE = 1 / 3600            # fraction of the inside/outside difference lost per second
+    FAN_RATE = 1 / 300              # same, with the fan on
+    HEAT_RATE = 10 / 3600           # C per second the heater adds
+    LIGHT_RATE = 1 / 3600           # C per second the lights add
+    MOIST = 0.6                     # starting soil moisture, 0 to 1
+    DRY_RATE = 0.1 / 86400          # fraction of the moisture lost per second at 20C
+    PUMP_RATE = 1 / 1800            # fraction of the missing moisture the pump adds per second
+    TANK = 1.0                      # starting tank level, 0 to 1
+    TANK_FLOW = 1 / 7200            # tank level the pump draws per second
+    NOISE = 0.005                   # standard deviation of the sensor noise, in channel units
 
 class CLI_Config(Config):
     """CLI configuration"""
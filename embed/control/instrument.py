@@ -5,24 +5,32 @@
 
 import logging
 import threading
-from time import sleep
 
+from embed import config
+from embed.clock import CLOCK
 from embed.gpio import Client
 
-CLIENT = Client()
+# same-host consumers skip TCP and use the server's unix socket
+CLIENT = Client(path=config.NetworkConfig.SOCKET_PATH)
 
 class Instrument(object):
     """
     Instrument class
     """
-    def __init__(self, pin=None):
+    def __init__(self, pin=None, client=None, clock=None):
         """
+        @param      int     pin         the pin the device is attached to
+        @param      Client  client      the client to drive it with, defaults
+        to the module's
+        @param      Clock   clock       the clock to time it on, defaults to
+        `embed.clock.CLOCK`
         """
         assert pin is not None
         
         self.run_lock = threading.Semaphore()
         self.pin = pin
-        self.device = CLIENT
+        self.device = client if client else CLIENT
+        self.clock = clock if clock else CLOCK
         
     def turn_on(self):
         """
@@ -42,8 +50,8 @@ class Instrument(object):
     
     def turn_on_for(self, interval=1):
         """
-        Turns on the gpio device, waits for the specified number of seconds,
-        then turns the gpio device off.
+        Turns on the gpio device, waits for the specified number of seconds
+        of its clock, then turns the gpio device off.
         
         @return     None
         """
@@ -52,7 +60,7 @@ class Instrument(object):
         with self.run_lock:
             logging.info("Turning on pin %s for %s seconds", self.pin, interval)
             self.turn_on()
-            sleep(interval)
+            self.clock.sleep(interval)
             self.turn_off()
 
 class InstrumentController(object):
@@ -60,7 +68,7 @@ class InstrumentController(object):
     The
     """
 
-    def __init__(self, pin, interval=1):
+    def __init__(self, pin, interval=1, client=None, clock=None):
         """
         Constructor for the InstrumentController
         """
@@ -68,13 +76,14 @@ class InstrumentController(object):
         
         self.interval = interval
         self.running = False
-        self.gpio = Instrument(pin)
+        self.gpio = Instrument(pin, client=client, clock=clock)
         
     def run(self, interval=None):
         """
         Activates the instrument output for the given time interval in a separate thread
         
         @param      number      interval        The number of seconds to wait
+        @return     Thread      the thread running the instrument
         """
         if interval is None:
             interval = 1
@@ -84,3 +93,4 @@ class InstrumentController(object):
             kwargs={'interval':interval}
         )
         worker.start()
+        return worker
@@ -0,0 +1,77 @@
+"""
+@name   loop.py
+@desc   The steps of one control loop cycle: read, predict, dispatch.
+
+`run.py` runs them every few seconds against the GPIO server, and
+`bench.loop` times each of them.
+"""
+
+from embed.control.sensor import Sensor, SensorGroup
+from embed.control.instrument import InstrumentController
+
+def build_sensors(inputs, client=None):
+    """
+    Instantiates a sensor per configured input.
+    
+    @param      dict        inputs      {name : GPIO}, e.g.
+    `GPIOConfig.CHNL_NUMBERS`
+    @param      Client      client      the client to read with
+    @return     SensorGroup     the sensors, read together in one request
+    """
+    sensors = {}
+    for input_name, gpio in inputs.items():
+        if gpio.type == 'channel':
+            sensors[input_name] = Sensor(channel=gpio.num, client=client)
+        elif gpio.type == 'pin':
+            sensors[input_name] = Sensor(pin=gpio.num, client=client)
+    return SensorGroup(sensors, client=client)
+
+def build_instruments(outputs, client=None, clock=None):
+    """
+    Instantiates an instrument per configured output.
+    
+    @param      dict        outputs     {name : GPIO}, e.g. `GPIOConfig.PINS`
+    @param      Client      client      the client to drive them with
+    @param      Clock       clock       the clock to time them on
+    @return     dict        {name : InstrumentController}
+    """
+    return {
+        name : InstrumentController(pin=gpio.num, client=client, clock=clock)
+        for name, gpio in outputs.items()
+    }
+
+def read_inputs(sensors, max_age=None):
+    """
+    Captures the values of every sensor.
+    
+    @param      SensorGroup     sensors     the sensors
+    @param      float           max_age     the oldest channel sample
+    acceptable, in seconds, or None for any
+    @return     dict    {"input/name" : val}
+    """
+    return sensors.read(max_age=max_age)
+
+def predict_outputs(controller, inputs):
+    """
+    Predicts the outputs for the inputs.
+    
+    @param      System      controller  the system controller
+    @param      dict        inputs      {"input/name" : val}
+    @return     dict        {"instrument/name" : val}
+    """
+    return controller.predict(inputs)
+
+def dispatch_outputs(instruments, outputs):
+    """
+    Runs the instruments named in the outputs, each in a thread of its own.
+    Outputs naming no instrument are ignored.
+    
+    @param      dict        instruments {name : InstrumentController}
+    @param      dict        outputs     {"instrument/name" : val}
+    @return     list        the threads running the instruments
+    """
+    workers = []
+    for inst_name, val in outputs.items():
+        if instruments.get(inst_name, False):
+            workers.append(instruments[inst_name].run(val))
+    return workers
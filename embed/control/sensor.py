@@ -5,26 +5,33 @@
 
 import functools
 
+from embed import config
 from embed.gpio import Client
 
-CLIENT = Client()
+# same-host consumers skip TCP and use the server's unix socket
+CLIENT = Client(path=config.NetworkConfig.SOCKET_PATH)
 
 class Sensor(object):
     """
     Sensor class
     """
-    def __init__(self, channel=None, pin=None):
+    def __init__(self, channel=None, pin=None, client=None):
         """
+        @param      int     channel     the channel to read
+        @param      int     pin         the pin to read, instead
+        @param      Client  client      the client to read with, defaults to
+        the module's
         """
         self.read_fn = None
+        client = client if client else CLIENT
         
         if channel is not None:
             self.chnl = channel
-            self.read_fn = functools.partial(CLIENT.get_channel, channel)
+            self.read_fn = functools.partial(client.get_channel, channel)
         
         if pin is not None:
             self.pin = pin
-            self.read_fn = functools.partial(CLIENT.get_pin, pin)
+            self.read_fn = functools.partial(client.get_pin, pin)
         
         assert self.read_fn is not None
 
@@ -35,3 +42,51 @@ class Sensor(object):
         @return     number      the value from the gpio device
         """
         return self.read_fn()
+
+class SensorGroup(object):
+    """
+    Named sensors, read together in a single request.
+    
+    ex.
+    >>> group = SensorGroup({"temp/front": Sensor(channel=0), "pump": Sensor(pin=5)})
+    >>> group.read()
+    {'temp/front': 0.4512, 'pump': 1}
+    """
+    def __init__(self, sensors, client=None):
+        """
+        @param      dict    sensors     {name : Sensor}
+        @param      Client  client      the client to read with, defaults to
+        the module's
+        """
+        self.client = client if client else CLIENT
+        self.pins = {}
+        self.chnls = {}
+        
+        # read each sensor the way `Sensor.read()` would, the pin if it has one
+        for name, sensor in sensors.items():
+            if getattr(sensor, 'pin', None) is not None:
+                self.pins[name] = sensor.pin
+            else:
+                self.chnls[name] = sensor.chnl
+    
+    def read(self, max_age=None):
+        """
+        Reads every sensor of the group, in one request.
+        
+        @param      float   max_age     the oldest channel sample acceptable,
+        in seconds, or None for any
+        @return     dict    {name : val}, with None values if the read failed
+        """
+        data = self.client.get_many(
+            pins=sorted(set(self.pins.values())),
+            channels=sorted(set(self.chnls.values())),
+            max_age=max_age
+        )
+        if data is None:
+            return {name : None for name in list(self.pins) + list(self.chnls)}
+        
+        values = {name : data['pins'].get(str(pin)) for name, pin in self.pins.items()}
+        values.update(
+            {name : data['channels'].get(str(chnl)) for name, chnl in self.chnls.items()}
+        )
+        return values
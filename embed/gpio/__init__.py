@@ -1,2 +1,17 @@
-from .server import *
 from .client import *
+from .aclient import *
+from .cache import ReadCache
+from .middleware import Middleware
+from .shm import LocalReader
+
+# the servers, imported on first use, so importing the client stays light
+SERVERS = {
+    'Server'        : 'server',
+    'AsyncServer'   : 'aserver',
+}
+
+def __getattr__(name):
+    if name in SERVERS:
+        from importlib import import_module
+        return getattr(import_module('.' + SERVERS[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,348 @@
+"""
+@name   Async GPIO Client
+@desc   asyncio client for interacting with the GPIO through the GPIO server.
+
+`AsyncClient` has awaitable versions of `Client`'s pin and channel methods.
+Concurrent requests are multiplexed over a few persistent connections: each
+request is written as soon as it is made, with an "id", without waiting for
+the replies to earlier ones. The server runs a connection's identified
+requests concurrently and replies as each finishes, echoing its id, so a slow
+channel read does not hold up a quick pin read sent after it. Replies without
+an id (from servers that predate them) are matched to requests first in,
+first out. One event loop can so keep many requests in flight without a
+thread, or a connection, per call.
+"""
+
+import asyncio
+import socket
+import logging
+
+from . import sock, actions, codec
+from .client import _max_age
+from .. import config, utils
+
+class AsyncConnection(object):
+    """
+    A connection to the server with any number of requests in flight.
+
+    @attr   codec.JSONCodec     codec       the codec negotiated over it
+    @attr   dict        pending     {id : future} of the requests sent and not
+    yet answered, oldest first
+    @attr   int         requests    the number of requests made over it
+    """
+
+    # request ids wrap around, fitting the binary codec's
+    IDS = 1 << 32
+
+    def __init__(self, reader, writer, conn_codec):
+        self.reader = reader
+        self.writer = writer
+        self.codec = conn_codec
+        self.pending = {}
+        self.requests = 0
+        self.closed = False
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    async def request(self, action):
+        """
+        Sends an action and waits for the reply.
+
+        @raises     OSError     if the connection fails
+
+        @param      dict    action      the action
+        @return     dict    the response
+        """
+        if self.closed:
+            raise ConnectionError("connection closed")
+
+        # queued and written without yielding in between, so the futures are
+        # in the same order as the requests on the wire, for replies without
+        # an id; replies with one come back in any order
+        _id = self.requests % self.IDS
+        reply = asyncio.get_running_loop().create_future()
+        self.pending[_id] = reply
+        self.requests += 1
+        self.writer.write(sock.pack_var(self.codec.encode_action(dict(action, id=_id))))
+
+        await self.writer.drain()
+        return await reply
+
+    async def receive(self):
+        """
+        Hands each reply to the pending request with its id (or the oldest
+        one, if it has none), until the connection closes, then fails the
+        requests still pending.
+        """
+        err = ConnectionError("connection closed by server")
+        try:
+            while True:
+                header = await self.reader.readexactly(sock.HEADER.size)
+                resp = self.codec.decode_response(
+                    await self.reader.readexactly(sock.unpack_header(header))
+                )
+                _id = resp.pop('id', None) if isinstance(resp, dict) else None
+                if _id is None:
+                    _id = next(iter(self.pending), None)
+
+                reply = self.pending.pop(_id, None)
+                if reply is None:
+                    logging.warning("Dropping a reply to no pending request: %s", resp)
+                elif not reply.done():
+                    reply.set_result(resp)
+        except asyncio.IncompleteReadError:
+            pass
+        except asyncio.CancelledError:
+            err = ConnectionError("connection closed")
+        except (OSError, ValueError) as exc:
+            logging.error("Error receiving from the server: %s", exc)
+            err = ConnectionError(str(exc))
+        finally:
+            self.closed = True
+            self.writer.close()
+            pending, self.pending = self.pending, {}
+            for reply in pending.values():
+                if not reply.done():
+                    reply.set_exception(err)
+
+    async def close(self):
+        """Closes the connection, failing the requests still pending."""
+        self.receiver.cancel()
+        try:
+            await self.receiver
+        except asyncio.CancelledError:
+            pass
+
+class AsyncClient(object):
+    """
+    @name   AsyncClient
+    @desc   asyncio GPIO client class
+
+    Opens up to `connections` (by default `NetworkConfig.ASYNC_CONNECTIONS`)
+    connections to the server as requests need them, and sends each request
+    over the one with the fewest requests in flight. Use `close()` (or an
+    `async with` block) to release them.
+
+    @see    `Client` for the arguments, and what the methods return
+
+    ex.
+    >>> async with AsyncClient(path=config.NetworkConfig.SOCKET_PATH) as gpio:
+    ...     await asyncio.gather(*(gpio.get_channel(n) for n in range(4)))
+    [0.4512, 0.3307, 0.1235, 0.9]
+    """
+
+    host = config.NetworkConfig.HOST
+    port = config.NetworkConfig.PORT
+
+    def __init__(self, addr=None, port=None, path=None, codecs=None, connections=None):
+        self.host = addr if addr else self.host
+        self.port = port if port else self.port
+        self.path = path
+        self.codecs = list(codecs if codecs else config.NetworkConfig.CODECS)
+        self.connections = connections if connections else config.NetworkConfig.ASYNC_CONNECTIONS
+
+        self.conns = []
+        self.opening = None     # the lock serializing connects, made in the loop
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def connect(self):
+        """
+        Opens a new connection to the server and negotiates its codec.
+
+        @raises     OSError     if the connection fails
+
+        @return     AsyncConnection     the connection
+        """
+        if self.path:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.get_extra_info('socket').setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+            )
+
+        try:
+            conn_codec = await self.handshake(reader, writer)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as err:
+            writer.close()
+            raise ConnectionError("handshake failed: {}".format(err))
+        return AsyncConnection(reader, writer, conn_codec)
+
+    async def handshake(self, reader, writer):
+        """
+        Negotiates the codec to use over a new connection.
+
+        @see        `Client.handshake()`
+        """
+        if self.codecs == [codec.JSON.name]:
+            return codec.JSON
+
+        writer.write(sock.pack_var(codec.JSON.encode_action({
+            "type" : actions.Types.HELLO,
+            "params" : {"encodings" : self.codecs}
+        })))
+        await writer.drain()
+        header = await reader.readexactly(sock.HEADER.size)
+        resp = codec.JSON.decode_response(
+            await reader.readexactly(sock.unpack_header(header))
+        )
+
+        if not resp.get('ok'):
+            if resp.get('error', {}).get('busy'):
+                raise ConnectionRefusedError("server busy")
+            # the server predates the handshake
+            return codec.JSON
+        return codec.CODECS.get(resp['data'].get('encoding'), codec.JSON)
+
+    async def connection(self, fresh=False):
+        """
+        Picks the connection to send a request over: the open one with the
+        fewest requests in flight, unless it is busy and another may be opened.
+
+        @param      bool    fresh       open a new connection if allowed, even
+        if an idle one is open
+        @return     AsyncConnection     the connection
+        """
+        if self.opening is None:
+            self.opening = asyncio.Lock()
+
+        async with self.opening:
+            self.conns = [conn for conn in self.conns if not conn.closed]
+            least = min(self.conns, key=lambda conn: len(conn.pending), default=None)
+            if least is not None and (len(self.conns) >= self.connections or
+                                      not (fresh or least.pending)):
+                return least
+
+            conn = await self.connect()
+            self.conns.append(conn)
+            return conn
+
+    async def close(self):
+        """
+        Closes the connections to the server.
+
+        @return     None
+        """
+        conns, self.conns = self.conns, []
+        for conn in conns:
+            await conn.close()
+
+    async def send(self, act_type, params=None):
+        """
+        Sends an action and waits for the response.
+
+        @see    `Client.send()`
+
+        @param      str     act_type    the type of action
+        @param      dict    params      the action parameters
+        @return     dict    the response
+        """
+        msg = {"type" : act_type, "params" : params if params else {}}
+
+        conn = await self.connection()
+        reused = conn.requests > 0
+        try:
+            return await conn.request(msg)
+        except OSError:
+            if not reused or not actions.reads_only(msg):
+                raise
+            # the server may have dropped the connection, retry once on a
+            # fresh one; only reads, as a write may have been applied
+            logging.warning("Connection to the server lost, reconnecting")
+            conn = await self.connection(fresh=True)
+            return await conn.request(msg)
+
+    async def set_pin(self, pin, val):
+        """
+        Set the value of a single pin.
+
+        @see    `Client.set_pin()`
+        """
+        res = await self.send(actions.Types.SET_PIN, {"pin": pin, "val": val})
+
+        if res['ok']:
+            return res['data'].get(str(pin))
+
+    async def get_pin(self, pin):
+        """
+        Get the value of a single pin.
+
+        @see    `Client.get_pin()`
+        """
+        res = await self.send(actions.Types.GET_PIN, {"pin": pin})
+
+        if res['ok']:
+            return res['data'][str(pin)]
+
+    async def get_pins(self):
+        """
+        Get the value of all the pins.
+
+        @see    `Client.get_pins()`
+        """
+        res = await self.send(actions.Types.LIST_PINS)
+
+        if res['ok']:
+            return utils.merge_dicts(*res['data'])
+
+    async def get_channel(self, channel, max_age=None):
+        """
+        Get the value of a single channel.
+
+        @see    `Client.get_channel()`
+        """
+        res = await self.send(actions.Types.GET_CHNL, _max_age({"channel": channel}, max_age))
+
+        if res['ok']:
+            return res['data'][str(channel)]
+
+    async def get_many(self, pins=None, channels=None, max_age=None):
+        """
+        Get the values of several pins and channels in one request.
+
+        @see    `Client.get_many()`
+        """
+        res = await self.send(actions.Types.MULTI_GET, _max_age({
+            "pins": pins if pins else [],
+            "channels": channels if channels else []
+        }, max_age))
+
+        if res['ok']:
+            return res['data']
+
+    async def stats(self):
+        """
+        Get the server's metrics.
+
+        @see    `Client.stats()`
+        """
+        res = await self.send(actions.Types.STATS)
+
+        if res['ok']:
+            return res['data']
+
+    async def clock(self):
+        """
+        Get the server's clock.
+
+        @see    `Client.clock()`
+        """
+        res = await self.send(actions.Types.CLOCK)
+
+        if res['ok']:
+            return res['data']
+
+    async def get_channels(self, max_age=None):
+        """
+        Get the value of all the channels.
+
+        @see    `Client.get_channels()`
+        """
+        res = await self.send(actions.Types.LIST_CNLS, _max_age({}, max_age))
+
+        if res['ok']:
+            return utils.merge_dicts(*res['data'])
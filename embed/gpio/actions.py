@@ -7,4 +7,47 @@ class Types(object):
     
     GET_CHNL = "CGET"
     LIST_CNLS = "CLIST"
+    GET_HIST = "CHIST"
     
+    # reads any pins and channels at once
+    MULTI_GET = "MGET"
+    
+    BATCH = "BATCH"
+    
+    # the server's metrics, see `metrics.py`
+    STATS = "STATS"
+    # the server's clock, see `embed/clock.py`
+    CLOCK = "CLOCK"
+    
+    # connection handshake, see `codec.py`
+    HELLO = "HELLO"
+    # turns the connection into a stream of updates, see `pubsub.py`
+    SUBSCRIBE = "SUB"
+    
+
+# actions that only read, so are safe to send again
+READS = {
+    Types.GET_PIN,
+    Types.LIST_PINS,
+    Types.GET_CHNL,
+    Types.LIST_CNLS,
+    Types.GET_HIST,
+    Types.MULTI_GET,
+    Types.STATS,
+    Types.CLOCK,
+}
+
+def reads_only(action):
+    """
+    Whether an action only reads, so sending it again cannot change the GPIO
+    state twice: a read, or a batch of reads.
+
+    @param      dict    action      {"type", "params"}
+    @return     bool
+    """
+    if action.get('type') == Types.BATCH:
+        steps = action.get('params', {}).get('actions')
+        return isinstance(steps, list) and all(
+            isinstance(step, dict) and reads_only(step) for step in steps
+        )
+    return action.get('type') in READS
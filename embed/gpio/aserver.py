@@ -0,0 +1,267 @@
+"""
+@name   Async GPIO Server
+@desc   Event-loop based alternative to the thread-pool GPIO server.
+
+Connections are served as asyncio streams from a single event loop, so idle or
+slow clients do not hold a thread. Only the actions themselves (which may touch
+the hardware) are run in the server's worker pool, which can therefore stay
+small. The action protocol and `HANDLERS` table are the same as `Server`'s.
+"""
+
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+
+from . import codec, sock, tracing
+from .server import HUB, Server, Session, busy
+from .. import config, utils
+
+async def _discard(reader):
+    """Reads and drops everything until the peer closes its end."""
+    while await reader.read(4096):
+        pass
+
+class AsyncServer(Server):
+    """
+    Serves the GPIO action protocol from an asyncio event loop.
+
+    @see    `Server` for construction and the action semantics
+
+    @method None    handle_async(reader, writer)    Serve messages from the
+    connection until it is closed.
+    @method None    stream_async(reader, writer, session)   Stream
+    subscription updates over the connection.
+    @method None    serve(port)             Coroutine serving connections at
+    (addr, port) forever.
+    @method None    listen(port)            Runs `serve` in a new event loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        @see    `Server.__init__()`
+        """
+        super().__init__(*args, **kwargs)
+
+        # an open connection only costs a socket here, not a thread
+        self.max_connections = config.NetworkConfig.ASYNC_MAX_CONNECTIONS
+
+        # the loop serving, and its event to stop, once `serve()` runs
+        self.loop = None
+        self.stopped = None
+
+    async def handle_async(self, reader, writer):
+        """
+        Serve request/response pairs from the connection until the client
+        closes it.
+
+        @param      asyncio.StreamReader    reader      the connection's read end
+        @param      asyncio.StreamWriter    writer      the connection's write end
+        @return     None
+        """
+        if len(self.socks) >= self.max_connections:
+            logging.warning("Refusing a connection, %d open", len(self.socks))
+            try:
+                writer.write(sock.pack_var(codec.JSON.encode_response(busy())))
+                # drain the client's request before closing, see `Server.refuse()`
+                await writer.drain()
+                if writer.can_write_eof():
+                    writer.write_eof()
+                await asyncio.wait_for(_discard(reader), config.NetworkConfig.REFUSE_LINGER)
+            except (OSError, asyncio.TimeoutError):
+                pass
+            finally:
+                writer.close()
+            return
+
+        _id = utils.make_uuid()
+        session = Session(_id)
+        self.socks[_id] = writer
+        inflight = set()    # replies to actions running concurrently
+
+        try:
+            while True:
+                # receive one full message
+                try:
+                    header = await reader.readexactly(sock.HEADER.size)
+                    length = sock.unpack_header(header)
+                    chunks = await reader.readexactly(length)
+                except asyncio.IncompleteReadError as err:
+                    if err.partial:
+                        logging.error("Connection %s closed mid-message", _id)
+                    break
+                except (OSError, ValueError) as err:
+                    logging.error("Error receiving from connection %s: %s", _id, err)
+                    break
+
+                # the action may block on locks or hardware, keep it off the loop
+                trace = self.begin_trace(chunks)
+                conn_codec = session.codec
+                with trace.span('decode'):
+                    action = self.decode(chunks, session)
+                work = self.submit(action, session, trace)
+
+                if work is None:
+                    resp = busy(action)
+                elif self.concurrent(action):
+                    # reply whenever it is done, and read on meanwhile
+                    reply = asyncio.ensure_future(
+                        self.reply_async(writer, conn_codec, asyncio.wrap_future(work), trace)
+                    )
+                    inflight.add(reply)
+                    reply.add_done_callback(inflight.discard)
+                    continue
+                else:
+                    resp = await asyncio.wrap_future(work)
+
+                logging.info("responded: %s", resp)
+                try:
+                    try:
+                        with trace.span('respond'):
+                            writer.write(sock.pack_var(conn_codec.encode_response(resp)))
+                            await writer.drain()
+                    finally:
+                        trace.finish()
+
+                    if session.subscription is not None:
+                        await self.stream_async(reader, writer, session)
+                        break
+                except OSError as err:
+                    logging.error("Error responding to connection %s: %s", _id, err)
+                    break
+        finally:
+            for reply in inflight:
+                reply.cancel()
+            self.socks.pop(_id, None)
+            writer.close()
+
+    async def reply_async(self, writer, conn_codec, resp, trace=tracing.NULL):
+        """
+        Sends the response of an action run concurrently, once it is done.
+
+        @param      asyncio.StreamWriter    writer      the connection's write end
+        @param      JSONCodec               conn_codec  the codec to encode with
+        @param      Future                  resp        the `execute()` call
+        @param      Trace                   trace       the request's trace
+        @return     None
+        """
+        resp = await resp
+        if writer.is_closing():
+            return
+
+        logging.info("responded: %s", resp)
+        try:
+            with trace.span('respond'):
+                writer.write(sock.pack_var(conn_codec.encode_response(resp)))
+                await writer.drain()
+        except OSError as err:
+            logging.error("Error responding: %s", err)
+        finally:
+            trace.finish()
+
+    async def stream_async(self, reader, writer, session):
+        """
+        Sends the subscription's updates over the connection, at most one every
+        `interval` seconds, until the client closes the connection or sends
+        anything.
+
+        @see        `Server.stream()`
+
+        @raises     OSError     if sending fails
+
+        @param      asyncio.StreamReader    reader      the connection's read end
+        @param      asyncio.StreamWriter    writer      the connection's write end
+        @param      Session                 session     the connection's state
+        @return     None
+        """
+        sub = session.subscription
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            while True:
+                await asyncio.wait([closed], timeout=sub.interval)
+                if closed.done():
+                    break
+
+                work = self.submit_poll(sub)
+                if work is not None:
+                    await asyncio.wrap_future(work)
+                update = sub.take()
+                if update is not None:
+                    writer.write(sock.pack_var(
+                        session.codec.encode_response({"ok" : True, "data" : update})
+                    ))
+                    await writer.drain()
+        finally:
+            closed.cancel()
+            HUB.remove(sub)
+
+    async def serve(self, port=None):
+        """
+        Serves connections at (addr, port), and at the unix socket path if one
+        is configured, until cancelled, or until `stop_listening()` is called
+        and the connections still open are closed.
+
+        @param      int     port        the port to for the server listen on
+        @return     None
+        """
+        port = port if port else config.NetworkConfig.PORT
+        async with AsyncExitStack() as stack:
+            servers = [await stack.enter_async_context(await asyncio.start_server(
+                self.handle_async, self.addr, port,
+                reuse_address=True
+            ))]
+            logging.info("listening at %s:%d (asyncio)", self.addr, port)
+
+            if self.path:
+                self.clear_path()
+                stack.callback(self.clear_path)
+                servers.append(await stack.enter_async_context(
+                    await asyncio.start_unix_server(self.handle_async, path=self.path)
+                ))
+                logging.info("listening at %s (asyncio)", self.path)
+
+            self.listeners = servers
+            self.stopped = asyncio.Event()
+            self.loop = asyncio.get_running_loop()
+            await self.stopped.wait()
+
+        # like `Server`'s connection threads, serve the connections still open
+        # until their clients close them, rather than cancel them mid-request
+        while len(asyncio.all_tasks()) > 1:
+            await asyncio.sleep(0.1)
+
+    async def stop_serving(self):
+        """
+        Closes the listening sockets, and lets `serve()` end.
+
+        @return     None
+        """
+        # let the connections accepted this turn of the loop attach to their
+        # server first, closed servers leak them
+        await asyncio.sleep(0)
+        for server in self.listeners:
+            server.close()
+        self.stopped.set()
+
+    def stop_listening(self):
+        """
+        Closes the listening sockets, from outside the event loop.
+
+        @see        `Server.stop_listening()`
+        @return     None
+        """
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.stop_serving(), self.loop).result()
+        except RuntimeError:
+            # the loop closed meanwhile
+            pass
+
+    def listen(self, port=None):
+        """
+        Continuously listens for new connections to the server at (addr, port).
+
+        @param      int     port        the port to for the server listen on
+        @return     None
+        """
+        asyncio.run(self.serve(port=port))
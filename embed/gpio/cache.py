@@ -0,0 +1,133 @@
+"""
+@name   Cache
+@desc   Opt-in client-side cache of pin and channel reads.
+
+Components of one process often read the same pin or channel within
+milliseconds of each other. A `Client` given a `ReadCache` answers repeated
+reads from it for a short, per-key time to live, so they never leave the
+process.
+
+Pin values are also dropped as soon as they may be stale: when the client sets
+a pin, and when any response reports a pin state version newer than the one
+the cached values were read at (see `doc/ipc.md`), meaning some pin changed
+since. Channels change continuously and are only cached for their TTL.
+"""
+
+import threading
+from time import monotonic
+
+from . import actions
+from .pubsub import PIN
+
+# actions whose responses carry the version of the pin state
+PIN_VERSIONED = {
+    actions.Types.SET_PIN,
+    actions.Types.GET_PIN,
+    actions.Types.LIST_PINS,
+    actions.Types.MULTI_GET,
+}
+
+class ReadCache(object):
+    """
+    Recently read pin and channel values, each kept for its time to live.
+
+    TTLs are looked up by (kind, number), then by kind (`pubsub.PIN` or
+    `pubsub.CHANNEL`), then fall back to `ttl`.
+
+    ex.
+    >>> cache = ReadCache(ttl=0.5, ttls={CHANNEL: 0.1, (PIN, 5): 2})
+    >>> gpio = Client(cache=cache)
+    """
+
+    def __init__(self, ttl=1.0, ttls=None):
+        """
+        @param      float   ttl         the default time to live, in seconds
+        @param      dict    ttls        TTLs by (kind, num) or kind
+        """
+        self.ttl = ttl
+        self.ttls = dict(ttls if ttls else {})
+
+        self.lock = threading.Lock()
+        self.entries = {}       # (kind, num) -> (read at, val)
+        self.version = None     # the newest pin state version seen
+
+    def ttl_of(self, kind, num):
+        """
+        @return     float   the time to live of (kind, num), in seconds
+        """
+        return self.ttls.get((kind, num), self.ttls.get(kind, self.ttl))
+
+    def get(self, kind, num, max_age=None):
+        """
+        Looks up a value.
+
+        @param      str     kind        `PIN` or `CHANNEL`
+        @param      int     num         the pin or channel number
+        @param      float   max_age     the oldest value acceptable, in
+        seconds, on top of the TTL
+        @return     tuple   (True, val) on a hit, (False, None) on a miss
+        """
+        key = (kind, int(num))
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+
+        age = monotonic() - entry[0]
+        if age > self.ttl_of(*key) or (max_age is not None and age > max_age):
+            return False, None
+        return True, entry[1]
+
+    def put(self, kind, num, val, version=None):
+        """
+        Caches a value just read.
+
+        @param      str     kind        `PIN` or `CHANNEL`
+        @param      int     num         the pin or channel number
+        @param      number  val         the value
+        @param      int     version     the pin state version it was read at,
+        if known; pins read at an older version than one already seen are
+        not cached
+        @return     None
+        """
+        key = (kind, int(num))
+        if self.ttl_of(*key) <= 0:
+            return
+        with self.lock:
+            if kind == PIN and version is not None and self.version is not None \
+                    and version < self.version:
+                return
+            self.entries[key] = (monotonic(), val)
+
+    def observe(self, version):
+        """
+        Notes a pin state version reported by the server, dropping every
+        cached pin if it is newer than the last one seen.
+
+        @param      int     version     the version
+        @return     None
+        """
+        with self.lock:
+            if self.version is not None and version <= self.version:
+                return
+            self.version = version
+            for key in [key for key in self.entries if key[0] == PIN]:
+                del self.entries[key]
+
+    def invalidate(self, kind=None, num=None):
+        """
+        Drops cached values: one, every one of a kind, or all of them.
+
+        @param      str     kind        `PIN` or `CHANNEL`, or None for all
+        @param      int     num         the number, or None for every one of
+        the kind
+        @return     None
+        """
+        with self.lock:
+            if kind is None:
+                self.entries.clear()
+            elif num is None:
+                for key in [key for key in self.entries if key[0] == kind]:
+                    del self.entries[key]
+            else:
+                self.entries.pop((kind, int(num)), None)
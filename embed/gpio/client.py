@@ -3,42 +3,277 @@
 @desc   Client for interacting with the GPIO through the GPIO server.
 
 The Client class exposes mutation high-level operations for readability. It
-serializes the sent commands to the server using JSON.
+serializes the sent commands to the server using JSON (or the binary codec,
+when the server supports it), framed with a length header, over a persistent
+connection.
 
 @author Joshua Paul A. Chan (@joshpaulchan)
 """
 
-import json
 # TODO: factor out socket, only rely on sock
 import socket
 import logging
+import threading
 
-from . import sock, actions
+from . import sock, actions, codec, pool
+from .cache import PIN_VERSIONED
+from .pubsub import PIN, CHANNEL
 from .. import config, utils
 
-if config.GPIOConfig.DEBUG:
-    logging.basicConfig(
-        level=config.GPIOConfig.LOG_LEVEL,
-        format='%(asctime)s:%(levelname)s:GPIO/client:%(message)s'
-    )
+def _max_age(params, max_age):
+    """Adds the optional `max_age` param to channel reads."""
+    if max_age is not None:
+        params["max_age"] = max_age
+    return params
+
+class Batch(object):
+    """
+    @name   Batch
+    @desc   Queues client calls and sends them to the server as one action
+    
+    Created with `Client.batch()`. The queued calls are sent when the `with`
+    block exits without error, or on an explicit `flush()`, and run on the
+    server in order, atomically with respect to other requests.
+    
+    ex.
+    >>> with gpio.batch() as batch:
+    ...     batch.set_pin(0, 1)
+    ...     batch.get_channel(2)
+    >>> batch.results
+    [1, 0.1235]
+    """
+    
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+        self.results = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.flush()
+    
+    def queue(self, act_type, params=None, parse=None):
+        """
+        Queues an action.
+        
+        @param      str     act_type    the type of action
+        @param      dict    params      the action parameters
+        @param      func    parse       turns the action's response data into
+        the result to report, defaults to returning it as is
+        @return     Batch   this batch, for chaining
+        """
+        action = {"type": act_type, "params": params if params else {}}
+        self.queued.append((action, parse if parse else (lambda data: data)))
+        return self
+    
+    def flush(self):
+        """
+        Sends every queued action in one request.
+        
+        @return     list    one result per queued action, in order, with None
+        for each action that failed; also kept in `self.results`
+        """
+        queued, self.queued = self.queued, []
+        if not queued:
+            self.results = []
+            return self.results
+        
+        res = self.client.send(actions.Types.BATCH, {
+            "actions": [action for action, _ in queued]
+        })
+        
+        if not res['ok']:
+            self.results = [None for _ in queued]
+            return self.results
+        
+        for (action, _), result in zip(queued, res['data']):
+            self.client.observe(action, result)
+        
+        self.results = [
+            parse(result['data']) if result['ok'] else None
+            for (_, parse), result in zip(queued, res['data'])
+        ]
+        return self.results
+    
+    def set_pin(self, pin, val):
+        """Queues `Client.set_pin()`."""
+        return self.queue(actions.Types.SET_PIN, {"pin": pin, "val": val},
+                          lambda data: data.get(str(pin)))
+    
+    def get_pin(self, pin):
+        """Queues `Client.get_pin()`."""
+        return self.queue(actions.Types.GET_PIN, {"pin": pin},
+                          lambda data: data[str(pin)])
+    
+    def get_pins(self):
+        """Queues `Client.get_pins()`."""
+        return self.queue(actions.Types.LIST_PINS, None,
+                          lambda data: utils.merge_dicts(*data))
+    
+    def get_channel(self, channel, max_age=None):
+        """Queues `Client.get_channel()`."""
+        return self.queue(actions.Types.GET_CHNL, _max_age({"channel": channel}, max_age),
+                          lambda data: data[str(channel)])
+    
+    def get_channels(self, max_age=None):
+        """Queues `Client.get_channels()`."""
+        return self.queue(actions.Types.LIST_CNLS, _max_age({}, max_age),
+                          lambda data: utils.merge_dicts(*data))
 
 class Client(object):
     """
     @name   Client
     @desc   GPIO client class
+    
+    The client keeps a pool of up to `pool_size` (by default
+    `NetworkConfig.POOL_SIZE`) connections to the server open, and each
+    request borrows one for its duration, so any number of threads can share
+    a client and up to `pool_size` of their requests run at once. Closed
+    connections are replaced transparently. Use `close()` (or a `with` block)
+    to release them.
+    
+    Given a `path`, the client connects to the server's unix domain socket
+    instead of over TCP, which is cheaper for clients on the same host.
+    
+    Each new connection offers the server `codecs` (by default
+    `NetworkConfig.CODECS`) and uses the first one the server accepts, falling
+    back to JSON with servers that do not negotiate.
+    
+    Given a `cache` (a `cache.ReadCache`), `get_pin()` and `get_channel()`
+    answer from it while the value read last is fresh enough.
     """
     
     host = config.NetworkConfig.HOST            # The remote host
     port = PORT = config.NetworkConfig.PORT     # The same port as the server
     
-    def __init__(self, addr=None, port=None):
+    def __init__(self, addr=None, port=None, path=None, codecs=None, pool_size=None,
+                 cache=None):
         self.host = addr if addr else self.host
         self.port = port if port else self.port
         self.addrport = (self.host, self.port)
+        self.path = path
+        
+        if self.path:
+            self.family, self.address = socket.AF_UNIX, self.path
+        else:
+            self.family, self.address = socket.AF_INET, self.addrport
                 
         self.encoding = config.NetworkConfig.ENCODING
+        self.codecs = list(codecs if codecs else config.NetworkConfig.CODECS)
         
         self.sock = sock.Socket
+        self.pool = pool.Pool(
+            self.open,
+            size=pool_size if pool_size else config.NetworkConfig.POOL_SIZE,
+            timeout=config.NetworkConfig.POOL_TIMEOUT
+        )
+        # opt-in, see `cache.ReadCache`
+        self.cache = cache
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def connect(self):
+        """
+        Opens a new connection to the server.
+        
+        @return     sock.Socket     the connected socket
+        """
+        sck = self.sock(self.family, socket.SOCK_STREAM)
+        try:
+            if self.family != socket.AF_UNIX:
+                sck.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sck.connect(self.address)
+        except OSError:
+            sck.close()
+            raise
+        return sck
+    
+    def open(self):
+        """
+        Opens a new connection to the server and negotiates its codec.
+        
+        @raises     OSError     if the connection fails
+        
+        @return     pool.Connection     the connection
+        """
+        conn = self.connect()
+        try:
+            return pool.Connection(conn, self.handshake(conn))
+        except BaseException:
+            conn.close()
+            raise
+    
+    def close(self):
+        """
+        Closes the connections to the server. Connections in use are closed
+        when their requests complete.
+        
+        @return     None
+        """
+        self.pool.close()
+    
+    def handshake(self, conn):
+        """
+        Negotiates the codec to use over a new connection.
+        
+        @see        `codec.py`
+        
+        @raises     OSError     if the connection fails
+        
+        @param      sock.Socket     conn        the newly opened connection
+        @return     codec.JSONCodec the codec the server agreed to
+        """
+        if self.codecs == [codec.JSON.name]:
+            return codec.JSON
+        
+        conn.send_var(codec.JSON.encode_action({
+            "type" : actions.Types.HELLO,
+            "params" : {"encodings" : self.codecs}
+        }))
+        data = conn.recv_var()
+        if data is None:
+            raise ConnectionError("connection closed by server")
+        
+        resp = codec.JSON.decode_response(data)
+        if not resp.get('ok'):
+            if resp.get('error', {}).get('busy'):
+                raise ConnectionRefusedError("server busy")
+            # the server predates the handshake
+            return codec.JSON
+        return codec.CODECS.get(resp['data'].get('encoding'), codec.JSON)
+    
+    def _request(self, conn, action):
+        """
+        Sends an action over a checked out connection and waits for the reply,
+        then gives the connection back to the pool, or drops it if the request
+        failed.
+        
+        @raises     OSError     if the connection fails
+        @raises     ValueError  if the reply is not a valid frame
+        
+        @param      pool.Connection     conn    the connection
+        @param      dict                action  the action
+        @return     dict        the response
+        """
+        try:
+            data = conn.request(action)
+        except BaseException:
+            self.pool.discard(conn)
+            raise
+        self.pool.checkin(conn)
+        
+        try:
+            return conn.codec.decode_response(data)
+        except ValueError:
+            logging.error("Error parsing the response: `%s`", data)
+            return {"ok" : False}
     
     def send(self, act_type, params=None):
         """
@@ -46,6 +281,11 @@ class Client(object):
         
         @see    `doc/ipc.md` for more explanation of the send mechanics and the data format
         
+        @raises     TimeoutError    if every pooled connection stays busy for
+        `NetworkConfig.POOL_TIMEOUT` seconds
+        @raises     OSError     if the connection fails; reads are retried
+        once first, see `actions.reads_only()`
+        
         @param      str     act_type    the type of action
         @param      dict    params      the specific
         @return     dict    the response, if any
@@ -54,33 +294,130 @@ class Client(object):
         if params is None:
             params = {}
 
-        msg = json.dumps({"type":act_type, "params":params})
+        msg = {"type":act_type, "params":params}
         
-        with self.sock(socket.AF_INET, socket.SOCK_STREAM) as sck:
-            sck.connect(self.addrport)
-            
-            # send it
-            sck.sendall(bytes(msg, self.encoding))
-            logging.info("sent: %s", msg)
-            
-            # close write end
-            sck.shutdown(socket.SHUT_WR)
-            
-            # log response, if any
-            data = sck.recv(1024)
-            
-            try:
-                data = json.loads(str(data, self.encoding))
-            except ValueError:
-                logging.error("Error parsing the response: `%s`", data)
-                return {"ok" : False}
-            
-            logging.info("received: %s", data)
+        conn = self.pool.checkout()
+        reused = conn.requests > 0
+        try:
+            data = self._request(conn, msg)
+        except (OSError, ValueError):
+            if not reused or not actions.reads_only(msg):
+                raise
+            # the server may have dropped the connection since the health
+            # check, retry once on a fresh one; only reads, as a write may
+            # have been applied before the connection failed
+            logging.warning("Connection to %s lost, reconnecting", self.address)
+            data = self._request(self.pool.checkout(fresh=True), msg)
+        logging.info("sent: %s", msg)
+        logging.info("received: %s", data)
+        
+        if not data:
+            return {"ok" : False}
+        
+        self.observe(msg, data)
+        return data
+    
+    def observe(self, action, resp):
+        """
+        Keeps the read cache, if any, up to date with a response: a newer pin
+        state version drops the cached pins, and a pin set drops its value.
+        
+        @param      dict    action      the action sent
+        @param      dict    resp        its response
+        @return     None
+        """
+        if self.cache is None or not resp.get('ok'):
+            return
+        
+        if resp.get('version') is not None and action['type'] in PIN_VERSIONED:
+            self.cache.observe(resp['version'])
+        if action['type'] == actions.Types.SET_PIN:
+            self.cache.invalidate(PIN, action['params']['pin'])
+    
+    def subscribe(self, pins=None, channels=None, deadband=0, interval=None):
+        """
+        Streams changes to the given pins and channels.
+        
+        The subscription uses a connection of its own, which is closed when
+        the generator is closed or garbage collected. The first update holds
+        the current value of everything subscribed to; after that, an update
+        only holds what changed by more than `deadband`, and none are sent
+        while nothing does.
+        
+        @raises     ValueError  if the server refuses the subscription
+        
+        @param      list        pins        the pin numbers to watch
+        @param      list        channels    the channel numbers to watch
+        @param      float       deadband    the smallest change in a value
+        worth reporting
+        @param      float       interval    the minimum number of seconds
+        between updates, defaults to the server's `GPIOConfig.SUB_INTERVAL`
+        @return     generator   yielding {"pins": {num: val}, "channels":
+        {num: val}} dicts, with the numbers as strings
+        
+        ex.
+        >>> for update in gpio.subscribe(channels=[0, 1], deadband=0.01):
+        ...     print(update)
+        {'pins': {}, 'channels': {'0': 0.4512, '1': 0.3307}}
+        {'pins': {}, 'channels': {'1': 0.3519}}
+        """
+        params = {
+            "pins" : pins if pins else [],
+            "channels" : channels if channels else [],
+            "deadband" : deadband
+        }
+        if interval is not None:
+            params["interval"] = interval
+        
+        with self.connect() as conn:
+            conn_codec = self.handshake(conn)
+            conn.send_var(conn_codec.encode_action({
+                "type" : actions.Types.SUBSCRIBE,
+                "params" : params
+            }))
             
-            if not data:
-                return {"ok" : False}
+            while True:
+                data = conn.recv_var()
+                if data is None:
+                    return
                 
-            return data
+                resp = conn_codec.decode_response(data)
+                if not resp.get('ok'):
+                    raise ValueError(resp.get('error', {}).get('message'))
+                yield resp['data']
+    
+    def watch(self, callback, **kwargs):
+        """
+        Calls `callback` with each update of a subscription, from a background
+        thread. Returning False from the callback ends the subscription.
+        
+        @see        `subscribe()` for the arguments and the updates
+        
+        @param      func        callback    called with each update
+        @return     threading.Thread    the thread running the subscription
+        """
+        def run():
+            updates = self.subscribe(**kwargs)
+            try:
+                for update in updates:
+                    if callback(update) is False:
+                        break
+            finally:
+                updates.close()
+        
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        return worker
+    
+    def batch(self):
+        """
+        Starts a batch of calls to send as a single request.
+        
+        @see        `Batch`
+        
+        @return     Batch   the batch, for use in a `with` block
+        """
+        return Batch(self)
     
     def set_pin(self, pin, val):
         """
@@ -91,16 +428,17 @@ class Client(object):
         
         @param      int     pin     the pin to set the value for
         @param      int     val     the value to set the pin to
-        @return     bool    True if the operation succeeded, False otherwise
+        @return     int     the pin's value after, or None if the request
+        failed
         
         ex.
-        >>> gpio.set(0)
-        {'0': 0}
+        >>> gpio.set_pin(0, 1)
+        1
         """
         res = self.send(actions.Types.SET_PIN, {"pin": pin, "val": val})
         
         if res['ok']:
-            return res['data'].get('pin')
+            return res['data'].get(str(pin))
     
     def get_pin(self, pin):
         """
@@ -110,10 +448,18 @@ class Client(object):
         >>> gpio.get(0)
         {'0': 0}
         """
+        if self.cache is not None:
+            hit, val = self.cache.get(PIN, pin)
+            if hit:
+                return val
+        
         res = self.send(actions.Types.GET_PIN, {"pin": pin})
         
         if res['ok']:
-            return res['data'][str(pin)]
+            val = res['data'][str(pin)]
+            if self.cache is not None:
+                self.cache.put(PIN, pin, val, res.get('version'))
+            return val
     
     def get_pins(self):
         """
@@ -126,30 +472,133 @@ class Client(object):
         res = self.send(actions.Types.LIST_PINS)
         
         if res['ok']:
-            return utils.merge_dicts(*res['data'])
+            pins = utils.merge_dicts(*res['data'])
+            if self.cache is not None:
+                for pin, val in pins.items():
+                    self.cache.put(PIN, pin, val, res.get('version'))
+            return pins
     
-    def get_channel(self, channel):
+    def get_channel(self, channel, max_age=None):
         """
         Get the value of a single pin.
         
+        The server answers from its latest sample of the channel, unless that
+        is older than `max_age` seconds.
+        
         ex.
         >>> gpio.get_channel(0)
         {'0': 0}
         """
-        res = self.send(actions.Types.GET_CHNL, {"channel": channel})
+        if self.cache is not None:
+            hit, val = self.cache.get(CHANNEL, channel, max_age)
+            if hit:
+                return val
+        
+        res = self.send(actions.Types.GET_CHNL, _max_age({"channel": channel}, max_age))
+        
+        if res['ok']:
+            val = res['data'][str(channel)]
+            if self.cache is not None:
+                self.cache.put(CHANNEL, channel, val)
+            return val
+    
+    def get_many(self, pins=None, channels=None, max_age=None):
+        """
+        Get the values of several pins and channels in one request.
+        
+        @see        `get_channel()` for `max_age`
+        
+        @param      list    pins        the pin numbers to read
+        @param      list    channels    the channel numbers to read
+        @return     dict    {"pins": {pin : val}, "channels": {chnl : val}},
+        with the numbers as strings
+        
+        ex.
+        >>> gpio.get_many(pins=[5], channels=[0, 1])
+        {'pins': {'5': 1}, 'channels': {'0': 0.4512, '1': 0.3307}}
+        """
+        res = self.send(actions.Types.MULTI_GET, _max_age({
+            "pins": pins if pins else [],
+            "channels": channels if channels else []
+        }, max_age))
+        
+        if res['ok']:
+            return res['data']
+    
+    def get_history(self, channel, window=None, samples=True):
+        """
+        Get a channel's recent samples, with aggregates over them.
+        
+        @param      int     channel     the channel number
+        @param      float   window      how many seconds back to go, or None
+        for every sample the server keeps
+        @param      bool    samples     whether to include the samples, or
+        only the aggregates
+        @return     dict    {"channel", "count", "min", "max", "mean", "last",
+        "start", "end"} and, if asked for, "samples": [[timestamp, val], ...]
+        
+        ex.
+        >>> gpio.get_history(0, window=60, samples=False)
+        {'channel': 0, 'count': 600, 'min': 0.41, 'max': 0.45, 'mean': 0.43, ...}
+        """
+        res = self.send(actions.Types.GET_HIST, {
+            "channel": channel,
+            "window": window,
+            "samples": samples
+        })
         
         if res['ok']:
-            return res['data'][str(channel)]
+            return res['data']
     
-    def get_channels(self):
+    def stats(self):
+        """
+        Get the server's metrics: request counts and latencies per action, lock
+        waits, hardware and save durations, queued requests and connections.
+        
+        @return     dict    {name : {labels : value}}, with histograms as
+        {"count", "sum", "mean", "max", "p50", "p95", "p99"}, in seconds
+        
+        ex.
+        >>> gpio.stats()['gpio_request_seconds']['action=PGET']['p99']
+        0.00021
+        """
+        res = self.send(actions.Types.STATS)
+        
+        if res['ok']:
+            return res['data']
+    
+    def clock(self):
+        """
+        Get the server's clock, for this process's to follow, so they agree on
+        the time: the virtual time of the simulator backend, real time
+        otherwise. Channel history and shared memory timestamps are on it.
+        
+        @see        `embed.clock.Clock.follow()`
+        @return     dict    {"speed", "start", "origin"}
+        
+        ex.
+        >>> CLOCK.follow(gpio.clock())
+        """
+        res = self.send(actions.Types.CLOCK)
+        
+        if res['ok']:
+            return res['data']
+    
+    def get_channels(self, max_age=None):
         """
         Get the value of all the pins.
         
+        @see        `get_channel()` for `max_age`
+        
         ex.
         >>> gpio.get_channels()
         {'0': 0, '1': 1, ... "6": 1}
         """
-        res = self.send(actions.Types.LIST_CNLS)
+        res = self.send(actions.Types.LIST_CNLS, _max_age({}, max_age))
         
         if res['ok']:
-            return utils.merge_dicts(*res['data'])
+            chnls = utils.merge_dicts(*res['data'])
+            if self.cache is not None:
+                for chnl, val in chnls.items():
+                    self.cache.put(CHANNEL, chnl, val)
+            return chnls
@@ -0,0 +1,245 @@
+"""
+@name   Codecs
+@desc   Wire encodings for actions and responses.
+
+Every connection starts out speaking JSON. A client may then send a `HELLO`
+action listing the encodings it supports, in order of preference; the server
+answers (in JSON) with the first one it also supports, and both ends switch to
+it for the rest of the connection.
+
+The binary encoding packs the pin/channel actions and their responses into
+fixed layouts. Anything that does not fit them (other actions, errors,
+non-numeric values) is sent as JSON behind a one byte escape, so every action
+works over either encoding.
+
+@see    `doc/ipc.md` for the layouts
+"""
+
+import json
+import math
+import struct
+
+from . import actions
+from .. import config
+
+class JSONCodec(object):
+    """
+    Encodes actions and responses as JSON text.
+    """
+
+    name = 'json'
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding if encoding else config.NetworkConfig.ENCODING
+
+    def encode_action(self, action):
+        """
+        @param      dict    action      the action to encode
+        @return     bytes   the encoded action
+        """
+        return bytes(json.dumps(action), self.encoding)
+
+    def decode_action(self, raw):
+        """
+        @raises     ValueError  if `raw` is not a valid encoding
+
+        @param      bytes   raw         the encoded action
+        @return     dict    the action
+        """
+        return json.loads(str(raw, self.encoding))
+
+    encode_response = encode_action
+    decode_response = decode_action
+
+class BinaryCodec(JSONCodec):
+    """
+    Encodes the pin/channel actions and their responses in fixed binary layouts.
+
+    Actions are one opcode byte, the request id if the opcode has its
+    `IDENTIFIED` bit set, and that opcode's parameters; pin and channel numbers
+    are unsigned bytes and values 64-bit floats. Values decode as they would
+    from JSON, except that whole floats come back as ints: a pin set to `1.0`
+    reads `1`. Responses are one tag byte, a count byte, the request id if the tag has its `IDENTIFIED` bit set, the
+    state version if it has its `VERSIONED` bit set, and that many (number,
+    value) pairs, with NaN standing for a missing value. Opcode/tag 0 is
+    followed by JSON instead.
+    """
+
+    name = 'bin'
+
+    ESCAPE = 0
+
+    # opcode -> (action type, parameter names, parameter layout)
+    OPCODES = {
+        1 : (actions.Types.SET_PIN, ('pin', 'val'), struct.Struct('!Bd')),
+        2 : (actions.Types.GET_PIN, ('pin',), struct.Struct('!B')),
+        3 : (actions.Types.LIST_PINS, (), struct.Struct('!')),
+        4 : (actions.Types.GET_CHNL, ('channel',), struct.Struct('!B')),
+        5 : (actions.Types.LIST_CNLS, (), struct.Struct('!')),
+    }
+    TYPES = {act_type : opcode for opcode, (act_type, _, _) in OPCODES.items()}
+
+    # response tags, for data of {num: val} and [{num: val}, ...] respectively
+    VALUES = 1
+    VALUE_LIST = 2
+    # set on the tag when the response carries a version
+    VERSIONED = 0x80
+    # set on the opcode/tag when the action/response carries a request id
+    IDENTIFIED = 0x40
+
+    HEAD = struct.Struct('!BB')
+    ID = struct.Struct('!I')
+    VERSION = struct.Struct('!Q')
+    PAIR = struct.Struct('!Bd')
+
+    def _escape(self, obj):
+        return bytes([self.ESCAPE]) + super().encode_action(obj)
+
+    def encode_action(self, action):
+        opcode = self.TYPES.get(action.get('type'))
+        if opcode is None:
+            return self._escape(action)
+
+        _, names, layout = self.OPCODES[opcode]
+        params = action.get('params', {})
+        _id = action.get('id')
+        if set(params.keys()) != set(names) or not all(
+                _is_value(params[name]) if name == 'val' else _is_num(params[name])
+                for name in names) or not (_id is None or _is_id(_id)):
+            return self._escape(action)
+
+        head = bytes([opcode])
+        if _id is not None:
+            head = bytes([opcode | self.IDENTIFIED]) + self.ID.pack(_id)
+        return head + layout.pack(*(params[name] for name in names))
+
+    def decode_action(self, raw):
+        if not raw:
+            raise ValueError("empty action")
+        if raw[0] == self.ESCAPE:
+            return super().decode_action(raw[1:])
+
+        try:
+            offset, action = 1, {}
+            if raw[0] & self.IDENTIFIED:
+                action["id"] = self.ID.unpack_from(raw, offset)[0]
+                offset += self.ID.size
+            act_type, names, layout = self.OPCODES[raw[0] & ~self.IDENTIFIED]
+            values = layout.unpack(raw[offset:])
+        except (KeyError, struct.error):
+            raise ValueError("malformed binary action: {}".format(raw))
+
+        action["type"] = act_type
+        action["params"] = dict(zip(names, map(_unpack_value, values)))
+        return action
+
+    def encode_response(self, resp):
+        data = resp.get('data')
+        version = resp.get('version')
+        _id = resp.get('id')
+        if set(resp.keys()) - {'version', 'id'} != {'ok', 'data'} or resp['ok'] is not True:
+            return self._escape(resp)
+        if version is not None and not (isinstance(version, int) and 0 <= version < 1 << 64):
+            return self._escape(resp)
+        if _id is not None and not _is_id(_id):
+            return self._escape(resp)
+
+        if isinstance(data, dict):
+            tag, pairs = self.VALUES, list(data.items())
+        elif isinstance(data, list) and all(isinstance(item, dict) and len(item) == 1 for item in data):
+            tag, pairs = self.VALUE_LIST, [pair for item in data for pair in item.items()]
+        else:
+            return self._escape(resp)
+
+        if len(pairs) > 0xff or not all(
+                _is_num(num) and (val is None or _is_value(val)) for num, val in pairs):
+            return self._escape(resp)
+
+        head = b''
+        if _id is not None:
+            tag |= self.IDENTIFIED
+            head += self.ID.pack(_id)
+        if version is not None:
+            tag |= self.VERSIONED
+            head += self.VERSION.pack(version)
+        head = self.HEAD.pack(tag, len(pairs)) + head
+
+        return head + b''.join(
+            self.PAIR.pack(int(num), math.nan if val is None else val) for num, val in pairs
+        )
+
+    def decode_response(self, raw):
+        if not raw:
+            raise ValueError("empty response")
+        if raw[0] == self.ESCAPE:
+            return super().decode_response(raw[1:])
+
+        try:
+            tag, count = self.HEAD.unpack_from(raw)
+            offset, resp = self.HEAD.size, {"ok" : True}
+            if tag & self.IDENTIFIED:
+                resp["id"] = self.ID.unpack_from(raw, offset)[0]
+                offset += self.ID.size
+            if tag & self.VERSIONED:
+                resp["version"] = self.VERSION.unpack_from(raw, offset)[0]
+                offset += self.VERSION.size
+            tag &= ~(self.IDENTIFIED | self.VERSIONED)
+            pairs = [
+                (str(num), _unpack_value(val))
+                for num, val in self.PAIR.iter_unpack(raw[offset:])
+            ]
+        except struct.error:
+            raise ValueError("malformed binary response: {}".format(raw))
+        if len(pairs) != count:
+            raise ValueError("malformed binary response: {}".format(raw))
+
+        if tag == self.VALUES:
+            resp["data"] = dict(pairs)
+        elif tag == self.VALUE_LIST:
+            resp["data"] = [{num : val} for num, val in pairs]
+        else:
+            raise ValueError("unknown binary response tag: {}".format(tag))
+        return resp
+
+def _is_num(num):
+    """Whether `num` fits the binary layouts as a pin/channel number."""
+    return isinstance(num, int) and 0 <= num <= 0xff
+
+def _is_id(_id):
+    """Whether `_id` fits the binary layouts as a request id."""
+    return isinstance(_id, int) and 0 <= _id < 1 << 32
+
+def _is_value(val):
+    """Whether `val` fits the binary layouts as a value, exactly."""
+    if isinstance(val, int):
+        return abs(val) <= 1 << 53
+    return isinstance(val, float)
+
+def _unpack_value(val):
+    """
+    Undoes the float packing: NaN back to None and whole numbers back to ints.
+    """
+    if isinstance(val, float):
+        if math.isnan(val):
+            return None
+        if val.is_integer():
+            return int(val)
+    return val
+
+JSON = JSONCodec()
+BINARY = BinaryCodec()
+
+# supported codecs by name
+CODECS = {codec.name : codec for codec in (JSON, BINARY)}
+
+def negotiate(offered):
+    """
+    Picks the codec to use from the ones a client offered.
+
+    @param      list    offered     codec names, in order of preference
+    @return     JSONCodec   the first offered codec that is supported, or JSON
+    """
+    for name in offered:
+        if name in CODECS:
+            return CODECS[name]
+    return JSON
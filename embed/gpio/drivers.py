@@ -0,0 +1,166 @@
+"""
+@name   Drivers
+@desc   Hardware drivers: the pins and channels behind the server, read and
+written in bursts.
+
+A driver serves a set of GPIO numbers, and reads or writes any of them with
+`read_many()` and `write_many()`, holding its bus once for the whole burst. The
+server groups every read of several channels (`CLIST`, `MGET`, a round of the
+sampler) by driver, so a chip's channels cost one bus session rather than one
+each.
+
+- `MCP3008Driver`: the channels of one MCP3008 ADC, over SPI
+- `DeviceDriver`: any objects with a `value`, one per number, e.g. gpiozero's
+  LEDs and Buttons, or the simulator's devices (see `sim.py`)
+- `StubDriver`: stubs that only hold their values, for non-RPI environments
+"""
+
+import abc
+import threading
+
+from . import stub
+
+class Driver(abc.ABC):
+    """
+    A set of pins or channels, read and written in bursts. Subclasses implement
+    `read_many()`, and `write_many()` unless they are read-only.
+
+    @attr   list    nums        the GPIO numbers it serves
+    """
+
+    def __init__(self, nums):
+        """
+        @param      list    nums        the GPIO numbers it serves
+        """
+        self.nums = list(nums)
+        self.lock = threading.Lock()
+
+    @abc.abstractmethod
+    def read_many(self, nums):
+        """
+        Reads several GPIOs, in one burst.
+
+        @param      list    nums        the numbers to read, all served by it
+        @return     dict    {num : val}
+        """
+
+    def write_many(self, vals):
+        """
+        Writes several GPIOs, in one burst.
+
+        @raises     NotImplementedError if it is read-only
+
+        @param      dict    vals        {num : val}, all served by it
+        @return     dict    {num : val} as written
+        """
+        raise NotImplementedError(
+            "{} is a read-only driver, cannot write {}".format(type(self).__name__, sorted(vals))
+        )
+
+    def close(self):
+        """Releases the hardware."""
+        pass
+
+class DeviceDriver(Driver):
+    """
+    Objects with a `value`, one per GPIO number, read and written one after
+    the other under the driver's lock.
+    """
+
+    def __init__(self, devices):
+        """
+        @param      dict    devices     {num : device}
+        """
+        super().__init__(devices.keys())
+        self.devices = dict(devices)
+
+    def read_many(self, nums):
+        with self.lock:
+            return {num : self.devices[num].value for num in nums}
+
+    def write_many(self, vals):
+        with self.lock:
+            for num, val in vals.items():
+                self.devices[num].value = val
+        return dict(vals)
+
+    def close(self):
+        for device in self.devices.values():
+            if hasattr(device, 'close'):
+                device.close()
+
+class StubDriver(DeviceDriver):
+    """
+    Stubs that only hold their values, see `stub.Stub`.
+    """
+
+    def __init__(self, values):
+        """
+        @param      dict    values      {num : initial value}
+        """
+        super().__init__({num : stub.Stub(num, val) for num, val in values.items()})
+
+class MCP3008Driver(Driver):
+    """
+    The single-ended channels of an MCP3008 ADC, read over SPI with `spidev`.
+
+    The chip converts one channel per transaction; a burst opens the bus once
+    and runs every channel's transaction back to back under one lock, rather
+    than a gpiozero `MCP3008` per channel each doing its own locked transfer.
+    Values are scaled to 0-1, like gpiozero's.
+    """
+
+    RESOLUTION = (1 << 10) - 1
+
+    def __init__(self, channels, port=0, device=0, speed=1350000):
+        """
+        @raises     ImportError when `spidev` is not installed
+
+        @param      list    channels    the channel numbers, 0 to 7
+        @param      int     port        the SPI port
+        @param      int     device      the chip select
+        @param      int     speed       the SPI clock, in Hz
+        """
+        import spidev
+
+        assert all(0 <= num <= 7 for num in channels)
+        super().__init__(channels)
+
+        self.spi = spidev.SpiDev()
+        self.spi.open(port, device)
+        self.spi.max_speed_hz = speed
+        self.spi.mode = 0
+
+    def read_many(self, nums):
+        with self.lock:
+            # start bit, single-ended + channel, then clock out the 10 bits
+            raw = {num : self.spi.xfer2([0x01, (0x08 | num) << 4, 0x00]) for num in nums}
+        return {
+            num : (((resp[1] & 0x03) << 8) | resp[2]) / self.RESOLUTION
+            for num, resp in raw.items()
+        }
+
+    def close(self):
+        self.spi.close()
+
+def by_number(drivers):
+    """
+    @param      list    drivers     the drivers
+    @return     dict    {num : driver} for every number they serve
+    """
+    return {num : driver for driver in drivers for num in driver.nums}
+
+def group(table, nums):
+    """
+    Groups GPIO numbers by the driver serving them, to read each group in one
+    burst.
+
+    @param      dict    table       {num : driver}, see `by_number()`
+    @param      list    nums        the numbers
+    @return     list    [(driver, [num, ...]), ...], in the order the drivers
+    first appear in `nums`
+    """
+    groups = {}
+    for num in nums:
+        groups.setdefault(table[num], []).append(num)
+    return list(groups.items())
@@ -0,0 +1,127 @@
+"""
+@name   History
+@desc   Fixed-size, array-backed ring buffers of recent channel samples.
+
+Each channel's samples are kept in two preallocated arrays of doubles (one of
+timestamps, one of values), overwritten oldest first once full, so recording a
+sample never allocates and a window query scans contiguous numeric memory.
+"""
+
+import math
+import threading
+from array import array
+
+class RingBuffer(object):
+    """
+    The most recent `capacity` (timestamp, value) samples of a channel.
+
+    Samples are kept in timestamp order, which the window queries' binary
+    search relies on: a sample stamped before the newest one is stamped as
+    the newest instead. Missing values are stored as NaN and left out of the
+    aggregates.
+    """
+
+    def __init__(self, capacity):
+        """
+        @param      int     capacity    the number of samples to keep
+        """
+        assert capacity > 0
+
+        self.capacity = capacity
+        self.times = array('d', [0.0]) * capacity
+        self.values = array('d', [0.0]) * capacity
+
+        self.head = 0       # where the next sample goes
+        self.count = 0      # how many slots hold samples
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, val):
+        """
+        Records a sample, overwriting the oldest one when full.
+
+        @param      float   timestamp   when the sample was taken
+        @param      number  val         the value, or None if missing
+        @return     None
+        """
+        with self.lock:
+            if self.count:
+                timestamp = max(timestamp, self.times[(self.head - 1) % self.capacity])
+            self.times[self.head] = timestamp
+            self.values[self.head] = math.nan if val is None else val
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def _index(self, i):
+        """Physical index of the `i`th oldest sample. The caller holds the lock."""
+        return (self.head - self.count + i) % self.capacity
+
+    def _first_since(self, since):
+        """
+        Logical index of the oldest sample taken at or after `since`, by binary
+        search. The caller holds the lock.
+        """
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.times[self._index(mid)] < since:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def window(self, since=None):
+        """
+        Gets the samples taken at or after `since`.
+
+        @param      float   since       the earliest timestamp, or None for all
+        @return     list    (timestamp, value) tuples, oldest first, with
+        missing values as None
+        """
+        with self.lock:
+            first = 0 if since is None else self._first_since(since)
+            indices = [self._index(i) for i in range(first, self.count)]
+            return [
+                (self.times[i], None if math.isnan(self.values[i]) else self.values[i])
+                for i in indices
+            ]
+
+    def aggregate(self, since=None):
+        """
+        Summarizes the samples taken at or after `since`.
+
+        @param      float   since       the earliest timestamp, or None for all
+        @return     dict    count, min, max, mean and last of the values in the
+        window, and the first/last timestamps it spans; min, max, mean and last
+        are None when it holds no values
+        """
+        with self.lock:
+            first = 0 if since is None else self._first_since(since)
+            count, total = 0, 0.0
+            low, high, last = math.inf, -math.inf, None
+            for i in range(first, self.count):
+                val = self.values[self._index(i)]
+                if math.isnan(val):
+                    continue
+                count += 1
+                total += val
+                low = min(low, val)
+                high = max(high, val)
+                last = val
+
+            span = (
+                self.times[self._index(first)] if first < self.count else None,
+                self.times[self._index(self.count - 1)] if first < self.count else None
+            )
+
+        return {
+            "count" : count,
+            "min" : low if count else None,
+            "max" : high if count else None,
+            "mean" : total / count if count else None,
+            "last" : last,
+            "start" : span[0],
+            "end" : span[1]
+        }
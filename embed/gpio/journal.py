@@ -0,0 +1,204 @@
+"""
+@name   Journal
+@desc   Append-only journal of pin changes, compacted into a snapshot.
+
+Every pin change is appended to the journal as one fixed-size record:
+
+    timestamp   double      when the pin was set
+    pin         uint8       the pin number
+    val         double      the value it was set to
+    crc         uint32      CRC-32 of the fields above
+
+all big-endian. Appending a record is cheap, and a power cut can at worst tear
+the last one, which recovery detects by its size or checksum and drops.
+Records are either synced as they are appended, or left for `commit()` to
+sync in groups, off the request path. The
+journal is periodically compacted: the pin states it describes are written to
+the snapshot file (atomically, see `persist.write_atomic`) and the journal is
+truncated. Recovery replays the journal on top of the snapshot.
+"""
+
+import os
+import logging
+import struct
+import threading
+import zlib
+from numbers import Real as REAL_NUMS
+from time import time
+
+from . import pubsub
+
+RECORD = struct.Struct('!dBdI')
+FIELDS = struct.Struct('!dBd')
+
+def pack(timestamp, pin, val):
+    """
+    @return     bytes       the record for a pin change
+    """
+    fields = FIELDS.pack(timestamp, pin, val)
+    return fields + struct.pack('!I', zlib.crc32(fields))
+
+def read(fname):
+    """
+    Reads the valid records of a journal, stopping at the first torn or
+    corrupt one.
+
+    @param      str     fname       the journal file
+    @return     tuple   (list of (timestamp, pin, val) records, the number of
+    bytes they span)
+    """
+    records = []
+    try:
+        with open(fname, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return records, 0
+
+    for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+        timestamp, pin, val, crc = RECORD.unpack_from(data, offset)
+        if zlib.crc32(data[offset:offset + FIELDS.size]) != crc:
+            logging.warning("Dropping corrupt journal record at byte %d of `%s`", offset, fname)
+            break
+        records.append((timestamp, pin, val))
+
+    valid = len(records) * RECORD.size
+    if valid < len(data):
+        logging.warning("Dropping %d trailing bytes of `%s`", len(data) - valid, fname)
+    return records, valid
+
+def replay(fname):
+    """
+    Replays a journal.
+
+    @param      str     fname       the journal file
+    @return     dict    {pin : val}, the last value journaled for each pin
+    """
+    records, _ = read(fname)
+    return {pin : _unpack_value(val) for _, pin, val in records}
+
+def _unpack_value(val):
+    """Whole numbers back to ints, as pins are usually set to 0 or 1."""
+    return int(val) if val.is_integer() else val
+
+class Journal(object):
+    """
+    The journal of pin changes since the last compaction.
+
+    Registered with the server's `pubsub.Hub`, it journals every pin change
+    published there.
+
+    @attr   dict    state       {pin : val}, the pin states the snapshot and
+    journal together describe
+    @attr   int     records     the number of records since the last compaction
+    """
+
+    def __init__(self, fname, state, sync=False):
+        """
+        @param      str     fname       the journal file, created if missing
+        @param      dict    state       the current pin states
+        @param      bool    sync        whether to fsync every record as it is
+        appended, so it survives a power cut; otherwise `commit()` does
+        """
+        self.fname = fname
+        self.sync = sync
+        self.state = dict(state)
+        self.lock = threading.Lock()
+        self.unsynced = 0
+
+        # drop a torn tail, so new records stay aligned
+        records, valid = read(fname)
+        self.records = len(records)
+        self.file = open(fname, 'ab')
+        self.file.truncate(valid)
+
+    def offer(self, kind, num, val, timestamp=None):
+        """
+        Journals published pin changes.
+
+        @see        `pubsub.Hub.publish()`
+        """
+        if kind != pubsub.PIN:
+            return
+        if not isinstance(val, REAL_NUMS):
+            logging.warning("Not journaling non-numeric value `%s` of pin %s", val, num)
+            return
+        self.append(num, val)
+
+    def append(self, pin, val):
+        """
+        Appends the record of a pin change.
+
+        @param      int     pin         the pin number
+        @param      number  val         the value it was set to
+        @return     None
+        """
+        with self.lock:
+            self.state[pin] = val
+            try:
+                self.file.write(pack(time(), pin, val))
+                self.file.flush()
+                if self.sync:
+                    os.fsync(self.file.fileno())
+                else:
+                    self.unsynced += 1
+                self.records += 1
+            except (OSError, struct.error) as err:
+                logging.error("Error appending to journal `%s`: %s", self.fname, err)
+
+    def commit(self):
+        """
+        Syncs the records appended since the last commit, in one fsync. The
+        fsync runs without the lock, so appends do not wait for the disk.
+
+        @return     None
+        """
+        with self.lock:
+            if not self.unsynced or self.file.closed:
+                return
+            pending, fileno = self.unsynced, self.file.fileno()
+
+        try:
+            os.fsync(fileno)
+        except OSError as err:
+            logging.error("Error syncing journal `%s`: %s", self.fname, err)
+            return
+
+        with self.lock:
+            self.unsynced = max(0, self.unsynced - pending)
+
+    def compact(self, write_snapshot):
+        """
+        Writes the current state out as a snapshot and truncates the journal.
+
+        The snapshot is written without the lock, so appends do not wait for
+        it; the records appended meanwhile are not in the snapshot, and are
+        kept when the journal is truncated. Should the truncation not happen,
+        the records left are already in the snapshot and replaying them again
+        is harmless.
+
+        @param      func    write_snapshot  writes the given {pin : val}
+        states to the snapshot file
+        @return     None
+        """
+        with self.lock:
+            state, records = dict(self.state), self.records
+
+        write_snapshot(state)
+
+        with self.lock:
+            tail = b''
+            if self.records > records:
+                with open(self.fname, 'rb') as file:
+                    file.seek(records * RECORD.size)
+                    tail = file.read()
+            self.file.truncate(0)
+            self.file.write(tail)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.records -= records
+            self.unsynced = 0
+
+    def close(self):
+        """Closes the journal file."""
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,292 @@
+"""
+@name   Metrics
+@desc   In-process metrics of the GPIO server: counters, gauges and histograms.
+
+The server records where its time goes (request latency per action, time
+spent waiting for the pin and channel locks, hardware reads and writes, state
+saves) and how loaded it is (queued requests, open connections) in one
+`Registry`. Clients read it with the `STATS` action, and `Exporter` writes it
+periodically as a Prometheus text-format file, e.g. for node_exporter's
+textfile collector.
+
+Series are identified by a metric name and labels:
+
+>>> METRICS.count('gpio_requests_total', action='PGET')
+>>> with METRICS.timer('gpio_hardware_seconds', op='pin_write'):
+...     led.value = 1
+"""
+
+import os
+import bisect
+import logging
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# bucket upper bounds, in seconds, from ~GPIO toggles to slow file syncs
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def _key(labels):
+    """Labels as a hashable, ordered key."""
+    return tuple(sorted((name, str(val)) for name, val in labels.items()))
+
+def _label_str(key, extra=()):
+    """A key as Prometheus labels, e.g. '{action="PGET",le="0.1"}'."""
+    pairs = key + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, val.replace('\\', '\\\\').replace('"', '\\"'))
+        for name, val in pairs
+    ) + '}'
+
+class Histogram(object):
+    """
+    Observations counted into fixed buckets, with their count, sum and max.
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, val):
+        """Counts one observation. The caller holds the registry's lock."""
+        self.counts[bisect.bisect_left(self.buckets, val)] += 1
+        self.count += 1
+        self.sum += val
+        self.max = max(self.max, val)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile, interpolating within the bucket it falls in.
+
+        @param      float   q       the quantile, between 0 and 1
+        @return     float   the estimate, or None without observations
+        """
+        if not self.count:
+            return None
+
+        rank, seen = q * self.count, 0
+        for i, num in enumerate(self.counts):
+            if num and seen + num >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / num, self.max)
+            seen += num
+        return self.max
+
+    def summary(self):
+        """
+        @return     dict    {"count", "sum", "mean", "max", "p50", "p95", "p99"}
+        """
+        return {
+            "count" : self.count,
+            "sum" : self.sum,
+            "mean" : self.sum / self.count if self.count else None,
+            "max" : self.max,
+            "p50" : self.quantile(0.5),
+            "p95" : self.quantile(0.95),
+            "p99" : self.quantile(0.99),
+        }
+
+class Registry(object):
+    """
+    Every metric series of a process, safe to update from any thread.
+
+    Metrics are declared once with `describe()`, then updated by name and
+    labels. Gauges are either kept up to date with `add()`, or read from a
+    function when collected, with `gauge()`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}       # name -> (kind, help)
+        self.series = {}        # name -> {labels key : value or Histogram}
+        self.gauges = {}        # name -> {labels key : func}
+
+    def describe(self, name, kind, text):
+        """
+        Declares a metric.
+
+        @param      str     name        the metric name
+        @param      str     kind        `COUNTER`, `GAUGE` or `HISTOGRAM`
+        @param      str     text        what it measures
+        @return     None
+        """
+        with self.lock:
+            self.metrics[name] = (kind, text)
+            self.series.setdefault(name, {})
+
+    def count(self, name, num=1, **labels):
+        """Increments a counter."""
+        key = _key(labels)
+        with self.lock:
+            series = self.series[name]
+            series[key] = series.get(key, 0) + num
+
+    def add(self, name, num, **labels):
+        """Moves a gauge up, or down with a negative `num`."""
+        self.count(name, num, **labels)
+
+    def gauge(self, name, func, **labels):
+        """
+        Reads a gauge from `func` whenever metrics are collected, replacing
+        any function set before for the same labels.
+
+        @param      func    func        takes no arguments, returns a number
+        @return     None
+        """
+        with self.lock:
+            self.gauges.setdefault(name, {})[_key(labels)] = func
+
+    def observe(self, name, val, **labels):
+        """Records an observation, e.g. a duration in seconds, in a histogram."""
+        key = _key(labels)
+        with self.lock:
+            series = self.series[name]
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(val)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes how long a `with` block takes, in seconds, in a histogram."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def collect(self):
+        """
+        Reads every series at once.
+
+        @return     list    (name, kind, help, {labels key : value or
+        Histogram}) per metric, sorted by name. Histograms are copies.
+        """
+        with self.lock:
+            metrics = []
+            for name, (kind, text) in sorted(self.metrics.items()):
+                series = {}
+                for key, val in self.series[name].items():
+                    if isinstance(val, Histogram):
+                        copy = Histogram(val.buckets)
+                        copy.counts, copy.count = list(val.counts), val.count
+                        copy.sum, copy.max = val.sum, val.max
+                        val = copy
+                    series[key] = val
+                metrics.append((name, kind, text, series, dict(self.gauges.get(name, {}))))
+
+        # gauge functions may take their own locks, so run them outside ours
+        collected = []
+        for name, kind, text, series, funcs in metrics:
+            for key, func in funcs.items():
+                try:
+                    series[key] = func()
+                except Exception as err:
+                    logging.error("Error reading gauge `%s`: %s", name, err)
+            collected.append((name, kind, text, series))
+        return collected
+
+    def snapshot(self):
+        """
+        Every series, for the `STATS` action.
+
+        @return     dict    {name : {labels : value}}, with labels as e.g.
+        'action=PGET,ok=true' ('' without labels), and histograms as their
+        `Histogram.summary()`
+        """
+        return {
+            name : {
+                ','.join('{}={}'.format(*pair) for pair in key) :
+                    val.summary() if isinstance(val, Histogram) else val
+                for key, val in series.items()
+            }
+            for name, _, _, series in self.collect()
+        }
+
+    def render(self):
+        """
+        Every series in the Prometheus text exposition format.
+
+        @return     str     the text
+        """
+        lines = []
+        for name, kind, text, series in self.collect():
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for key, val in sorted(series.items()):
+                if not isinstance(val, Histogram):
+                    lines.append('{}{} {}'.format(name, _label_str(key), val))
+                    continue
+
+                total = 0
+                for bound, num in zip(val.buckets + ('+Inf',), val.counts):
+                    total += num
+                    lines.append('{}_bucket{} {}'.format(
+                        name, _label_str(key, [('le', str(bound))]), total
+                    ))
+                lines.append('{}_sum{} {}'.format(name, _label_str(key), val.sum))
+                lines.append('{}_count{} {}'.format(name, _label_str(key), val.count))
+        return '\n'.join(lines) + '\n'
+
+class Exporter(threading.Thread):
+    """
+    Writes a registry to a Prometheus text-format file every `interval`
+    seconds, replacing it atomically so scrapers never read a partial file.
+    """
+
+    def __init__(self, registry, fname, interval):
+        """
+        @param      Registry    registry    the metrics to write
+        @param      str         fname       the file to write them to
+        @param      float       interval    seconds between writes
+        """
+        super().__init__(name="metrics-exporter", daemon=True)
+
+        self.registry = registry
+        self.fname = fname
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """
+        Writes the metrics now.
+
+        @return     None
+        """
+        tmp = self.fname + '.tmp'
+        try:
+            with open(tmp, 'w') as file:
+                file.write(self.registry.render())
+            os.replace(tmp, self.fname)
+        except OSError as err:
+            logging.error("Error writing metrics to `%s`: %s", self.fname, err)
+
+    def stop(self):
+        """
+        Writes the metrics one last time and stops.
+
+        @return     None
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.write()
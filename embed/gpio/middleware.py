@@ -0,0 +1,54 @@
+"""
+@name   Middleware
+@desc   Hooks around the dispatch of every action to its handler.
+
+Every valid action the server executes goes through `Server.dispatch()`,
+which calls the handler matched to its type. Middleware registered with
+`Server.use()` is called around that call, in a chain: the `before()` hooks in
+the order they were registered, then the handler, then the `after()` (or, if
+the handler raised, `error()`) hooks in the reverse order.
+
+ex.
+>>> class Audit(Middleware):
+...     def after(self, action, result):
+...         if action['type'] == actions.Types.SET_PIN:
+...             logging.info("pin set: %s", action['params'])
+...         return result
+>>> server.use(Audit())
+"""
+
+class Middleware(object):
+    """
+    A link in the dispatch chain. Override any of the hooks; they run in the
+    worker executing the action, so must be thread-safe, and should be quick.
+    """
+
+    def before(self, action):
+        """
+        Called before the handler. Raising rejects the action: the handler is
+        not called, the `error()` hooks are, and the client gets an error
+        response.
+
+        @param      dict    action      the validated action
+        @return     None
+        """
+
+    def after(self, action, result):
+        """
+        Called after the handler returned.
+
+        @param      dict    action      the action
+        @param      obj     result      what the handler returned
+        @return     obj     the result to respond with, usually `result`
+        """
+        return result
+
+    def error(self, action, err):
+        """
+        Called after the handler raised. The exception is then handled as
+        usual, turned into an error response.
+
+        @param      dict        action      the action
+        @param      Exception   err         what it raised
+        @return     None
+        """
@@ -0,0 +1,103 @@
+"""
+@name   Persist
+@desc   Deferred, coalescing persistence of the GPIO state.
+
+Requests that change the GPIO state only mark it dirty. A background thread
+waits out a short window after the first change, so a burst of changes costs
+a single write, and then saves the state. Request latency no longer includes
+the file write.
+"""
+
+import os
+import logging
+import threading
+
+def write_atomic(fname, data):
+    """
+    Replaces the contents of a file atomically: the data is written and synced
+    to a temporary file, which is then renamed over the original, and the
+    directory is synced so the rename survives a power cut too. Readers, or a
+    restart after a power cut, see either the old or the new contents, never a
+    partial file.
+
+    @param      str     fname       the file to write
+    @param      str     data        the new contents
+    @return     None
+    """
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, fname)
+
+    dirfd = os.open(os.path.dirname(os.path.abspath(fname)), os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+
+class DeferredWriter(threading.Thread):
+    """
+    Calls `write_fn` in the background, at most once per `window` seconds, and
+    only after something was marked dirty.
+    """
+
+    def __init__(self, write_fn, window):
+        """
+        @param      func    write_fn    saves the state, takes no arguments
+        @param      float   window      seconds to wait after the first change
+        before writing, collecting any further changes
+        """
+        super().__init__(name="state-writer", daemon=True)
+
+        self.write_fn = write_fn
+        self.window = window
+
+        self.dirty = threading.Event()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def mark_dirty(self):
+        """
+        Records that the state changed and needs writing.
+        """
+        self.dirty.set()
+
+    def flush(self):
+        """
+        Writes the state now, if it is dirty.
+
+        @return     None
+        """
+        with self.lock:
+            if not self.dirty.is_set():
+                return
+            # cleared before writing, so changes made during the write are
+            # picked up by the next one
+            self.dirty.clear()
+            try:
+                self.write_fn()
+            except Exception as err:
+                logging.error("Error writing GPIO state: %s", err)
+
+    def start(self):
+        """
+        Starts the writer, unless already started.
+        """
+        if self.ident is None:
+            super().start()
+
+    def stop(self):
+        """
+        Stops the writer, writing the state one last time.
+        """
+        self.stopped.set()
+        self.dirty.set()
+        self.join()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.dirty.wait()
+            self.stopped.wait(self.window)
+            self.flush()
@@ -0,0 +1,178 @@
+"""
+@name   Pool
+@desc   Bounded pool of persistent client connections to the GPIO server.
+
+Each request checks a connection out of the pool, sends its action, waits for
+the reply and checks the connection back in, so threads sharing a client run
+their requests in parallel over separate connections, without connecting for
+every request. Idle connections are checked before reuse, and connections a
+request failed on are dropped rather than returned.
+"""
+
+import select
+import logging
+import threading
+
+class Connection(object):
+    """
+    An open connection to the server, and the codec negotiated over it.
+
+    @attr   sock.Socket         sock        the connected socket
+    @attr   codec.JSONCodec     codec       the codec the server agreed to
+    @attr   int                 requests    the number of requests made over it
+    """
+
+    def __init__(self, conn, conn_codec):
+        self.sock = conn
+        self.codec = conn_codec
+        self.requests = 0
+        self.generation = 0     # the pool generation it was opened in
+
+    def request(self, action):
+        """
+        Sends an action and waits for the reply.
+
+        @raises     OSError     if the connection fails
+        @raises     ValueError  if the reply is not a valid frame
+
+        @param      dict    action      the action
+        @return     bytes   the encoded response
+        """
+        self.requests += 1
+        self.sock.send_var(self.codec.encode_action(action))
+        data = self.sock.recv_var()
+        if data is None:
+            raise ConnectionError("connection closed by server")
+        return data
+
+    def healthy(self):
+        """
+        Checks an idle connection, without a round trip: nothing should be
+        readable on it, so anything that is means the server closed it (or it
+        is out of step with its replies).
+
+        @return     bool    True if the connection can be reused
+        """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close(self):
+        """Closes the connection."""
+        self.sock.close()
+
+class Pool(object):
+    """
+    Up to `size` connections, opened on demand and reused.
+
+    Checking out waits for a connection to be checked back in when `size` are
+    already out, raising `TimeoutError` after `timeout` seconds.
+    """
+
+    def __init__(self, open_fn, size, timeout=None):
+        """
+        @param      func    open_fn     opens a new `Connection`
+        @param      int     size        the most connections to keep open
+        @param      float   timeout     the most seconds to wait for a
+        connection, or None to wait indefinitely
+        """
+        assert size > 0
+
+        self.open_fn = open_fn
+        self.size = size
+        self.timeout = timeout
+
+        self.cond = threading.Condition(threading.Lock())
+        self.idle = []          # most recently used last
+        self.total = 0          # idle and checked out
+        self.generation = 0     # bumped by `close()`, to drop older connections
+
+    def checkout(self, fresh=False):
+        """
+        Takes a connection out of the pool, reusing an idle one that is still
+        healthy, or opening a new one.
+
+        @raises     TimeoutError    if no connection became free in time
+        @raises     OSError         if opening a new connection fails
+
+        @param      bool    fresh       open a new connection, even if some
+        are idle
+        @return     Connection  the connection, to be given back with
+        `checkin()` or `discard()`
+        """
+        with self.cond:
+            while True:
+                if not fresh and self.idle:
+                    conn = self.idle.pop()
+                    if conn.healthy():
+                        return conn
+                    logging.info("Dropping a closed pooled connection")
+                    conn.close()
+                    self.total -= 1
+                    continue
+                if self.total < self.size:
+                    self.total += 1
+                    break
+                if fresh and self.idle:
+                    # make room for the new connection
+                    self.idle.pop(0).close()
+                    self.total -= 1
+                    continue
+                if not self.cond.wait(self.timeout):
+                    raise TimeoutError("no connection free after {}s".format(self.timeout))
+            generation = self.generation
+
+        try:
+            conn = self.open_fn()
+        except BaseException:
+            with self.cond:
+                self.total -= 1
+                self.cond.notify()
+            raise
+        conn.generation = generation
+        return conn
+
+    def checkin(self, conn):
+        """
+        Gives a connection back, to be reused.
+
+        @param      Connection  conn    the connection, as checked out
+        @return     None
+        """
+        with self.cond:
+            if conn.generation != self.generation:
+                conn.close()
+                self.total -= 1
+            else:
+                self.idle.append(conn)
+            self.cond.notify()
+
+    def discard(self, conn):
+        """
+        Gives a connection back to be closed, e.g. after a request failed on
+        it, since it may be broken or out of step.
+
+        @param      Connection  conn    the connection, as checked out
+        @return     None
+        """
+        conn.close()
+        with self.cond:
+            self.total -= 1
+            self.cond.notify()
+
+    def close(self):
+        """
+        Closes the idle connections, and the checked out ones as they are
+        checked back in. The pool stays usable, opening new connections.
+
+        @return     None
+        """
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.total -= len(idle)
+            self.generation += 1
+            self.cond.notify_all()
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,128 @@
+"""
+@name   Pub/Sub
+@desc   Change notifications for GPIO pins and channels.
+
+The server publishes every pin or channel value it observes to a `Hub`.
+Subscriptions registered with the hub keep the values that changed by more
+than their deadband since they were last sent, until the connection serving the
+subscription takes them.
+"""
+
+import threading
+from numbers import Real as REAL_NUMS
+
+PIN = 'pin'
+CHANNEL = 'channel'
+
+class Subscription(object):
+    """
+    A client's interest in a set of pins and channels.
+
+    @attr   set     pins        the pin numbers watched
+    @attr   set     channels    the channel numbers watched
+    @attr   float   deadband    the smallest change in a numeric value worth
+    reporting
+    @attr   float   interval    the minimum number of seconds between updates
+    """
+
+    def __init__(self, pins=None, channels=None, deadband=0, interval=1):
+        self.pins = set(pins if pins else [])
+        self.channels = set(channels if channels else [])
+        self.deadband = deadband
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.sent = {PIN : {}, CHANNEL : {}}
+        self.pending = {PIN : {}, CHANNEL : {}}
+
+    def watches(self, kind, num):
+        """
+        @return     bool    True if the subscription is interested in `num`
+        """
+        return num in (self.pins if kind == PIN else self.channels)
+
+    def changed(self, kind, num, val):
+        """
+        @return     bool    True if `val` differs from the value last sent for
+        `num` by more than the deadband
+        """
+        if num not in self.sent[kind]:
+            return True
+        last = self.sent[kind][num]
+        if isinstance(val, REAL_NUMS) and isinstance(last, REAL_NUMS):
+            return abs(val - last) > self.deadband
+        return val != last
+
+    def offer(self, kind, num, val, timestamp=None):
+        """
+        Records a new value, if the subscription watches it and it changed.
+
+        @param      str     kind        `PIN` or `CHANNEL`
+        @param      int     num         the pin or channel number
+        @param      number  val         the value
+        @param      float   timestamp   when a channel sample was taken, unused
+        @return     None
+        """
+        if not self.watches(kind, num):
+            return
+        with self.lock:
+            if self.changed(kind, num, val):
+                self.pending[kind][num] = val
+            else:
+                # back within the deadband, nothing to report anymore
+                self.pending[kind].pop(num, None)
+
+    def take(self):
+        """
+        Takes the values that changed since the last call, marking them sent.
+
+        @return     dict    {"pins": {num: val}, "channels": {num: val}}, or
+        None if nothing changed
+        """
+        with self.lock:
+            pending = self.pending
+            if not pending[PIN] and not pending[CHANNEL]:
+                return None
+
+            self.pending = {PIN : {}, CHANNEL : {}}
+            for kind in (PIN, CHANNEL):
+                self.sent[kind].update(pending[kind])
+
+        return {"pins" : pending[PIN], "channels" : pending[CHANNEL]}
+
+class Hub(object):
+    """
+    Fans published values out to the registered subscriptions, or anything
+    else with an `offer(kind, num, val, timestamp=None)` method, like the state
+    journal.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subs = set()
+
+    def add(self, sub):
+        """Registers a subscription."""
+        with self.lock:
+            self.subs.add(sub)
+
+    def remove(self, sub):
+        """Unregisters a subscription."""
+        with self.lock:
+            self.subs.discard(sub)
+
+    def publish(self, kind, num, val, timestamp=None):
+        """
+        Offers a pin or channel value to every subscription.
+
+        @param      str     kind        `PIN` or `CHANNEL`
+        @param      int     num         the pin or channel number
+        @param      number  val         the value
+        @param      float   timestamp   when a channel sample was taken, by
+        the sampler's clock (see `Sampler.timestamp()`), or None for now
+        @return     None
+        """
+        with self.lock:
+            subs = list(self.subs)
+        for sub in subs:
+            sub.offer(kind, num, val, timestamp)
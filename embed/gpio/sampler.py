@@ -0,0 +1,189 @@
+"""
+@name   Sampler
+@desc   Background sampling of ADC channels into a table of latest values.
+
+A single thread reads every channel at that channel's own rate and records the
+samples, so any number of clients asking for a channel are served from the
+table instead of each causing an ADC transaction. Channels due at the same
+time are read together, in one call, so a driver can read them in one burst
+(see `drivers.py`). Reads made outside the sampler (when a client needs a
+fresher value than the table has) are recorded too.
+
+Samples are stamped with `monotonic()`, so a step of the wall clock (e.g. by
+NTP) neither reorders them nor skews `max_age`; `timestamp()` converts a stamp
+to the time of the sampler's clock for clients, at the API edge. That is the
+virtual time of the simulator backend (see `embed/clock.py`), which ages and
+windows are in too.
+"""
+
+import heapq
+import logging
+import threading
+from time import monotonic
+
+from . import state
+from ..clock import Clock
+
+class Sampler(threading.Thread):
+    """
+    Reads each channel at a per-channel rate into a shared latest-value table.
+
+    @attr   func    read_fn     reads channels from the hardware, given a list
+    of their numbers, and records the samples with `record_many()` before
+    releasing its locks, so no newer sample is overwritten; responsible for
+    its own locking
+    @attr   dict    rates       samples per second, per channel number; 0 to
+    only sample on demand
+    @attr   VersionedState  samples     the latest (timestamp, value) per
+    channel number, stamped with `monotonic()`
+    @attr   Clock   clock       the clock clients get the time of, see
+    `timestamp()`
+    """
+
+    def __init__(self, read_fn, rates, on_sample=None, clock=None):
+        """
+        @param      func    read_fn     reads and records channels, given their
+        numbers
+        @param      dict    rates       samples per second, per channel number
+        @param      func    on_sample   called with (channel, timestamp, value)
+        for every sample recorded
+        @param      Clock   clock       the clock clients get the time of,
+        defaults to real time
+        """
+        super().__init__(name="sampler", daemon=True)
+
+        self.read_fn = read_fn
+        self.rates = dict(rates)
+        self.on_sample = on_sample
+        self.clock = clock if clock else Clock()
+
+        self.samples = state.VersionedState()
+        self.stopped = threading.Event()
+
+    def timestamp(self, stamp):
+        """
+        @param      float   stamp       a sample's `monotonic()` timestamp
+        @return     float   the same moment by the sampler's clock
+        """
+        return self.clock.at(stamp)
+
+    def since(self, window):
+        """
+        @param      float   window      seconds of the sampler's clock
+        @return     float   the `monotonic()` timestamp that long ago
+        """
+        return monotonic() - window / self.clock.speed
+
+    def latest(self, chnl_num, max_age=None):
+        """
+        Gets the latest sample of a channel.
+
+        @param      int     chnl_num    the channel number
+        @param      float   max_age     the oldest sample acceptable, in
+        seconds of the sampler's clock, or None for any
+        @return     tuple   (`monotonic()` timestamp, value), or None if there
+        is no sample recent enough
+        """
+        with self.samples.lock.read():
+            sample = self.samples.get(chnl_num)
+
+        if sample is None or (max_age is not None and sample[0] < self.since(max_age)):
+            return None
+        return sample
+
+    def snapshot(self):
+        """
+        Gets the latest sample of every channel, at once.
+
+        @return     Versioned   {channel : (`monotonic()` timestamp, value)},
+        and the version of the table
+        """
+        return self.samples.snapshot()
+
+    def record(self, chnl_num, val):
+        """
+        Records a sample of a channel, taken now.
+
+        @param      int     chnl_num    the channel number
+        @param      number  val         the value read
+        @return     tuple   the (`monotonic()` timestamp, value) sample, or
+        None if dropped, see `record_many()`
+        """
+        return self.record_many({chnl_num : val}).get(chnl_num)
+
+    def record_many(self, vals):
+        """
+        Records samples of several channels, taken now, at once.
+
+        A sample older than the one already recorded for its channel is
+        dropped, so the table and `on_sample` only ever move forward in time.
+
+        @param      dict    vals        {channel : value read}
+        @return     dict    {channel : (`monotonic()` timestamp, value)} of
+        the samples recorded
+        """
+        now = monotonic()
+        samples = {}
+        with self.samples.lock.write():
+            for chnl_num, val in vals.items():
+                stored = self.samples.get(chnl_num)
+                if stored is not None and stored[0] > now:
+                    continue
+                samples[chnl_num] = (now, val)
+                self.samples.set(chnl_num, samples[chnl_num])
+
+        if self.on_sample is not None:
+            for chnl_num, sample in samples.items():
+                self.on_sample(chnl_num, *sample)
+        return samples
+
+    def start(self):
+        """
+        Starts sampling, unless already started.
+        """
+        if self.ident is None:
+            super().start()
+
+    def stop(self):
+        """
+        Stops sampling.
+        """
+        self.stopped.set()
+
+    def renewed(self):
+        """
+        A thread cannot be started again once stopped, so to sample again:
+
+        @return     Sampler     a new, unstarted sampler like this one,
+        keeping its samples
+        """
+        renewed = Sampler(self.read_fn, self.rates, self.on_sample, self.clock)
+        renewed.samples = self.samples
+        return renewed
+
+    def run(self):
+        # (when the channel is next due, channel), earliest first
+        due = [(monotonic(), n) for n, rate in self.rates.items() if rate > 0]
+        heapq.heapify(due)
+
+        while due and not self.stopped.is_set():
+            when = due[0][0]
+            delay = when - monotonic()
+            if delay > 0:
+                self.stopped.wait(delay)
+                continue
+
+            # every channel due by now, read together
+            now = monotonic()
+            batch = []
+            while due and due[0][0] <= now:
+                batch.append(heapq.heappop(due))
+            try:
+                self.read_fn([chnl_num for _, chnl_num in batch])
+            except Exception as err:
+                logging.error("Error sampling channels %s: %s",
+                              [chnl_num for _, chnl_num in batch], err)
+
+            # when running behind, skip missed samples rather than bursting
+            for when, chnl_num in batch:
+                heapq.heappush(due, (max(when + 1 / self.rates[chnl_num], now), chnl_num))
@@ -2,31 +2,41 @@
 @name   GPIO Server
 @desc   Multi-threaded server for atomically reading/writing RPI GPIO pins.
 
-GPIO read/write requests are handled in separate threads. However, GPIO is
-locked via semaphores, so rw is guaranteed to be atomic, and will take the value
-of the operation on that pin, or default if none.
+GPIO read/write requests are handled in separate threads. However, the pin
+state is guarded by a reader/writer lock, so rw is guaranteed to be atomic,
+concurrent reads do not block each other, and will take the value of the
+operation on that pin, or default if none.
 
 @author Joshua Paul A. Chan (@joshpaulchan)
 """
 
+import os
 import json
 import logging
+import select
 import threading
 import socket
-from time import time
+from time import time, perf_counter
+from contextlib import ExitStack
 from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4 as uuid
 from numbers import Real as REAL_NUMS
 
 from . import actions
+from . import codec
+from . import drivers
+from . import history
+from . import journal
+from . import metrics
+from . import persist
+from . import pubsub
+from . import sampler
+from . import shm
 from . import sock
+from . import state
+from . import tracing
 from .. import utils, config
-
-if config.GPIOConfig.DEBUG:
-    logging.basicConfig(
-        level=config.GPIOConfig.LOG_LEVEL,
-        format='%(asctime)s:%(levelname)s:GPIO/server:%(message)s'
-    )
+from ..clock import CLOCK
 
 ################################### GLOBALS ###################################
 
@@ -39,74 +49,396 @@ _CHNLS = list(
     filter(lambda v: v.num is not None, config.GPIOConfig.CHNL_NUMBERS.values())
 )
 
-# pin and channel locks
-PIN_LOX = {n.num : threading.Semaphore(1) for n in _PINS}
-CHNL_LOX = {n.num : threading.Semaphore(1) for n in _CHNLS}
+# where the server's time goes, see `metrics.py`
+METRICS = metrics.Registry()
+METRICS.describe('gpio_requests_total', metrics.COUNTER,
+                 "Requests handled, by action type and outcome.")
+METRICS.describe('gpio_request_seconds', metrics.HISTOGRAM,
+                 "Time to execute a request, by action type, excluding queueing.")
+METRICS.describe('gpio_requests_busy_total', metrics.COUNTER,
+                 "Requests refused because MAX_PENDING were already pending.")
+METRICS.describe('gpio_queue_wait_seconds', metrics.HISTOGRAM,
+                 "Time requests waited for a worker.")
+METRICS.describe('gpio_requests_queued', metrics.GAUGE,
+                 "Requests waiting for a worker.")
+METRICS.describe('gpio_requests_running', metrics.GAUGE,
+                 "Requests being executed by a worker.")
+METRICS.describe('gpio_connections', metrics.GAUGE,
+                 "Open client connections.")
+METRICS.describe('gpio_lock_wait_seconds', metrics.HISTOGRAM,
+                 "Time spent waiting for the pin state lock or a channel lock.")
+METRICS.describe('gpio_hardware_seconds', metrics.HISTOGRAM,
+                 "Time spent writing pins and reading channels on the hardware.")
+METRICS.describe('gpio_publish_seconds', metrics.HISTOGRAM,
+                 "Time spent journaling and publishing a pin change.")
+METRICS.describe('gpio_save_seconds', metrics.HISTOGRAM,
+                 "Time spent compacting the journal into the state file.")
+METRICS.describe('gpio_startup_seconds', metrics.GAUGE,
+                 "Seconds taken to open the hardware and to construct the server, by phase.")
+
+def _on_lock_wait(secs, **labels):
+    """Records a wait for a lock, in `METRICS` and the request's trace."""
+    METRICS.observe('gpio_lock_wait_seconds', secs, **labels)
+    tracing.event('lock', secs, **labels)
+
+# hardware reads of each channel, taken in ascending channel order when
+# reading several; samples are served from `SAMPLER` without them
+ADC_LOX = {
+    n.num : state.TimedLock(
+        lambda secs, lock='channel/{}'.format(n.num): _on_lock_wait(secs, lock=lock)
+    )
+    for n in _CHNLS
+}
 SAVEFILE_LOCK = threading.Semaphore(1)
 
-try:                # on-rpi env
-    import gpiozero
-    
-    # set up pins for binary output
-    PINS = {gpio.num : gpiozero.LED(int(gpio.num)) for gpio in _PINS}
-    # instantiate ADC for sensor channels
-    CHNLS = {}
-    for gpio in _CHNLS:
-        if gpio.type == 'channel':
-            CHNLS[gpio.num] = gpiozero.MCP3008(channel=gpio.num)
-        elif gpio.type == 'pin':
-            CHNLS[gpio.num] = gpiozero.Button(gpio.num)
-        else:
-            pass
-except ImportError: # non-rpi env
-    import random
-    from . import stub
-
-    PINS = {gpio.num : stub.Stub(gpio.num, 0) for gpio in _PINS}
-    CHNLS = {}
-    for gpio in _CHNLS:
-        if gpio.type == 'channel':
-            CHNLS[gpio.num] = stub.Stub(gpio.num, random.random())
-        elif gpio.type == 'pin':
-            CHNLS[gpio.num] = stub.Stub(gpio.num, random.random())
-        else:
-            pass
+# change notifications for subscribers
+HUB = pubsub.Hub()
+
+# the hardware, opened by `init_hardware()` when the first server is made, so
+# importing this module (e.g. for the client) touches no pins
+HARDWARE_LOCK = threading.Lock()
+BACKEND = None
+GREENHOUSE = None       # the simulated greenhouse, with the 'sim' backend
+PIN_DRIVERS = []
+CHNL_DRIVERS = []
+
+# the driver of every pin and channel, by number
+PINS = {}
+CHNLS = {}
+
+# pin states, read concurrently and written exclusively, see `state.py`
+PIN_STATE = None
+
+# recent samples of every channel
+HISTORY = {}
+
+# background channel sampling, started with the server
+SAMPLER = None
+
+def _backend():
+    """
+    @return     str     the GPIO backend to use, see `GPIOConfig.BACKEND`
+    """
+    backend = config.GPIOConfig.BACKEND
+    if backend != 'auto':
+        return backend
+    try:
+        import gpiozero
+        return 'gpiozero'
+    except ImportError:
+        return 'stub'
+
+def _open_drivers(backend):
+    """
+    Opens the configured pins and channels.
+    
+    @raises     ValueError  when `backend` is unknown
+    
+    @param      str     backend     'gpiozero', 'sim' or 'stub'
+    @return     tuple   (pin drivers, channel drivers, the simulated greenhouse
+    or None)
+    """
+    if backend == 'gpiozero':   # on-rpi env
+        import gpiozero
+        
+        # set up pins for binary output
+        pin_drivers = [drivers.DeviceDriver({gpio.num : gpiozero.LED(int(gpio.num)) for gpio in _PINS})]
+        # the ADC's sensor channels are read in bursts, and pin inputs as buttons
+        adc_nums = [gpio.num for gpio in _CHNLS if gpio.type == 'channel']
+        try:
+            adc = drivers.MCP3008Driver(
+                adc_nums, port=config.GPIOConfig.SPI_PORT,
+                device=config.GPIOConfig.SPI_DEVICE, speed=config.GPIOConfig.SPI_SPEED
+            )
+        except ImportError:
+            logging.warning("`spidev` is not installed, reading the ADC one channel at a time")
+            adc = drivers.DeviceDriver({num : gpiozero.MCP3008(channel=num) for num in adc_nums})
+        chnl_drivers = [adc, drivers.DeviceDriver({
+            gpio.num : gpiozero.Button(gpio.num) for gpio in _CHNLS if gpio.type == 'pin'
+        })]
+        return pin_drivers, chnl_drivers, None
+    elif backend == 'sim':      # simulated greenhouse, on the virtual clock
+        from . import sim
+        
+        greenhouse = sim.Greenhouse(CLOCK)
+        pin_drivers = [drivers.DeviceDriver({
+            gpio.num : greenhouse.pin(name, gpio.num)
+            for name, gpio in config.GPIOConfig.PINS.items() if gpio.num is not None
+        })]
+        chnl_drivers = [drivers.DeviceDriver({
+            gpio.num : greenhouse.channel(name, gpio.num)
+            for name, gpio in config.GPIOConfig.CHNL_NUMBERS.items()
+            if gpio.num is not None and gpio.type in ('channel', 'pin')
+        })]
+        return pin_drivers, chnl_drivers, greenhouse
+    elif backend == 'stub':     # non-rpi env
+        import random
+        
+        pin_drivers = [drivers.StubDriver({gpio.num : 0 for gpio in _PINS})]
+        chnl_drivers = [drivers.StubDriver({
+            gpio.num : random.random() for gpio in _CHNLS if gpio.type in ('channel', 'pin')
+        })]
+        return pin_drivers, chnl_drivers, None
+    
+    raise ValueError("unknown GPIO backend `{}`".format(backend))
+
+def _on_sample(chnl_num, timestamp, val):
+    """Keeps and publishes every channel sample, with when it was taken."""
+    HISTORY[chnl_num].append(timestamp, val)
+    HUB.publish(pubsub.CHANNEL, chnl_num, val, SAMPLER.timestamp(timestamp))
+
+def init_hardware():
+    """
+    Opens the pins and channels of the configured backend, and sets up the pin
+    state, the channel history and the sampler over them. Only the first call
+    does anything; the server makes it when constructed.
+    
+    @return     float   the seconds it took, or 0 if already done
+    """
+    global BACKEND, GREENHOUSE, PIN_DRIVERS, CHNL_DRIVERS, PINS, CHNLS
+    global PIN_STATE, HISTORY, SAMPLER
+    
+    with HARDWARE_LOCK:
+        if SAMPLER is not None:
+            return 0.0
+        
+        start = perf_counter()
+        BACKEND = _backend()
+        PIN_DRIVERS, CHNL_DRIVERS, GREENHOUSE = _open_drivers(BACKEND)
+        PINS = drivers.by_number(PIN_DRIVERS)
+        CHNLS = drivers.by_number(CHNL_DRIVERS)
+        
+        PIN_STATE = state.VersionedState(
+            utils.merge_dicts(*(driver.read_many(driver.nums) for driver in PIN_DRIVERS)),
+            on_wait=lambda mode, secs: _on_lock_wait(secs, lock='pins', mode=mode)
+        )
+        HISTORY = {
+            chnl_num : history.RingBuffer(config.GPIOConfig.HISTORY_SIZE)
+            for chnl_num in CHNLS.keys()
+        }
+        SAMPLER = sampler.Sampler(
+            read_fn=lambda chnl_nums: _sample_channels(chnl_nums),
+            rates={
+                chnl_num : config.GPIOConfig.SAMPLE_RATES.get(chnl_num, config.GPIOConfig.SAMPLE_RATE)
+                for chnl_num in CHNLS.keys()
+            },
+            on_sample=_on_sample,
+            clock=CLOCK
+        )
+        secs = perf_counter() - start
+    
+    METRICS.gauge('gpio_startup_seconds', lambda: secs, phase='hardware')
+    logging.info("Opened the `%s` GPIO backend in %.3fs", BACKEND, secs)
+    return secs
+
+def _start_sampler():
+    """
+    Starts the sampler, unless started, renewing it if a closed server
+    stopped it.
+    """
+    global SAMPLER
+    
+    with HARDWARE_LOCK:
+        if SAMPLER.stopped.is_set():
+            SAMPLER = SAMPLER.renewed()
+        SAMPLER.start()
     
 ################################### HANDLERS ###################################
 
 ############################## HANDLERS/FUNCTIONS ##############################
 
-def set_pin(pin, val):
+def _pin_num(pin):
     """
-    Set the value of a pin.
+    Parses and checks a pin number.
     
-    @pre        `pin` must be an non-negative integer
-    @pre        `val` must be a 0 or 1
-    
-    @param      int     pin     the pin to set the value for
-    @param      int     val     the value to set the pin to
+    @raises     LookupError when `pin` is not a configured pin
     
-    @return     dict    {pin : val} where `pin` is the pin number and `val` is
-    the val that the GPIO pin is currently set to
+    @param      int     pin     the pin number
+    @return     int     the pin number
     """
     pin_num = int(pin)
-    pin = PINS.get(pin_num, None)
     
-    if pin is None:
+    if pin_num not in PINS:
         msg = "{} is not a valid pin number.".format(pin_num)
         logging.error(msg)
         raise LookupError(msg)
     
+    return pin_num
+
+def _chnl_num(channel):
+    """
+    Parses and checks a channel number.
+    
+    @raises     LookupError when `channel` is not a configured channel
+    
+    @param      int     channel     the channel number
+    @return     int     the channel number
+    """
+    chnl_num = int(channel)
+    
+    if chnl_num not in CHNLS:
+        msg = "{} is not a valid channel number".format(chnl_num)
+        logging.error(msg)
+        raise LookupError(msg)
+    
+    return chnl_num
+
+def _set_pin(pin_num, val):
+    """
+    Sets a pin, without locking. The caller must hold `PIN_STATE.lock`
+    exclusively.
+    
+    @see        `set_pin()`
+    """
     logging.info("Setting pin %s to %s...", pin_num, val)
-    with PIN_LOX[pin_num]:
-        try:
-            PINS[pin_num].value = val
-        except Exception as err:
-            logging.error("`Error setting pin `%s` to `%s`", pin_num, val)
-            return {pin_num: get_pin(pin_num)}
+    try:
+        with METRICS.timer('gpio_hardware_seconds', op='pin_write'), \
+                tracing.span('hardware', op='pin_write'):
+            PINS[pin_num].write_many({pin_num : val})
+    except Exception as err:
+        logging.error("`Error setting pin `%s` to `%s`", pin_num, val)
+        return _get_pin(pin_num)
     
+    PIN_STATE.set(pin_num, val)
+    with METRICS.timer('gpio_publish_seconds'), tracing.span('persist'):
+        HUB.publish(pubsub.PIN, pin_num, val)
     return {pin_num : val}
 
+def _get_pin(pin_num):
+    """
+    Reads a pin, without locking. The caller must hold `PIN_STATE.lock`.
+    
+    @see        `get_pin()`
+    """
+    return {pin_num : PIN_STATE.get(pin_num)}
+
+def _channel_locks(chnl_nums):
+    """
+    @param      list    chnl_nums   channel numbers
+    @return     list    their `ADC_LOX` locks, in ascending channel order
+    """
+    return [ADC_LOX[n] for n in sorted(set(chnl_nums)) if n in ADC_LOX]
+
+def _burst_read(chnl_nums):
+    """
+    Reads channels from the hardware, in one burst per driver, without
+    locking or recording the samples.
+    
+    @return     dict    {chnl : val}
+    """
+    vals = {}
+    for driver, nums in drivers.group(CHNLS, chnl_nums):
+        vals.update(driver.read_many(nums))
+    return vals
+
+def _read_channels(chnl_nums):
+    """
+    Reads channels from the hardware, without locking, and records the
+    samples. The caller must hold the `ADC_LOX` lock of every channel.
+    
+    @return     dict    {chnl : val} of the values read
+    """
+    with METRICS.timer('gpio_hardware_seconds', op='channel_read'), \
+            tracing.span('hardware', op='channel_read', channels=len(chnl_nums)):
+        vals = _burst_read(chnl_nums)
+    SAMPLER.record_many(vals)
+    return vals
+
+def _read_channel(chnl_num):
+    """
+    Reads a channel from the hardware, without locking, and records the
+    sample. The caller must hold `ADC_LOX[chnl_num]`.
+    
+    @return     number      the value read
+    """
+    return _read_channels([chnl_num])[chnl_num]
+
+def _sample_channels(chnl_nums):
+    """
+    Reads channels from the hardware and records the samples, taking their
+    locks. Used by the sampler. The samples are recorded before the locks are
+    released, so a request reading a channel in between cannot have its newer
+    sample overwritten by this one.
+    
+    @return     dict    {chnl : val}
+    """
+    with ExitStack() as stack:
+        for lock in _channel_locks(chnl_nums):
+            stack.enter_context(lock)
+        return _read_channels(chnl_nums)
+
+def _stale_channels(chnl_nums, max_age=None):
+    """
+    @return     list    the channels without a sample recent enough
+    """
+    return [n for n in chnl_nums if SAMPLER.latest(n, max_age) is None]
+
+def _refresh_channels(chnl_nums, max_age=None):
+    """
+    Reads the channels without a sample recent enough from the hardware, in
+    one burst per driver, taking their locks.
+    
+    @param      list    chnl_nums   the channel numbers
+    @param      float   max_age     the oldest sample acceptable, in seconds,
+    or None for any
+    @return     None
+    """
+    if not _stale_channels(chnl_nums, max_age):
+        return
+    
+    with ExitStack() as stack:
+        for lock in _channel_locks(chnl_nums):
+            stack.enter_context(lock)
+        # other requests may have sampled while we waited for the locks
+        stale = _stale_channels(chnl_nums, max_age)
+        if stale:
+            _read_channels(stale)
+
+def _get_channel(chnl_num, max_age=None):
+    """
+    Reads a channel, without locking. The caller must hold `ADC_LOX[chnl_num]`.
+    
+    @see        `get_channel()`
+    """
+    sample = SAMPLER.latest(chnl_num, max_age)
+    return {chnl_num : sample[1] if sample else _read_channel(chnl_num)}
+
+def _list_channels(max_age=None):
+    """
+    Lists every channel, without locking. The caller must hold every
+    `ADC_LOX` lock, unless every channel has a sample already.
+    
+    @see        `list_channels()`
+    """
+    stale = _stale_channels(CHNLS.keys(), max_age)
+    if stale:
+        _read_channels(stale)
+    
+    samples = SAMPLER.snapshot()
+    return state.Versioned(
+        [{n : samples.data[n][1]} for n in CHNLS.keys() if n in samples.data],
+        samples.version
+    )
+
+def set_pin(pin, val):
+    """
+    Set the value of a pin.
+    
+    @pre        `pin` must be an non-negative integer
+    @pre        `val` must be a 0 or 1
+    
+    @param      int     pin     the pin to set the value for
+    @param      int     val     the value to set the pin to
+    
+    @return     Versioned   {pin : val} where `pin` is the pin number and `val`
+    is the val that the GPIO pin is currently set to, and the version of the
+    pin state after setting it
+    """
+    pin_num = _pin_num(pin)
+    
+    with PIN_STATE.lock.write():
+        return state.Versioned(_set_pin(pin_num, val), PIN_STATE.version)
+
 def get_pin(pin):
     """
     Get the value of a single pin.
@@ -120,45 +452,36 @@ def get_pin(pin):
     @see        `doc/ipc.md` for more informaton on the structure of `action`
     
     @param      int     pin     the pin number to read from
-    @return     dict    {pin : val} where `pin` is the pin number and `val` is
-    the val that the GPIO pin is currently set to
+    @return     Versioned   {pin : val} where `pin` is the pin number and `val`
+    is the val that the GPIO pin is currently set to, and the version of the
+    pin state it was read at
     """
-    pin_num = int(pin)
-    pin = PINS.get(pin_num, None)
+    pin_num = _pin_num(pin)
     
-    if pin is None:
-        msg = "{} is not a valid pin number".format(pin_num)
-        logging.error(msg)
-        raise LookupError(msg)
-    
-    val = None
-    with PIN_LOX[pin_num]:
-        val = pin.value
-            
-    return {pin_num : val}
+    with PIN_STATE.lock.read():
+        return state.Versioned(_get_pin(pin_num), PIN_STATE.version)
 
 def list_pins():
     """
-    Get the value of all the pins.
+    Get the value of all the pins, from one consistent snapshot of the state.
     
     @see        `get_pin()` for the specific reading implementation
-    @return     list        list of {pin:val} dicts
+    @return     Versioned   list of {pin:val} dicts, and the version of the
+    pin state they were read at
     """
-    pin_stats = []
-    
-    for pin_num in PINS.keys():
-        try:
-            pin_stats.append(get_pin(pin_num))
-        except LookupError:
-            msg = "`get_pin()` raised LookupError when there should be none."
-            logging.warning(msg)
-            
-    return pin_stats
+    pins = PIN_STATE.snapshot()
+    return state.Versioned(
+        [{pin_num : val} for pin_num, val in pins.data.items()], pins.version
+    )
 
-def get_channel(channel):
+def get_channel(channel, max_age=None):
     """
     Get the value of a single channel.
     
+    The value is the channel's latest sample, see `sampler.py`. The channel is
+    only read from the hardware when there is no sample, or when the latest
+    one is older than `max_age`.
+    
     @post       fetches the value of the channel specified
     
     @raises     LookupError when the specified `chnl_num` paramater is invalid
@@ -166,40 +489,221 @@ def get_channel(channel):
     @see        `doc/ipc.md` for more informaton on the structure of `action`
     
     @param      int     chnl        the channel number to read
+    @param      float   max_age     the oldest sample acceptable, in seconds,
+    or None for any
     @return     dict    {chnl : val} where `chnl` is the chnl number and `val`
     is the val that the sensor channel is currently reading
     """
-    chnl_num = int(channel)
-    chnl = CHNLS.get(chnl_num, None)
+    chnl_num = _chnl_num(channel)
     
-    if chnl is None:
-        msg = "{} is not a valid channel number".format(chnl_num)
-        logging.error(msg)
-        raise LookupError(msg)
+    sample = SAMPLER.latest(chnl_num, max_age)
+    if sample is not None:
+        return {chnl_num : sample[1]}
     
-    val = None
-    with CHNL_LOX[chnl_num]:
-        val = chnl.value
-            
-    return {chnl_num : val}
+    with ADC_LOX[chnl_num]:
+        # another request may have sampled while we waited for the lock
+        return _get_channel(chnl_num, max_age)
 
-def list_channels():
+def list_channels(max_age=None):
     """
     Get the value of all the channels.
     
+    Channels without a sample recent enough are read first, together, in one
+    burst per driver, then every value is taken from one snapshot of the
+    sampler's table.
+    
     @see        `get_chnl()` for the specific reading implementation
-    @return     list        list of {pin:val} dicts
+    @return     Versioned   list of {chnl:val} dicts, and the version of the
+    sampler's table they were read at
+    """
+    _refresh_channels(list(CHNLS.keys()), max_age)
+    
+    # every channel has a recent enough sample now
+    return _list_channels()
+
+def get_history(channel, window=None, samples=True):
+    """
+    Get the recent samples of a channel, and aggregates over them.
+    
+    @raises     LookupError when the specified `channel` paramater is invalid
+    
+    @param      int     channel     the channel number
+    @param      float   window      how many seconds back to go, or None for
+    every sample kept (up to `GPIOConfig.HISTORY_SIZE`)
+    @param      bool    samples     whether to include the samples themselves,
+    or only the aggregates
+    @return     dict    {"channel", "count", "min", "max", "mean", "last",
+    "start", "end"} and, if asked for, "samples": [[timestamp, val], ...],
+    oldest first
     """
-    chnl_stats = []
+    chnl_num = _chnl_num(channel)
+    ring = HISTORY[chnl_num]
+    # the history is stamped with `monotonic()`, clients get the sampler's clock
+    since = None if window is None else SAMPLER.since(float(window))
     
-    for chnl_num in CHNLS.keys():
+    resp = ring.aggregate(since)
+    resp["channel"] = chnl_num
+    for key in ("start", "end"):
+        if resp[key] is not None:
+            resp[key] = SAMPLER.timestamp(resp[key])
+    if samples:
+        resp["samples"] = [(SAMPLER.timestamp(stamp), val) for stamp, val in ring.window(since)]
+    
+    return resp
+
+def get_many(pins=None, channels=None, max_age=None):
+    """
+    Get the values of several pins and channels in one action.
+    
+    The pins are read from one consistent snapshot of the pin state, and the
+    channels as `list_channels()` would: those without a sample recent enough
+    are read together first.
+    
+    @raises     LookupError when any of the pins or channels is invalid
+    @raises     ValueError  when `pins` or `channels` is not a list
+    
+    @param      list    pins        the pin numbers to read
+    @param      list    channels    the channel numbers to read
+    @param      float   max_age     the oldest channel sample acceptable, in
+    seconds, or None for any
+    @return     Versioned   {"pins": {pin : val}, "channels": {chnl : val}},
+    and the version of the pin state the pins were read at
+    """
+    pins = pins if pins else []
+    channels = channels if channels else []
+    if not isinstance(pins, list) or not isinstance(channels, list):
+        raise ValueError("`pins` and `channels` must be lists.")
+    
+    pin_nums = [_pin_num(pin) for pin in pins]
+    chnl_nums = [_chnl_num(channel) for channel in channels]
+    
+    with PIN_STATE.lock.read():
+        pin_vals = utils.merge_dicts(*(_get_pin(pin_num) for pin_num in pin_nums))
+        version = PIN_STATE.version
+    _refresh_channels(chnl_nums, max_age)
+    samples = SAMPLER.snapshot()
+    chnl_vals = {n : samples.data[n][1] for n in chnl_nums}
+    
+    return state.Versioned({"pins" : pin_vals, "channels" : chnl_vals}, version)
+
+def _valid_step(step):
+    """
+    Validates a batched action: a valid action, of a batchable type, whose pin
+    or channel number, if it takes one, is given as a number. Whether that is
+    a configured pin or channel is left to the step itself.
+    
+    @param      obj     step        the batched action, as sent by the client
+    @return     bool    whether the step can be batched
+    """
+    if not isinstance(step, dict) or not valid_action(step) \
+            or step['type'] not in BATCH_HANDLERS:
+        return False
+    
+    for param in BATCH_NUMBERS.get(step['type'], ()):
         try:
-            chnl_stats.append(get_channel(chnl_num))
-        except LookupError:
-            msg = "`get_channel()` raised LookupError when there should be none."
-            logging.warning(msg)
-            
-    return chnl_stats
+            int(step['params'][param])
+        except (KeyError, TypeError, ValueError):
+            return False
+    return True
+
+def _batch_locks(steps):
+    """
+    Collects the locks needed to run the given batched actions.
+    
+    Locks are returned in one fixed global order, the pin state lock (held
+    exclusively if any step sets a pin, shared otherwise), then every channel
+    lock by ascending channel number, so any two batches acquiring them cannot
+    deadlock. Unknown channels are skipped; the step using them will fail on
+    its own.
+    
+    @param      list    steps       the batched actions, validated by
+    `_valid_step()`
+    @return     list    the locks to acquire, in order, as context managers
+    """
+    pins, writes, chnls = False, False, set()
+    
+    for step in steps:
+        act_type, params = step['type'], step['params']
+        if act_type in (actions.Types.SET_PIN, actions.Types.GET_PIN, actions.Types.LIST_PINS):
+            pins = True
+            writes = writes or act_type == actions.Types.SET_PIN
+        elif act_type == actions.Types.GET_CHNL:
+            chnls.add(int(params.get('channel')))
+        elif act_type == actions.Types.LIST_CNLS:
+            chnls.update(CHNLS.keys())
+    
+    locks = [PIN_STATE.lock.write() if writes else PIN_STATE.lock.read()] if pins else []
+    return locks + [ADC_LOX[n] for n in sorted(chnls) if n in ADC_LOX]
+
+def batch(steps):
+    """
+    Runs several actions in order, as a single action.
+    
+    All the pin and channel locks the batch needs are held for its whole
+    duration, so no other request can observe it half-applied. A failing step
+    does not stop the steps after it.
+    
+    @raises     ValueError  if any of the batched actions is not a valid,
+    batchable action, see `_valid_step()`, in which case none of them are run
+    
+    @param      list    steps       list of action objects, as sent by clients
+    in the `actions` param
+    @return     list    one {"ok": ..., "data"|"error": ...} result per action,
+    in order
+    """
+    if not isinstance(steps, list):
+        raise ValueError("`actions` must be a list of actions.")
+    for step in steps:
+        if not _valid_step(step):
+            raise ValueError("Invalid batched action: {}".format(step))
+    
+    results = []
+    with ExitStack() as stack:
+        for lock in _batch_locks(steps):
+            stack.enter_context(lock)
+        
+        for step in steps:
+            try:
+                results.append(respond(BATCH_HANDLERS[step['type']](**step['params'])))
+            except Exception as err:
+                logging.error("Error handling batched command `%s`: %s", step['type'], err)
+                results.append({
+                    "ok" : False,
+                    "error": {"message" : "Error handling command."}
+                })
+    
+    return results
+
+def respond(data):
+    """
+    The successful response to an action, given the handler's result. Results
+    read from a versioned state are stamped with its version.
+    
+    @param      obj     data        what the handler returned
+    @return     dict    {"ok": True, "data": data[, "version": version]}
+    """
+    if isinstance(data, state.Versioned):
+        return {"ok" : True, "data" : data.data, "version" : data.version}
+    return {"ok" : True, "data" : data}
+
+def stats():
+    """
+    Get the server's metrics.
+    
+    @see        `metrics.Registry.snapshot()`
+    @return     dict    {name : {labels : value}}
+    """
+    return METRICS.snapshot()
+
+def get_clock():
+    """
+    Get the server's clock, for clients to follow: the virtual time of the
+    simulator backend, real time otherwise.
+    
+    @see        `embed.clock.Clock.params()`
+    @return     dict    {"speed", "start", "origin"}
+    """
+    return CLOCK.params()
 
 def echo(*args, **kwargs):
     """Echoes the given args and kwargs."""
@@ -211,11 +715,42 @@ HANDLERS = {
     actions.Types.LIST_PINS     : list_pins,
     actions.Types.GET_CHNL      : get_channel,
     actions.Types.LIST_CNLS     : list_channels,
+    actions.Types.GET_HIST      : get_history,
+    actions.Types.MULTI_GET     : get_many,
+    actions.Types.BATCH         : lambda **params: batch(params.get('actions')),
+    actions.Types.STATS         : stats,
+    actions.Types.CLOCK         : get_clock,
     "default"   : echo
 }
 
+# handlers for the actions that can be batched; these expect the batch to
+# already hold every lock they need
+BATCH_HANDLERS = {
+    actions.Types.SET_PIN       : lambda pin, val: state.Versioned(
+        _set_pin(_pin_num(pin), val), PIN_STATE.version
+    ),
+    actions.Types.GET_PIN       : lambda pin: state.Versioned(
+        _get_pin(_pin_num(pin)), PIN_STATE.version
+    ),
+    actions.Types.LIST_PINS     : lambda: state.Versioned(
+        [_get_pin(n) for n in PINS.keys()], PIN_STATE.version
+    ),
+    actions.Types.GET_CHNL      : lambda channel, max_age=None: _get_channel(_chnl_num(channel), max_age),
+    actions.Types.LIST_CNLS     : _list_channels,
+}
+
+# the params of batchable actions that must be pin or channel numbers
+BATCH_NUMBERS = {
+    actions.Types.SET_PIN       : ('pin',),
+    actions.Types.GET_PIN       : ('pin',),
+    actions.Types.GET_CHNL      : ('channel',),
+}
+
 COMMANDS = set(HANDLERS.keys())
 
+# actions that change the GPIO state
+MUTATING = {actions.Types.SET_PIN}
+
 ############################## HANDLERS/VALIDATOR ##############################
 
 @utils.assert_to_false
@@ -250,8 +785,42 @@ def valid_action(action):
         pass # none
     return True
     
+def journal_fname(fname):
+    """
+    @return     str     the journal file kept alongside the snapshot `fname`
+    """
+    return fname + '.journal'
+
+def mutates(action):
+    """
+    Whether the given (valid) action changes the GPIO state, and so requires
+    saving it.
+    """
+    if action.get('type') == actions.Types.BATCH:
+        steps = action['params'].get('actions')
+        return isinstance(steps, list) and any(
+            isinstance(step, dict) and mutates(step) for step in steps
+        )
+    return action.get('type') in MUTATING
+
 ############################### HANDLERS/MATCHER ###############################
 
+def busy(action=None):
+    """
+    The response to a request the server has no room for. Clients may try
+    again later.
+    
+    @param      obj     action      the parsed action, if any, whose id to echo
+    @return     dict    the error response
+    """
+    resp = {
+        "ok" : False,
+        "error": {"message" : "Server busy, try again later.", "busy" : True}
+    }
+    if isinstance(action, dict) and action.get('id') is not None:
+        resp["id"] = action['id']
+    return resp
+
 def match_handler(act_type):
     """
     Returns and action handler based on the given action type `act_type`.
@@ -280,6 +849,23 @@ def match_handler(act_type):
 
 #################################### SERVER ####################################
 
+class Session(object):
+    """
+    Protocol state of a single connection.
+    
+    @attr   str                 id              the connection's id in `Server.socks`
+    @attr   codec.JSONCodec     codec           the codec negotiated with `HELLO`
+    @attr   Subscription        subscription    set once the client subscribes,
+    after which the connection only streams updates
+    """
+    
+    def __init__(self, _id):
+        self.id = _id
+        self.codec = codec.JSON
+        self.subscription = None
+        # one response sent at a time, when requests run concurrently
+        self.send_lock = threading.Lock()
+
 class Server(object):
     """
     Receives connections requests to access the GPIO, validates and acts upon them.
@@ -292,8 +878,13 @@ class Server(object):
     @attr   set     COMMANDS    set containing command names
     
     @method bool    valid_action(action)    Validates the given action object.
-    @method None    handle(conn)            Parse, validate and dispatch a
-    message from the connection.
+    @method dict    process(raw, session)   Parse, validate and dispatch a
+    single message.
+    @method dict    dispatch(action)        Validate and dispatch an action.
+    @method None    stream(conn, session)   Stream subscription updates over
+    the connection.
+    @method None    handle(conn)            Serve messages from the connection
+    until it is closed.
     @method None    listen                  Continuously listens for new
     connections to the server at (addr, port).
     """
@@ -301,7 +892,7 @@ class Server(object):
     fname = config.GPIOConfig.FILENAME
     
     @classmethod
-    def from_file(cls, fname, addr=None, num_workers=None):
+    def from_file(cls, fname, addr=None, num_workers=None, path=None):
         """
         Initilazes the server with the given pin states.
         
@@ -312,7 +903,9 @@ class Server(object):
         try:
             with open(fname, 'r') as file:
                 data = json.load(file)
-                states = utils.merge_dicts(*data["pins"])
+                states = {
+                    int(pin) : val for pin, val in utils.merge_dicts(*data["pins"]).items()
+                }
         except OSError:
             # account for non-existent file
             logging.warning("Error opening: `%s`, creating file, starting \
@@ -324,128 +917,793 @@ server with zeroed GPIOs", fname)
             logging.warning("Error deserializing GPIO states from `%s`, \
 starting server with zeroed GPIOs", fname)
         
-        return Server.from_state(states, addr=addr, num_workers=num_workers)
+        # then replay the changes made since the snapshot was taken
+        states.update(journal.replay(journal_fname(fname)))
+        
+        return cls.from_state(states, addr=addr, num_workers=num_workers,
+                              fname=fname, path=path)
     
     @classmethod
-    def from_state(cls, pin_states, addr=None, num_workers=None, fname=None):
+    def from_state(cls, pin_states, addr=None, num_workers=None, fname=None, path=None):
         """
         Initilazes the server with the given pin states.
         
         @param      dict    pin_states  
         """
+        init_hardware()
         for pin, state in pin_states.items():
             set_pin(pin, state)
         
-        return Server(addr=addr, num_workers=num_workers, fname=fname)
+        return cls(addr=addr, num_workers=num_workers, fname=fname, path=path)
     
-    def __init__(self, addr=None, num_workers=None, fname=None):
+    def __init__(self, addr=None, num_workers=None, fname=None, path=None):
         """
         Constructor for the Server class.
         
         @param      str     addr        the adress to bind the server to
         @param      int     num_workers the number of threads to create
+        @param      str     fname       the file to save the GPIO state to
+        @param      str     path        the unix domain socket path to also
+        listen on, defaults to `NetworkConfig.SOCKET_PATH`; '' to disable
         @return     Server  the GPIO server object
         """
+        start = perf_counter()
+        init_hardware()
+        
         # savefile config
         self.fname = fname if fname else self.fname
         
         # network config
         self.addr = addr if addr else config.NetworkConfig.HOST
         self.num_workers = num_workers if num_workers else config.NetworkConfig.MAX_THREADS
+        self.max_pending = config.NetworkConfig.MAX_PENDING
+        self.max_connections = config.NetworkConfig.MAX_CONNECTIONS
+        self.path = config.NetworkConfig.SOCKET_PATH if path is None else path
         self.encoding = config.NetworkConfig.ENCODING
         
         # creating sockets
         self.sock = sock.Socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socks = {}
+        self.listeners = []
+        self.closing = threading.Event()
         
-        # create thread pool
+        # create thread pool, with room for `max_pending` requests
         self.workers = ThreadPoolExecutor(max_workers=self.num_workers)
+        self.admission = threading.BoundedSemaphore(self.max_pending)
         
-        # save initial state
+        # journal every pin change, starting from a snapshot of the initial
+        # state, and compact the journal periodically in the background
+        self.journal = journal.Journal(
+            journal_fname(self.fname),
+            state=PIN_STATE.snapshot().data,
+            sync=config.GPIOConfig.JOURNAL_SYNC
+        )
+        HUB.add(self.journal)
         self.save_state()
+        self.writer = persist.DeferredWriter(self.save_state, config.GPIOConfig.COMPACT_INTERVAL)
+        self.writer.start()
+        # unless every change is synced as it is journaled, sync them in
+        # groups, shortly after
+        self.committer = persist.DeferredWriter(
+            self.journal.commit, config.GPIOConfig.JOURNAL_COMMIT_INTERVAL
+        )
+        self.committer.start()
+        
+        # mirror the state to shared memory, for readers on this host
+        self.shared = self.share_state(config.GPIOConfig.SHM_PATH)
+        
+        # export the metrics periodically, and trace a sample of requests
+        METRICS.gauge('gpio_connections', lambda: len(self.socks))
+        self.exporter = self.export_metrics(config.GPIOConfig.METRICS_FILE)
+        self.tracer = self.trace_requests(config.GPIOConfig.TRACE_FILE)
+        
+        # hooks around every dispatch, see `middleware.py`
+        self.middleware = []
+        
+        # start sampling the channels
+        _start_sampler()
+        
+        startup = perf_counter() - start
+        METRICS.gauge('gpio_startup_seconds', lambda: startup, phase='server')
+    
+    def share_state(self, path):
+        """
+        Publishes the GPIO state to a shared-memory segment, see `shm.py`, and
+        keeps it updated with every change published to `HUB`.
+        
+        @param      str     path        the segment's file, or None to not
+        share the state
+        @return     shm.SharedState     the segment, or None if not shared
+        """
+        if not path:
+            return None
+        
+        try:
+            shared = shm.SharedState(path, pins=PINS.keys(), channels=CHNLS.keys())
+        except OSError as err:
+            logging.warning("Error creating shared state `%s`: %s", path, err)
+            return None
+        
+        # register first, so no change between the snapshot and now is missed
+        HUB.add(shared)
+        for pin_num, val in PIN_STATE.snapshot().data.items():
+            shared.write_pin(pin_num, val)
+        for chnl_num in CHNLS.keys():
+            sample = SAMPLER.latest(chnl_num)
+            if sample is not None:
+                shared.write_channel(chnl_num, SAMPLER.timestamp(sample[0]), sample[1])
+        
+        return shared
+    
+    def export_metrics(self, fname):
+        """
+        Writes `METRICS` to a Prometheus text-format file every
+        `GPIOConfig.METRICS_INTERVAL` seconds, in the background.
+        
+        @param      str     fname       the file, or None to not export
+        @return     metrics.Exporter    the exporter, or None if not exporting
+        """
+        if not fname:
+            return None
+        
+        exporter = metrics.Exporter(METRICS, fname, config.GPIOConfig.METRICS_INTERVAL)
+        exporter.start()
+        return exporter
+    
+    def trace_requests(self, fname):
+        """
+        Traces `GPIOConfig.TRACE_RATE` of the requests, see `tracing.py`.
+        
+        @param      str     fname       the trace file, or None to not trace
+        @return     tracing.Tracer      the tracer, or None if not tracing
+        """
+        if not fname or config.GPIOConfig.TRACE_RATE <= 0:
+            return None
+        
+        try:
+            return tracing.Tracer(
+                fname, config.GPIOConfig.TRACE_RATE, config.GPIOConfig.TRACE_MAX_SIZE
+            )
+        except OSError as err:
+            logging.warning("Error opening trace file `%s`: %s", fname, err)
+            return None
+    
+    def begin_trace(self, raw):
+        """
+        Starts tracing a request just received, if it is sampled.
+        
+        @param      bytes       raw         the serialized action
+        @return     tracing.Trace   its trace, or `tracing.NULL`
+        """
+        if self.tracer is None:
+            return tracing.NULL
+        
+        trace = self.tracer.start(bytes=len(raw))
+        trace.event('receive')
+        return trace
+    
+    def use(self, middleware):
+        """
+        Adds a middleware to the end of the dispatch chain.
+        
+        @param      middleware.Middleware   middleware  the middleware
+        @return     None
+        """
+        self.middleware.append(middleware)
     
     def save_state(self):
         """
         Saves the state of the GPIO to disk in the filename specified at construction.
         
+        Every pin change is already in the journal as it happens; this compacts
+        the journal into the snapshot file, see `journal.py`. The file is
+        replaced atomically, so a crash mid-write leaves the previous state
+        intact. Requests do not call this directly: mutations mark the state
+        dirty, and `self.writer` compacts it `GPIOConfig.COMPACT_INTERVAL`
+        seconds later.
+        
         @post       the state of the GPIO will be saved to the disk. If the file
         does not exist, it will be created.
         
         @returns    None
         """
         try:
-            with SAVEFILE_LOCK:
-                with open(self.fname, 'w') as file:
-                    json.dump({"timestamp" : time(), "pins" : list_pins()}, file)
-        except OSError as err:
+            with METRICS.timer('gpio_save_seconds'):
+                self.journal.compact(self.write_snapshot)
+        except OSError:
             # account for incorrect file
-            logging.warning("Error writing GPIO states to file `%s`", self.fname)
-            print(err)
+            logging.exception("Error writing GPIO states to file `%s`", self.fname)
     
-    def handle(self, conn, _id):
+    def write_snapshot(self, states):
         """
-        Parse, validate and dispatch a message from the connection.
+        Atomically replaces the snapshot file with the given pin states.
         
-        @pre        the socket `conn` must be open and initialized
-        @post       the socket will be closed
+        @param      dict    states      {pin : val}
+        @returns    None
+        """
+        with SAVEFILE_LOCK:
+            persist.write_atomic(self.fname, json.dumps({
+                "timestamp" : time(),
+                "pins" : [{pin : val} for pin, val in states.items()]
+            }))
+    
+    def close(self):
+        """
+        Stops what the server started: accepting connections, then the worker
+        pool, once the requests queued finish, and the sampler; compacts the
+        journal one last time and stops saving in the background; marks the
+        shared state closed; and stops exporting metrics and traces. Call when
+        shutting the server down; calling it again does nothing.
         
-        @param      socket.socket       conn        the socket object
-        @return     None
+        @returns    None
         """
-        with conn:
-            # receive full transmission
-            chunks = conn.recv(1024)
-            if not chunks:
-                return
-            
-            # parse
+        if self.closing.is_set():
+            return
+        self.closing.set()
+        
+        self.stop_listening()
+        self.workers.shutdown(wait=True)
+        SAMPLER.stop()
+        if SAMPLER.ident is not None:
+            SAMPLER.join()
+        
+        self.committer.stop()
+        self.writer.stop()
+        HUB.remove(self.journal)
+        self.journal.close()
+        
+        if self.shared is not None:
+            HUB.remove(self.shared)
+            self.shared.close()
+        
+        if self.exporter is not None:
+            self.exporter.stop()
+        if self.tracer is not None:
+            self.tracer.close()
+    
+    def stop_listening(self):
+        """
+        Closes the listening sockets, ending the accept loops. Connections
+        already open stay open, but their requests are answered with `busy()`
+        once the worker pool is shut down.
+        
+        @returns    None
+        """
+        # the unix socket first: `listen()` closes it once the TCP one is
+        for lsock in reversed(self.listeners):
             try:
-                raw = str(chunks, self.encoding)
-                action = json.loads(raw)
-                logging.info("received: %s", action)
-            except ValueError:
-                logging.error("Error deserializing action: %s", raw)
-                return
-            
-            # validate
-            if not valid_action(action):
-                logging.error("Invalid command: '%s'", action['type'])
-                return
-            
-            # dispatch
+                # wakes the thread blocked accepting on it, which then sees
+                # `closing` and returns
+                with socket.socket(lsock.family, socket.SOCK_STREAM) as wake:
+                    wake.connect(lsock.getsockname())
+            except OSError:
+                pass
+            lsock.close()
+    
+    def process(self, raw, session):
+        """
+        Parse, validate and dispatch a single serialized action.
+        
+        @see        `decode()` and `execute()`
+        
+        @param      bytes       raw         the serialized action
+        @param      Session     session     the connection's state
+        @return     dict        the response to send back, encoded with the
+        codec the session had before the call
+        """
+        return self.execute(self.decode(raw, session), session)
+    
+    def decode(self, raw, session):
+        """
+        Parses a single serialized action, with the session's codec.
+        
+        @param      bytes       raw         the serialized action
+        @param      Session     session     the connection's state
+        @return     obj         the action, or None if it could not be parsed
+        """
+        try:
+            action = session.codec.decode_action(raw)
+            logging.info("received: %s", action)
+            return action
+        except ValueError:
+            logging.error("Error deserializing action: %s", raw)
+            return None
+    
+    def submit(self, action, session, trace=tracing.NULL):
+        """
+        Queues a parsed action to be executed by the worker pool, if there is
+        room: no more than `NetworkConfig.MAX_PENDING` requests wait or run at
+        once, so a burst cannot grow the queue, and its latency, without bound.
+        
+        @param      obj         action      the parsed action
+        @param      Session     session     the connection's state
+        @param      Trace       trace       the request's trace
+        @return     Future      the `execute()` call, or None if the server is
+        busy, in which case the request should be answered with `busy()`
+        """
+        if not self.admission.acquire(blocking=False):
+            logging.warning("Busy, refusing a request from connection %s", session.id)
+            METRICS.count('gpio_requests_busy_total')
+            trace.set(busy=True)
+            return None
+        
+        METRICS.add('gpio_requests_queued', 1)
+        try:
+            work = self.workers.submit(self.run, action, session, perf_counter(), trace)
+        except BaseException as err:
+            METRICS.add('gpio_requests_queued', -1)
+            self.admission.release()
+            if isinstance(err, RuntimeError) and self.closing.is_set():
+                # the worker pool is shut down, see `close()`
+                logging.warning("Closing, refusing a request from connection %s", session.id)
+                trace.set(busy=True)
+                return None
+            raise
+        work.add_done_callback(lambda _: self.admission.release())
+        return work
+    
+    def run(self, action, session, queued, trace):
+        """
+        Executes an action queued by `submit()`, in a worker.
+        
+        @param      float   queued      when it was queued, by `perf_counter()`
+        @param      Trace   trace       the request's trace
+        @see        `execute()` for the other parameters, and the return value
+        """
+        waited = perf_counter() - queued
+        METRICS.add('gpio_requests_queued', -1)
+        METRICS.observe('gpio_queue_wait_seconds', waited)
+        trace.event('queue', waited)
+        
+        METRICS.add('gpio_requests_running', 1)
+        try:
+            with tracing.activate(trace):
+                return self.execute(action, session)
+        finally:
+            METRICS.add('gpio_requests_running', -1)
+    
+    def concurrent(self, action):
+        """
+        Whether a parsed action may run concurrently with the connection's
+        other requests, its reply possibly overtaking theirs: it must carry an
+        "id" for the client to match the reply by, and not change the
+        connection's state.
+        
+        @param      obj         action      the parsed action
+        @return     bool
+        """
+        return isinstance(action, dict) and action.get('id') is not None \
+            and action.get('type') not in (actions.Types.HELLO, actions.Types.SUBSCRIBE)
+    
+    def execute(self, action, session):
+        """
+        Validate and dispatch a single parsed action.
+        
+        Connection-level actions are answered here rather than dispatched:
+        `HELLO` picks the codec the rest of the connection will use, and `SUB`
+        turns the connection into a stream of updates. The response echoes the
+        action's "id", if it has one.
+        
+        @see        `doc/ipc.md` for the structure of actions and responses
+        
+        @param      obj         action      the parsed action, or None if it
+        could not be parsed
+        @param      Session     session     the connection's state
+        @return     dict        the response to send back
+        """
+        start = perf_counter()
+        act_type = action.get('type') if isinstance(action, dict) else None
+        params = action.get('params') if isinstance(action, dict) else None
+        params = params if isinstance(params, dict) else {}
+        
+        if action is None:
+            resp = {
+                "ok" : False,
+                "error": {"message" : "Could not deserialize action."}
+            }
+        elif act_type == actions.Types.HELLO:
+            # negotiate
+            offered = params.get('encodings', [])
+            session.codec = codec.negotiate(offered if isinstance(offered, list) else [])
+            resp = {"ok" : True, "data" : {"encoding" : session.codec.name}}
+        elif act_type == actions.Types.SUBSCRIBE:
+            # subscribe
             try:
-                # match and execute
-                resp = match_handler(action["type"])(**action["params"])
-                
-                self.save_state()
-                
-                # respond
-                resp = {"ok" : True, "data": resp}
-            except KeyError:
-                resp = {
-                    "ok" : False,
-                    "error": {"message" : "Could not match command to handler."}
-                }
-                logging.error("Could not match command `%s` to handler", action['type'])
+                resp = {"ok" : True, "data" : self.subscribe(session, **params)}
             except Exception as err:
+                logging.error("Error subscribing: %s", err)
                 resp = {
                     "ok" : False,
-                    "error": {"message" : "Error handling command."}
+                    "error": {"message" : "Invalid subscription."}
                 }
-                logging.error("Error handling command `%s`: %s", action['type'], err)
+        else:
+            resp = self.dispatch(action)
+        
+        # known action types only, so clients cannot add series at will
+        label = act_type if isinstance(act_type, str) and (act_type in COMMANDS or act_type in (
+            actions.Types.HELLO, actions.Types.SUBSCRIBE)) else "invalid"
+        METRICS.observe('gpio_request_seconds', perf_counter() - start, action=label)
+        METRICS.count('gpio_requests_total', action=label, ok=str(resp['ok']).lower())
+        tracing.current().set(action=label, ok=resp['ok'])
+        
+        if isinstance(action, dict) and action.get('id') is not None:
+            resp["id"] = action['id']
+        return resp
+    
+    def subscribe(self, session, pins=None, channels=None, deadband=0, interval=None):
+        """
+        Subscribes the connection to changes of the given pins and channels.
+        
+        @raises     LookupError if a pin or channel number is invalid
+        @raises     ValueError  if nothing is subscribed to, or the deadband or
+        interval is invalid
+        
+        @param      Session     session     the connection's state
+        @param      list        pins        the pin numbers to watch
+        @param      list        channels    the channel numbers to watch
+        @param      float       deadband    the smallest change in a value
+        worth reporting
+        @param      float       interval    the minimum number of seconds
+        between updates, no less than `GPIOConfig.SUB_MIN_INTERVAL`
+        @return     dict        the current values, {"pins": {num: val},
+        "channels": {num: val}}
+        """
+        if interval is None:
+            interval = config.GPIOConfig.SUB_INTERVAL
+        
+        sub = pubsub.Subscription(
+            pins=[_pin_num(pin) for pin in (pins if pins else [])],
+            channels=[_chnl_num(chnl) for chnl in (channels if channels else [])],
+            deadband=float(deadband),
+            interval=max(float(interval), config.GPIOConfig.SUB_MIN_INTERVAL)
+        )
+        if not (sub.pins or sub.channels) or sub.deadband < 0:
+            raise ValueError("Nothing to subscribe to.")
+        
+        # register first, so no change between the snapshot and now is missed
+        HUB.add(sub)
+        try:
+            for pin_num in sub.pins:
+                sub.offer(pubsub.PIN, pin_num, get_pin(pin_num).data[pin_num])
+            for chnl_num in sub.channels:
+                sub.offer(pubsub.CHANNEL, chnl_num, get_channel(chnl_num)[chnl_num])
+        except Exception:
+            HUB.remove(sub)
+            raise
+        
+        session.subscription = sub
+        return sub.take()
+    
+    def poll(self, sub):
+        """
+        Makes sure the subscription's channels have been sampled within its
+        interval, reading the ones that have not.
+        
+        Changes reach the subscription as they are published: pins when they
+        are set, and channels when they are sampled.
+        
+        @param      Subscription    sub     the subscription
+        @return     None
+        """
+        for chnl_num in sub.channels:
+            get_channel(chnl_num, max_age=sub.interval)
+    
+    def submit_poll(self, sub):
+        """
+        Queues a `poll()` of the subscription to the worker pool, like a
+        request: it counts towards `NetworkConfig.MAX_PENDING`, so streams read
+        the hardware within the same limits as requests.
+        
+        @param      Subscription    sub     the subscription
+        @return     Future      the `poll()` call, or None if the server is
+        busy, in which case the poll is skipped: the subscription still gets
+        the samples the sampler takes
+        """
+        if not self.admission.acquire(blocking=False):
+            logging.debug("Busy, skipping a poll of subscription %s", sub)
+            return None
+        
+        try:
+            work = self.workers.submit(self.poll, sub)
+        except BaseException as err:
+            self.admission.release()
+            if isinstance(err, RuntimeError) and self.closing.is_set():
+                return None
+            raise
+        work.add_done_callback(lambda _: self.admission.release())
+        return work
+    
+    def stream(self, conn, session):
+        """
+        Sends the subscription's updates over the connection, at most one every
+        `interval` seconds, until the client closes the connection or sends
+        anything.
+        
+        @raises     OSError     if sending fails
+        
+        @param      sock.Socket     conn        the subscribed connection
+        @param      Session         session     the connection's state
+        @return     None
+        """
+        sub = session.subscription
+        try:
+            while True:
+                readable, _, _ = select.select([conn], [], [], sub.interval)
+                if readable:
+                    break
                 
-            logging.info("responded: %s", resp)
-            conn.sendall(bytes(json.dumps(resp), self.encoding))
+                work = self.submit_poll(sub)
+                if work is not None:
+                    work.result()
+                update = sub.take()
+                if update is not None:
+                    self.reply(conn, session, session.codec, {"ok" : True, "data" : update})
+        finally:
+            HUB.remove(sub)
+    
+    def dispatch(self, action):
+        """
+        Validate and dispatch a single action.
+        
+        @param      dict        action      the deserialized action
+        @return     dict        the response to send back
+        """
+        # validate
+        with tracing.span('validate'):
+            valid = isinstance(action, dict) and valid_action(action)
+        if not valid:
+            logging.error("Invalid action: '%s'", action)
+            return {
+                "ok" : False,
+                "error": {"message" : "Invalid action."}
+            }
+        
+        # dispatch
+        try:
+            # match and execute
+            resp = self.call_handler(match_handler(action["type"]), action)
             
-            conn.shutdown(socket.SHUT_RDWR)
+            if mutates(action):
+                self.committer.mark_dirty()
+                self.writer.mark_dirty()
             
-            # cleanup
-            del self.socks[_id]
+            # respond
+            resp = respond(resp)
+        except KeyError:
+            resp = {
+                "ok" : False,
+                "error": {"message" : "Could not match command to handler."}
+            }
+            logging.error("Could not match command `%s` to handler", action['type'])
+        except Exception as err:
+            if action['type'] == actions.Types.BATCH and isinstance(err, ValueError):
+                # `batch()` refuses a batch whole, before running any of it
+                message = "Invalid batched action."
+            else:
+                message = "Error handling command."
+            resp = {
+                "ok" : False,
+                "error": {"message" : message}
+            }
+            logging.error("Error handling command `%s`: %s", action['type'], err)
+        
+        return resp
+    
+    def call_handler(self, handler, action):
+        """
+        Calls an action's handler through the middleware chain, see
+        `middleware.py`.
+        
+        @raises     Exception   whatever the handler or a `before()` hook
+        raised, after the `error()` hooks saw it
+        
+        @param      func        handler     the action's handler
+        @param      dict        action      the validated action
+        @return     obj         the handler's result, as the `after()` hooks
+        left it
+        """
+        try:
+            for middleware in self.middleware:
+                middleware.before(action)
+            with tracing.span('handle'):
+                result = handler(**action["params"])
+        except Exception as err:
+            for middleware in reversed(self.middleware):
+                middleware.error(action, err)
+            raise
+        
+        for middleware in reversed(self.middleware):
+            result = middleware.after(action, result)
+        return result
+    
+    def handle(self, conn, _id):
+        """
+        Serve request/response pairs from the connection until the client
+        closes it.
+        
+        @pre        the socket `conn` must be open and initialized
+        @post       the socket will be closed
+        
+        @param      sock.Socket         conn        the socket object
+        @param      str                 _id         the connection's id in `self.socks`
+        @return     None
+        """
+        session = Session(_id)
+        
+        try:
+            self.serve_connection(conn, session)
+        finally:
+            # cleanup, however the connection ended
+            self.socks.pop(_id, None)
+    
+    def serve_connection(self, conn, session):
+        """
+        Serves request/response pairs from the connection until the client
+        closes it.
+        
+        @see        `handle()`
+        
+        @param      sock.Socket         conn        the socket object
+        @param      Session             session     the connection's state
+        @return     None
+        """
+        _id = session.id
+        
+        with conn:
+            while True:
+                # receive one full message
+                try:
+                    chunks = conn.recv_var()
+                except (OSError, ValueError) as err:
+                    logging.error("Error receiving from connection %s: %s", _id, err)
+                    break
+                
+                if chunks is None:
+                    # client closed the connection
+                    break
+                
+                trace = self.begin_trace(chunks)
+                conn_codec = session.codec
+                with trace.span('decode'):
+                    action = self.decode(chunks, session)
+                work = self.submit(action, session, trace)
+                
+                if work is None:
+                    resp = busy(action)
+                elif self.concurrent(action):
+                    # reply whenever it is done, and read on meanwhile
+                    work.add_done_callback(
+                        lambda done, codec=conn_codec, trace=trace:
+                            self.reply_done(conn, session, codec, done, trace)
+                    )
+                    continue
+                else:
+                    resp = work.result()
+                
+                try:
+                    self.reply(conn, session, conn_codec, resp, trace)
+                    
+                    if session.subscription is not None:
+                        self.stream(conn, session)
+                        break
+                except OSError as err:
+                    logging.error("Error responding to connection %s: %s", _id, err)
+                    break
+    
+    def reply(self, conn, session, conn_codec, resp, trace=tracing.NULL):
+        """
+        Sends a response over the connection, and finishes the request's
+        trace. Responses finishing at once are sent one after the other, never
+        interleaved.
+        
+        @raises     OSError     if sending fails
+        
+        @param      sock.Socket     conn        the connection
+        @param      Session         session     the connection's state
+        @param      JSONCodec       conn_codec  the codec to encode with
+        @param      dict            resp        the response
+        @param      Trace           trace       the request's trace
+        @return     None
+        """
+        logging.info("responded: %s", resp)
+        try:
+            with trace.span('respond'):
+                data = conn_codec.encode_response(resp)
+                with session.send_lock:
+                    conn.send_var(data)
+        finally:
+            trace.finish()
+    
+    def reply_done(self, conn, session, conn_codec, done, trace=tracing.NULL):
+        """
+        Sends the response of an action run concurrently, once it is done.
+        
+        @param      Future      done        the finished `execute()` call
+        @see        `reply()` for the other parameters
+        @return     None
+        """
+        try:
+            self.reply(conn, session, conn_codec, done.result(), trace)
+        except Exception as err:
+            logging.error("Error responding to connection %s: %s", session.id, err)
                 
+    def clear_path(self):
+        """
+        Removes a stale socket file left at the unix socket path.
+        
+        @return     None
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+    
+    def accept(self, lsock):
+        """
+        Continuously accepts connections on the listening socket, serving each
+        from a thread of its own. The threads mostly wait on their
+        connections; the actions themselves run in the worker pool, so no more
+        than `num_workers` touch the GPIO at once however many clients keep
+        connections open.
+        
+        @param      sock.Socket     lsock       the bound, listening socket
+        @return     None
+        """
+        while True:
+            try:
+                conn, _ = lsock.accept()
+            except OSError:
+                if self.closing.is_set():
+                    # closed by `stop_listening()`
+                    return
+                raise
+            if self.closing.is_set():
+                conn.close()
+                return
+            if conn:
+                if len(self.socks) >= self.max_connections:
+                    self.refuse(conn)
+                    continue
+                
+                _id = str(uuid()).split('-')[-1]
+                if conn.family != socket.AF_UNIX:
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.socks[_id] = conn
+                try:
+                    threading.Thread(
+                        target=self.handle, args=(conn, _id), name="conn-" + _id, daemon=True
+                    ).start()
+                except RuntimeError as err:
+                    logging.error("Error starting a thread for connection %s: %s", _id, err)
+                    self.socks.pop(_id, None)
+                    conn.close()
+    
+    def refuse(self, conn):
+        """
+        Turns a connection away, once `NetworkConfig.MAX_CONNECTIONS` are
+        open, answering the first request with `busy()` unread. The connection
+        is then drained, in a thread of its own, for up to
+        `NetworkConfig.REFUSE_LINGER` seconds before it is closed, so the
+        client's request does not make the close a reset that loses the reply.
+        
+        @param      sock.Socket     conn        the new connection
+        @return     None
+        """
+        logging.warning("Refusing a connection, %d open", len(self.socks))
+        try:
+            conn.send_var(codec.JSON.encode_response(busy()))
+            threading.Thread(
+                target=conn.linger_close, args=(config.NetworkConfig.REFUSE_LINGER,),
+                name="refused", daemon=True
+            ).start()
+        except (OSError, RuntimeError):
+            conn.close()
+    
     def listen(self, port=None):
         """
-        Continuously listens for new connections to the server at (addr, port).
+        Continuously listens for new connections to the server at (addr, port),
+        and at the unix socket path, if one is configured.
         
         @param      int     port        the port to for the server listen on
         @return     None
@@ -454,12 +1712,24 @@ starting server with zeroed GPIOs", fname)
         with self.sock:
             self.sock.bind((self.addr, port))
             self.sock.listen(5)
+            self.listeners.append(self.sock)
             
             logging.info("listening at %s:%d", self.addr, port)
             
-            while True:
-                conn, _ = self.sock.accept()
-                if conn:
-                    _id = str(uuid()).split('-')[-1]
-                    self.workers.submit(self.handle, conn, _id)
-                    self.socks[_id] = conn
+            if not self.path:
+                self.accept(self.sock)
+                return
+            
+            self.clear_path()
+            with sock.Socket(socket.AF_UNIX, socket.SOCK_STREAM) as usock:
+                usock.bind(self.path)
+                usock.listen(5)
+                self.listeners.append(usock)
+                
+                logging.info("listening at %s", self.path)
+                
+                try:
+                    threading.Thread(target=self.accept, args=(usock,), daemon=True).start()
+                    self.accept(self.sock)
+                finally:
+                    self.clear_path()
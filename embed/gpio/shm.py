@@ -0,0 +1,343 @@
+"""
+@name   Shared Memory
+@desc   Shared-memory snapshot of the GPIO state, for same-host readers.
+
+The server publishes every pin state and channel sample into a file mapped in
+shared memory (`GPIOConfig.SHM_PATH`, on tmpfs), laid out as:
+
+    header      magic "HGPS", closed flag (uint8), sequence (uint64), pin
+                count (uint16), channel count (uint16)
+    pins        per pin: number (uint8), value (double)
+    channels    per channel: number (uint8), timestamp (double), value (double)
+
+all big-endian, with missing values as NaN. Processes on the same host read
+it through `LocalReader` without a socket round trip or any decoding beyond
+`struct`.
+
+The single writer guards its updates with a sequence counter (a seqlock): it
+makes the sequence odd before changing the mapping and even again after.
+Readers copy the mapping and retry when the sequence was odd or changed
+during the copy, so they never see a half-written update, and never block the
+server.
+"""
+
+import os
+import math
+import mmap
+import struct
+import threading
+from time import sleep
+from numbers import Real as REAL_NUMS
+
+from . import pubsub
+from .client import Client
+from .. import config
+from ..clock import CLOCK
+
+MAGIC = b'HGPS'
+HEADER = struct.Struct('!4sBQHH')
+SEQ = struct.Struct('!Q')
+SEQ_OFFSET = 5
+CLOSED_OFFSET = 4
+PIN_SLOT = struct.Struct('!Bd')
+CHNL_SLOT = struct.Struct('!Bdd')
+
+# copies attempted before yielding to the writer
+SPINS = 100
+
+def size(num_pins, num_chnls):
+    """
+    @return     int     the size of a segment holding the given number of pins
+    and channels, in bytes
+    """
+    return HEADER.size + num_pins * PIN_SLOT.size + num_chnls * CHNL_SLOT.size
+
+def _pack_value(val):
+    """Missing or non-numeric values as NaN."""
+    return float(val) if isinstance(val, REAL_NUMS) else math.nan
+
+def _unpack_value(val):
+    """NaN back to None, and whole numbers back to ints, as pins are usually 0 or 1."""
+    if math.isnan(val):
+        return None
+    return int(val) if val.is_integer() else val
+
+class SharedState(object):
+    """
+    The writing side of the segment, owned by the server.
+
+    Registered with the server's `pubsub.Hub`, it mirrors every pin change and
+    channel sample published there.
+    """
+
+    def __init__(self, path, pins, channels):
+        """
+        @param      str     path        the file to map, replaced if it exists
+        @param      list    pins        the pin numbers to publish
+        @param      list    channels    the channel numbers to publish
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.closed = False
+
+        self.pin_slots = {
+            num : HEADER.size + i * PIN_SLOT.size for i, num in enumerate(pins)
+        }
+        chnl_base = HEADER.size + len(self.pin_slots) * PIN_SLOT.size
+        self.chnl_slots = {
+            num : chnl_base + i * CHNL_SLOT.size for i, num in enumerate(channels)
+        }
+
+        # build the new segment aside and rename it into place, so readers of
+        # a previous server's segment keep a consistent mapping until they
+        # notice it closed
+        tmp = path + '.tmp'
+        with open(tmp, 'w+b') as file:
+            file.truncate(size(len(self.pin_slots), len(self.chnl_slots)))
+            self.mm = mmap.mmap(file.fileno(), 0)
+
+        HEADER.pack_into(self.mm, 0, MAGIC, 0, 0, len(self.pin_slots), len(self.chnl_slots))
+        for num, offset in self.pin_slots.items():
+            PIN_SLOT.pack_into(self.mm, offset, num, math.nan)
+        for num, offset in self.chnl_slots.items():
+            CHNL_SLOT.pack_into(self.mm, offset, num, 0.0, math.nan)
+        os.replace(tmp, path)
+
+    def offer(self, kind, num, val, timestamp=None):
+        """
+        Publishes pin changes and channel samples to the segment, the samples
+        with the time they were taken.
+
+        @see        `pubsub.Hub.publish()`
+        """
+        if kind == pubsub.PIN:
+            self.write_pin(num, val)
+        elif kind == pubsub.CHANNEL:
+            self.write_channel(num, CLOCK.time() if timestamp is None else timestamp, val)
+
+    def write_pin(self, num, val):
+        """
+        Publishes the state of a pin.
+
+        @param      int     num         the pin number
+        @param      number  val         its value
+        @return     None
+        """
+        offset = self.pin_slots.get(num)
+        if offset is None:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            self._begin()
+            PIN_SLOT.pack_into(self.mm, offset, num, _pack_value(val))
+            self._end()
+
+    def write_channel(self, num, timestamp, val):
+        """
+        Publishes a sample of a channel.
+
+        @param      int     num         the channel number
+        @param      float   timestamp   when the sample was taken
+        @param      number  val         the value
+        @return     None
+        """
+        offset = self.chnl_slots.get(num)
+        if offset is None:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            self._begin()
+            CHNL_SLOT.pack_into(self.mm, offset, num, timestamp, _pack_value(val))
+            self._end()
+
+    def _begin(self):
+        """Makes the sequence odd, before an update. The caller holds the lock."""
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+
+    def _end(self):
+        """Makes the sequence even, after an update. The caller holds the lock."""
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        """
+        Marks the segment closed, so readers reopen the next server's, and
+        unmaps it. Writes from then on, e.g. of a sample published while
+        closing, are dropped.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.mm[CLOSED_OFFSET] = 1
+            self.mm.close()
+
+class LocalReader(object):
+    """
+    @name   LocalReader
+    @desc   Reads the GPIO state straight from the server's shared memory
+
+    Has the same reading methods as `Client`, and returns the same values, but
+    only works on the server's host. Writes, and channel reads fresher than
+    the latest sample, still go through the server, with `client`.
+
+    ex.
+    >>> gpio = LocalReader()
+    >>> gpio.get_channel(2)
+    0.1235
+    >>> gpio.set_pin(0, 1)  # sent to the server
+    """
+
+    def __init__(self, path=None, client=None):
+        """
+        @param      str     path        the segment, defaults to
+        `GPIOConfig.SHM_PATH`
+        @param      Client  client      the client to write through, defaults
+        to one connected over `NetworkConfig.SOCKET_PATH`
+        """
+        self.path = path if path else config.GPIOConfig.SHM_PATH
+        self.client = client if client else Client(path=config.NetworkConfig.SOCKET_PATH)
+        self.mm = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """
+        Maps the segment, replacing any previous mapping.
+
+        @raises     OSError     if the server has not created it, or has
+        since stopped
+        @raises     ValueError  if the file is not a GPIO state segment
+        """
+        self._unmap()
+        with open(self.path, 'rb') as file:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < HEADER.size or mm[:len(MAGIC)] != MAGIC:
+            mm.close()
+            raise ValueError("`{}` is not a GPIO state segment".format(self.path))
+        if mm[CLOSED_OFFSET]:
+            mm.close()
+            raise ConnectionError("the GPIO server publishing `{}` has stopped".format(self.path))
+        self.mm = mm
+
+    def _unmap(self):
+        """Unmaps the segment, if mapped."""
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def close(self):
+        """Unmaps the segment, and closes the client's connection."""
+        self._unmap()
+        self.client.close()
+
+    def snapshot(self):
+        """
+        Takes a consistent copy of the segment.
+
+        @return     tuple   ({pin : val}, {channel : (timestamp, val)})
+        """
+        with self.lock:
+            if self.mm is None or self.mm[CLOSED_OFFSET]:
+                # a restarted server publishes to a new segment
+                self.open()
+            data = self._copy()
+
+        _, _, _, num_pins, num_chnls = HEADER.unpack_from(data, 0)
+        pins, chnls = {}, {}
+        offset = HEADER.size
+        for _ in range(num_pins):
+            num, val = PIN_SLOT.unpack_from(data, offset)
+            pins[num] = _unpack_value(val)
+            offset += PIN_SLOT.size
+        for _ in range(num_chnls):
+            num, timestamp, val = CHNL_SLOT.unpack_from(data, offset)
+            chnls[num] = (timestamp, _unpack_value(val))
+            offset += CHNL_SLOT.size
+
+        return pins, chnls
+
+    def _copy(self):
+        """Copies the mapping, retrying until no update overlapped the copy."""
+        spins = 0
+        while True:
+            before = SEQ.unpack_from(self.mm, SEQ_OFFSET)[0]
+            if not before % 2:
+                data = self.mm[:]
+                if SEQ.unpack_from(self.mm, SEQ_OFFSET)[0] == before:
+                    return data
+
+            spins += 1
+            if spins % SPINS == 0:
+                sleep(0)
+
+    def set_pin(self, pin, val):
+        """
+        Set the value of a single pin, through the server.
+
+        @see        `Client.set_pin()`
+        """
+        return self.client.set_pin(pin, val)
+
+    def get_pin(self, pin):
+        """
+        Get the value of a single pin.
+
+        ex.
+        >>> gpio.get_pin(0)
+        0
+        """
+        return self.snapshot()[0].get(int(pin))
+
+    def get_pins(self):
+        """
+        Get the value of all the pins.
+
+        ex.
+        >>> gpio.get_pins()
+        {'0': 0, '1': 1, ... ,"6": 1}
+        """
+        return {str(num) : val for num, val in self.snapshot()[0].items()}
+
+    def get_channel(self, channel, max_age=None):
+        """
+        Get the latest sample of a single channel.
+
+        When the sample is older than `max_age` seconds, the channel is read
+        through the server instead. Samples are stamped by the server's clock,
+        which `embed.clock.CLOCK` should follow, see `Client.clock()`.
+
+        ex.
+        >>> gpio.get_channel(0)
+        0.4512
+        """
+        sample = self.snapshot()[1].get(int(channel))
+        if sample is None:
+            return None
+        if max_age is not None and CLOCK.time() - sample[0] > max_age:
+            return self.client.get_channel(channel, max_age)
+        return sample[1]
+
+    def get_channels(self, max_age=None):
+        """
+        Get the latest samples of all the channels.
+
+        @see        `get_channel()` for `max_age`
+
+        ex.
+        >>> gpio.get_channels()
+        {'0': 0.4512, '1': 0.3307, ... "3": 0.9}
+        """
+        chnls = self.snapshot()[1]
+        if max_age is not None and any(CLOCK.time() - ts > max_age for ts, _ in chnls.values()):
+            return self.client.get_channels(max_age)
+        return {str(num) : val for num, (_, val) in chnls.items()}
@@ -0,0 +1,203 @@
+"""
+@name   Sim
+@desc   A simulated greenhouse, as a GPIO backend for non-RPI environments.
+
+Where `stub.Stub` pins only hold their value and channels a constant, the
+simulator models the greenhouse they are wired to: the temperature follows the
+outside temperature over the day, and rises with the heater and the lights and
+falls with the fan; the soil dries out, faster when warm, and the pump waters
+it from the tank until the tank runs dry. See `config.SimConfig` for the
+model's parameters and which pins and channels drive and measure what.
+
+The model advances in fixed steps of `SimConfig.STEP` virtual seconds on a
+clock (see `embed/clock.py`), lazily, whenever a pin is set or a channel read,
+and the sensor noise comes from a seeded generator, one draw per step. So given
+the same pin changes at the same virtual times, it reads the same values.
+"""
+
+import math
+import random
+import threading
+import time as _time
+
+from embed import config
+from embed.clock import DAY
+from . import stub
+
+# the quantities the greenhouse models, and its outputs
+QUANTITIES = ['temp', 'moist', 'tank']
+OUTPUTS = ['heat', 'fan', 'pump', 'lights']
+
+def temp_to_value(temp):
+    """
+    @param      float   temp        a temperature, in C
+    @return     float   what a TMP36 at 3.3V reads through the ADC, 0 to 1
+    """
+    return (0.5 + temp / 100) / 3.3
+
+class Greenhouse(object):
+    """
+    The simulated greenhouse.
+
+    @attr   Clock   clock       the clock it runs on
+    @attr   float   temp        the temperature, in C
+    @attr   float   moist       the soil moisture, 0 to 1
+    @attr   float   tank        the tank level, 0 to 1
+    @attr   dict    outputs     {output : 0 or 1}, see `OUTPUTS`
+    """
+
+    def __init__(self, clock, step=None, seed=None, params=config.SimConfig):
+        """
+        @param      Clock   clock       the clock to run on
+        @param      float   step        virtual seconds per step, defaults to
+        `SimConfig.STEP`
+        @param      int     seed        seeds the sensor noise, defaults to
+        `SimConfig.SEED`
+        @param      class   params      the model's parameters
+        """
+        self.clock = clock
+        self.params = params
+        self.step = params.STEP if step is None else step
+        self.rng = random.Random(params.SEED if seed is None else seed)
+        self.lock = threading.Lock()
+
+        self.start = clock.time()
+        self.steps = 0
+        local = _time.localtime(self.start)
+        self.midnight = self.start - (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec)
+
+        self.temp = params.TEMP
+        self.moist = params.MOIST
+        self.tank = params.TANK
+        self.outputs = {output : 0 for output in OUTPUTS}
+        self.noise = {quantity : 0.0 for quantity in QUANTITIES}
+
+    @property
+    def time(self):
+        """@return  float   the virtual time simulated up to"""
+        return self.start + self.steps * self.step
+
+    def outside_temp(self, when):
+        """
+        @param      float   when        a virtual time
+        @return     float   the outside temperature then, in C
+        """
+        time_of_day = (when - self.midnight) % DAY
+        return self.params.OUTSIDE_TEMP + self.params.OUTSIDE_SWING * math.sin(
+            2 * math.pi * (time_of_day - 9 * 3600) / DAY
+        )
+
+    def _step(self):
+        """Advances the model one step, without locking."""
+        params, out, dt = self.params, self.outputs, self.step
+
+        loss = params.LEAK_RATE + out['fan'] * params.FAN_RATE
+        self.temp += dt * (
+            loss * (self.outside_temp(self.time) - self.temp)
+            + out['heat'] * params.HEAT_RATE + out['lights'] * params.LIGHT_RATE
+        )
+
+        drying = params.DRY_RATE * self.moist * max(0.0, 1 + 0.05 * (self.temp - 20))
+        watering = 0.0
+        if out['pump'] and self.tank > 0:
+            watering = params.PUMP_RATE * (1 - self.moist)
+            self.tank = max(0.0, self.tank - params.TANK_FLOW * dt)
+        self.moist = min(1.0, max(0.0, self.moist + dt * (watering - drying)))
+
+        for quantity in QUANTITIES:
+            self.noise[quantity] = self.rng.gauss(0, params.NOISE)
+        self.steps += 1
+
+    def _advance(self):
+        """Catches the model up with the clock, without locking."""
+        for _ in range(int((self.clock.time() - self.time) // self.step)):
+            self._step()
+
+    def set(self, output, val):
+        """
+        Turns an output on or off, from now.
+
+        @param      str     output      one of `OUTPUTS`
+        @param      number  val         truthy for on
+        @return     None
+        """
+        with self.lock:
+            self._advance()
+            self.outputs[output] = 1 if val else 0
+
+    def read(self, quantity):
+        """
+        Measures a quantity now, as its channel reads it.
+
+        @param      str     quantity    one of `QUANTITIES`
+        @return     float   the channel value, 0 to 1
+        """
+        with self.lock:
+            self._advance()
+            val = temp_to_value(self.temp) if quantity == 'temp' else getattr(self, quantity)
+            return min(1.0, max(0.0, val + self.noise[quantity]))
+
+    def snapshot(self):
+        """
+        @return     dict    the model's state now, in its own units
+        """
+        with self.lock:
+            self._advance()
+            return dict(
+                time=self.time, temp=self.temp, moist=self.moist, tank=self.tank,
+                outputs=dict(self.outputs)
+            )
+
+    def pin(self, name, pin_num):
+        """
+        Makes the device behind a configured pin.
+
+        @param      str     name        the pin's name, e.g. 'heat/enable'
+        @param      int     pin_num     the pin number
+        @return     object  with a settable `value`, like a `gpiozero.LED`
+        """
+        output = self.params.OUTPUTS.get(name)
+        if output not in self.outputs:
+            return stub.Stub(pin_num, 0)
+        return Output(self, output, pin_num)
+
+    def channel(self, name, chnl_num):
+        """
+        Makes the device behind a configured channel.
+
+        @param      str     name        the channel's name, e.g. 'temp/front'
+        @param      int     chnl_num    the channel number
+        @return     object  with a `value`, like a `gpiozero.MCP3008`
+        """
+        quantity = self.params.INPUTS.get(name.split('/')[0])
+        if quantity not in QUANTITIES:
+            return stub.Stub(chnl_num, 0)
+        return Input(self, quantity, chnl_num)
+
+class Output(object):
+    """A pin driving one of the greenhouse's outputs."""
+
+    def __init__(self, greenhouse, output, pin):
+        self.greenhouse = greenhouse
+        self.output = output
+        self.pin = pin
+
+    @property
+    def value(self):
+        return self.greenhouse.outputs[self.output]
+
+    @value.setter
+    def value(self, val):
+        self.greenhouse.set(self.output, val)
+
+class Input(object):
+    """A channel measuring one of the greenhouse's quantities."""
+
+    def __init__(self, greenhouse, quantity, pin):
+        self.greenhouse = greenhouse
+        self.quantity = quantity
+        self.pin = pin
+
+    @property
+    def value(self):
+        return self.greenhouse.read(self.quantity)
@@ -5,9 +5,39 @@ Builds upon the socket class to allow easy parsing of variable-length messages d
 """
 
 import socket
+import struct
+from time import monotonic
 
 from embed import config
 
+# every message sent with `send_var` is prefixed with its length, as an
+# unsigned 32-bit big-endian integer
+HEADER = struct.Struct('!I')
+
+def pack_var(var_msg):
+    """
+    Prefixes the message with its length header.
+    
+    @param      bytes       var_msg     the message to frame
+    @return     bytes       the framed message
+    """
+    return HEADER.pack(len(var_msg)) + var_msg
+
+def unpack_header(header):
+    """
+    Reads the message length out of a length header.
+    
+    @raises     ValueError  if the length exceeds the configured maximum
+    
+    @param      bytes       header      the `HEADER.size` bytes of a header
+    @return     int         the length of the message that follows
+    """
+    (length,) = HEADER.unpack(header)
+    if length > config.NetworkConfig.MAX_MSG_SIZE:
+        raise ValueError("message of {} bytes exceeds the maximum of {}".format(
+            length, config.NetworkConfig.MAX_MSG_SIZE))
+    return length
+
 class Socket(socket.socket):
     """
     `Socket`
@@ -16,20 +46,92 @@ class Socket(socket.socket):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+    def accept(self):
+        """
+        Accepts a connection, like `socket.accept`, but wraps the new
+        connection as a `Socket` so it can use `send_var`/`recv_var`.
+        """
+        fd, addr = self._accept()
+        conn = Socket(self.family, self.type, self.proto, fileno=fd)
+        if socket.getdefaulttimeout() is None and self.gettimeout():
+            conn.setblocking(True)
+        return conn, addr
+
     def send_var(self, var_msg, *args, **kwargs):
         """
         Sends a variable length message with a length header.
         """
-        return super(Socket, self).sendall(var_msg, *args, **kwargs)
+        return super(Socket, self).sendall(pack_var(var_msg), *args, **kwargs)
 
     def recv_var(self, *args, **kwargs):
         """
         Receives the entirety of a message sent using send_var.
+        
+        @raises     ConnectionError     if the connection closes mid-message
+        @raises     ValueError          if the header announces an oversized message
+        
+        @return     bytes       the message, or None if the peer closed the
+        connection cleanly between messages
         """
         # Keeps receiving until N-bytes length header fully uncovered
+        header = self.recv_exact(HEADER.size, *args, **kwargs)
+        if not header:
+            return None
+        
+        # then read exactly as many bytes as the header announced
+        length = unpack_header(header)
+        msg = self.recv_exact(length, *args, **kwargs)
+        if len(msg) < length:
+            raise ConnectionError("socket connection broken")
+        return msg
+
+    def recv_exact(self, size, *args, **kwargs):
+        """
+        Receives exactly `size` bytes.
+        
+        @raises     ConnectionError     if the connection closes after only
+        part of the bytes were received
         
-        # Align stream and start reading untilJ
-        return super(Socket, self).recv(1024, *args, **kwargs)
+        @param      int     size        the number of bytes to receive
+        @return     bytes   the bytes received, or b'' if the connection was
+        closed before any were
+        """
+        chunks = []
+        bytes_recd = 0
+        while bytes_recd < size:
+            chunk = super(Socket, self).recv(min(size - bytes_recd, 4096), *args, **kwargs)
+            if chunk == b'':
+                if bytes_recd == 0:
+                    return b''
+                raise ConnectionError("socket connection broken")
+            chunks.append(chunk)
+            bytes_recd = bytes_recd + len(chunk)
+        return b''.join(chunks)
+
+    def linger_close(self, timeout):
+        """
+        Closes the connection without resetting it. Closing with unread data
+        sends a reset, which can discard the last message sent before the peer
+        reads it; so this stops sending, then reads and drops whatever the peer
+        still sends until it closes its end, or `timeout` seconds pass.
+        
+        @param      float   timeout     the most seconds to wait for the peer
+        @return     None
+        """
+        deadline = monotonic() + timeout
+        try:
+            self.shutdown(socket.SHUT_WR)
+            while True:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self.settimeout(remaining)
+                if not super(Socket, self).recv(4096):
+                    break
+        except OSError:
+            pass
+        finally:
+            self.close()
 
 
 # class Socket(object):
@@ -0,0 +1,151 @@
+"""
+@name   State
+@desc   Versioned GPIO state, guarded by a reader/writer lock.
+
+Any number of requests may read the state at once, while a write excludes
+every other reader and writer. Each change bumps the state's version, so a
+snapshot taken under the read lock is internally consistent, and its version
+tells clients whether it is newer than one they already have.
+"""
+
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+class RWLock(object):
+    """
+    A reader/writer lock that prefers writers: once a writer waits, new
+    readers wait behind it, so a steady stream of reads cannot starve writes.
+
+    Not reentrant; a thread holding either side must not take it again.
+    """
+
+    def __init__(self, on_wait=None):
+        """
+        @param      func    on_wait     called with the side taken, 'read' or
+        'write', and the seconds it took to get it, e.g. for metrics
+        """
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+        self.waiting = 0        # writers waiting for the lock
+        self.on_wait = on_wait
+
+    @contextmanager
+    def read(self):
+        """Holds the lock shared, for the duration of a `with` block."""
+        start = perf_counter()
+        with self.cond:
+            while self.writing or self.waiting:
+                self.cond.wait()
+            self.readers += 1
+        if self.on_wait is not None:
+            self.on_wait('read', perf_counter() - start)
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Holds the lock exclusively, for the duration of a `with` block."""
+        start = perf_counter()
+        with self.cond:
+            self.waiting += 1
+            try:
+                while self.writing or self.readers:
+                    self.cond.wait()
+            finally:
+                self.waiting -= 1
+            self.writing = True
+        if self.on_wait is not None:
+            self.on_wait('write', perf_counter() - start)
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+class TimedLock(object):
+    """
+    A mutex, like `threading.Lock`, reporting how long each acquisition
+    waited.
+    """
+
+    def __init__(self, on_wait):
+        """
+        @param      func    on_wait     called with the seconds each `with`
+        block waited for the lock
+        """
+        self.lock = threading.Lock()
+        self.on_wait = on_wait
+
+    def __enter__(self):
+        start = perf_counter()
+        self.lock.acquire()
+        self.on_wait(perf_counter() - start)
+        return self
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+class Versioned(object):
+    """
+    Data read from a `VersionedState`, with the version it was read at.
+
+    @attr   obj     data        the data
+    @attr   int     version     the state's version when it was read
+    """
+
+    __slots__ = ('data', 'version')
+
+    def __init__(self, data, version):
+        self.data = data
+        self.version = version
+
+class VersionedState(object):
+    """
+    A dict of values, e.g. {pin : val}, with a version bumped on every change.
+
+    `get()` and `set()` expect the caller to hold `lock` (shared for `get()`,
+    exclusive for `set()`), so several of them can run as one atomic step.
+    """
+
+    def __init__(self, values=None, on_wait=None):
+        """
+        @param      dict    values      the initial values
+        @param      func    on_wait     see `RWLock`
+        """
+        self.lock = RWLock(on_wait)
+        self.values = dict(values if values else {})
+        self.version = 0
+
+    def get(self, key, default=None):
+        """
+        @return     obj     the value of `key`. The caller holds `lock`.
+        """
+        return self.values.get(key, default)
+
+    def set(self, key, val):
+        """
+        Changes the value of `key`, bumping the version. The caller holds
+        `lock` exclusively.
+
+        @return     int     the new version
+        """
+        self.values[key] = val
+        self.version += 1
+        return self.version
+
+    def snapshot(self):
+        """
+        Copies every value at once, taking the lock shared.
+
+        @return     Versioned   the {key : val} dict, and its version
+        """
+        with self.lock.read():
+            return Versioned(dict(self.values), self.version)
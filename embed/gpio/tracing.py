@@ -0,0 +1,208 @@
+"""
+@name   Tracing
+@desc   Sampled timelines of single requests, written to a local file.
+
+A `Tracer` picks a fraction of requests (`GPIOConfig.TRACE_RATE`) as they are
+received, and records a timeline of each: receiving and decoding it, waiting
+for a worker, validating it, waiting for locks, hardware I/O, persisting,
+and sending the response. Requests not picked get `NULL`, whose methods do
+nothing, so the cost of tracing is bounded by the sampling rate.
+
+Code deep in a request (lock waits, hardware reads) records to the trace of
+the request it runs for, `current()`, which the server sets in the worker
+with `activate()`; there is no need to pass it around.
+
+Each finished trace is one JSON line in the trace file:
+
+    {"trace": "5c1f...", "time": 1792327857.89, "duration": 0.00041,
+     "attrs": {"action": "PSET", "ok": true, "bytes": 32},
+     "events": [{"name": "receive", "at": 0.0, "duration": 0.0}, ...]}
+
+with "at" and "duration" in seconds from the start of the trace.
+"""
+
+import os
+import json
+import random
+import logging
+import threading
+import contextvars
+from time import time, perf_counter
+from contextlib import contextmanager, nullcontext
+from uuid import uuid4 as uuid
+
+class Trace(object):
+    """
+    The timeline of one sampled request.
+
+    @attr   str     id          the trace's id
+    @attr   dict    attrs       what the request was, and how it ended
+    @attr   list    events      the events, in the order they ended
+    """
+
+    sampled = True
+
+    def __init__(self, tracer, **attrs):
+        self.tracer = tracer
+        self.id = uuid().hex
+        self.time = time()
+        self.start = perf_counter()
+        self.attrs = attrs
+        self.events = []
+
+    def set(self, **attrs):
+        """Adds to, or replaces, the trace's attributes."""
+        self.attrs.update(attrs)
+
+    def event(self, name, seconds=0.0, **attrs):
+        """
+        Records an event that just ended.
+
+        @param      str     name        what happened
+        @param      float   seconds     how long it took
+        @param      dict    attrs       details, e.g. which lock
+        @return     None
+        """
+        end = perf_counter() - self.start
+        attrs.update(name=name, at=end - seconds, duration=seconds)
+        self.events.append(attrs)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Records the `with` block as an event."""
+        start = perf_counter()
+        try:
+            yield self
+        finally:
+            self.event(name, perf_counter() - start, **attrs)
+
+    def finish(self):
+        """Ends the trace, and writes it out."""
+        self.tracer.write(self)
+
+    def record(self):
+        """
+        @return     dict    the trace, as written to the trace file
+        """
+        return {
+            "trace" : self.id,
+            "time" : self.time,
+            "duration" : perf_counter() - self.start,
+            "attrs" : self.attrs,
+            "events" : self.events
+        }
+
+class NullTrace(object):
+    """The trace of a request not sampled: records nothing."""
+
+    sampled = False
+
+    def set(self, **attrs):
+        pass
+
+    def event(self, name, seconds=0.0, **attrs):
+        pass
+
+    def span(self, name, **attrs):
+        return _NO_SPAN
+
+    def finish(self):
+        pass
+
+_NO_SPAN = nullcontext()
+
+NULL = NullTrace()
+
+# the trace of the request being executed
+CURRENT = contextvars.ContextVar('gpio_trace', default=NULL)
+
+def current():
+    """
+    @return     Trace   the trace of the request being executed, or `NULL`
+    """
+    return CURRENT.get()
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` the current one, for the duration of a `with` block."""
+    token = CURRENT.set(trace)
+    try:
+        yield trace
+    finally:
+        CURRENT.reset(token)
+
+def span(name, **attrs):
+    """
+    Records a `with` block as an event of the current trace, if any.
+
+    >>> with tracing.span('hardware', op='pin_write'):
+    ...     led.value = 1
+    """
+    return CURRENT.get().span(name, **attrs)
+
+def event(name, seconds=0.0, **attrs):
+    """Records an event that just ended to the current trace, if any."""
+    CURRENT.get().event(name, seconds, **attrs)
+
+class Tracer(object):
+    """
+    Samples requests, and appends their traces to a file, rotating it to
+    `<fname>.1` once it reaches `max_size` bytes.
+    """
+
+    def __init__(self, fname, rate, max_size):
+        """
+        @param      str     fname       the trace file
+        @param      float   rate        the fraction of requests to trace
+        @param      int     max_size    the largest the file may grow, in bytes
+        """
+        self.fname = fname
+        self.rate = rate
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+        self.file = open(fname, 'a')
+        self.size = self.file.tell()
+
+    def start(self, **attrs):
+        """
+        Starts tracing a request just received, if it is sampled.
+
+        @param      dict    attrs       details of the request
+        @return     Trace   its trace, or `NULL` if not sampled
+        """
+        if random.random() >= self.rate:
+            return NULL
+        return Trace(self, **attrs)
+
+    def write(self, trace):
+        """
+        Appends a finished trace to the file.
+
+        @param      Trace   trace       the trace
+        @return     None
+        """
+        line = json.dumps(trace.record(), default=str) + '\n'
+        with self.lock:
+            if self.file.closed:
+                return
+            try:
+                if self.size + len(line) > self.max_size:
+                    self.rotate()
+                self.file.write(line)
+                self.file.flush()
+                self.size += len(line)
+            except OSError as err:
+                logging.error("Error writing trace to `%s`: %s", self.fname, err)
+
+    def rotate(self):
+        """Moves the full file aside and starts a new one. The caller holds the lock."""
+        self.file.close()
+        os.replace(self.fname, self.fname + '.1')
+        self.file = open(self.fname, 'a')
+        self.size = 0
+
+    def close(self):
+        """Closes the trace file; traces finishing later are dropped."""
+        with self.lock:
+            self.file.close()
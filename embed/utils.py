@@ -4,6 +4,9 @@
 """
 
 import uuid
+import logging
+
+from embed import config
 
 def flatten(_list):
     """
@@ -62,3 +65,18 @@ def make_uuid():
     @return     str     a fairly unique uuid
     """
     return str(uuid.uuid4()).split('-')[-1]
+
+def configure_logging(label):
+    """
+    Logs to the console at `GPIOConfig.LOG_LEVEL`, if `GPIOConfig.DEBUG`, with
+    `label` on every line. For programs to call: the modules of the `embed`
+    package only log, and leave it to the program running them.
+    
+    @param      str     label       names the program, e.g. 'GPIO/server'
+    @return     None
+    """
+    if config.GPIOConfig.DEBUG:
+        logging.basicConfig(
+            level=config.GPIOConfig.LOG_LEVEL,
+            format='%(asctime)s:%(levelname)s:' + label + ':%(message)s'
+        )
@@ -4,14 +4,11 @@
 @desc   Nice
 """
 
-from time import sleep
-from collections import deque
-
-import schedule
-
-from embed import config
-from embed.control import Sensor, InstrumentController
+from embed import config, utils
+from embed.clock import CLOCK, Daily
+from embed.gpio import Client
 from embed.control import NaiveSystem
+from embed.control import loop
 
 # import db
 INPUTS = config.GPIOConfig.CHNL_NUMBERS
@@ -20,41 +17,50 @@ OUTPUTS = config.GPIOConfig.PIN_NUMBERS
 # maps sensor inputs to relevant instrument outputs
 S_I_MAP = config.SystemConfig.S_I_MAP
 
-DQ = {k : deque(maxlen=100) for k in INPUTS.keys()}
+CLIENT = Client(path=config.NetworkConfig.SOCKET_PATH)
+
+WHITE_LIGHTS = ['lights/enable']
+OTHER_LIGHTS = ['lights/red/enable', 'lights/green/enable', 'lights/blue/enable']
+PUMP = ['pump/enable']
+
+def set_outputs(names, val):
+    """Sets every named output to `val` in a single request"""
+    with CLIENT.batch() as batch:
+        for name in names:
+            batch.set_pin(OUTPUTS[name].num, val)
+    return batch.results
 
 def sleep_for_6_hours():
     """System sleeps from 12AM-6AM"""
-    # turn everything off
-    turn_white_lights_off()
-    turn_other_lights_ff()
-    turn_pump_off()
+    # turn everything off, in one request
+    set_outputs(WHITE_LIGHTS + OTHER_LIGHTS + PUMP, 0)
     
     # sleep for 6 hours
-    sleep(60*60*6)
+    CLOCK.sleep(60*60*6)
 
 def turn_white_lights_on():
     """Turns white lights on"""
-    pass
+    set_outputs(WHITE_LIGHTS, 1)
 
 def turn_white_lights_off():
     """Turn white lights off"""
-    pass
+    set_outputs(WHITE_LIGHTS, 0)
 
 def turn_other_lights_on():
     """Turns the other lights on"""
-    pass
+    set_outputs(OTHER_LIGHTS, 1)
 
 def turn_other_lights_off():
     """Turns the other lights off"""
-    pass
+    set_outputs(OTHER_LIGHTS, 0)
 
 def turn_pump_on():
     """Turn the pump on"""
-    pass
+    set_outputs(PUMP, 1)
 
 def turn_pump_off():
     """Turn pump off"""
-    pass
+    set_outputs(PUMP, 0)
 
 def at_zero():
     """At 00:00"""
@@ -71,51 +77,48 @@ def at_eight():
 
 def main_naive():
     """main boilerplate"""
+    utils.configure_logging('run')
+    
+    # tell the time by the server's clock: virtual time with the simulator backend
+    CLOCK.follow(CLIENT.clock())
     
-    # instantiate inputs
-    sensors = {}
-    for input_name, gpio in INPUTS.items():
-        if gpio.type == 'channel':
-            sensors[input_name] = Sensor(channel=gpio.num)
-        elif gpio.type == 'pin':
-            sensors[input_name] = Sensor(pin=gpio.num)
+    # instantiate inputs, read together in one request
+    sensors = loop.build_sensors(INPUTS, client=CLIENT)
     
     # instantiate outputs
-    instruments = {name: InstrumentController(pin=gpio.num) for name, gpio in OUTPUTS.items()}
+    instruments = loop.build_instruments(OUTPUTS, client=CLIENT, clock=CLOCK)
     
     # instantiate controllers
     controller = NaiveSystem(io_map=S_I_MAP)
     
-    # schedule jobs
-    schedule.every().day.at("00:00").do(at_zero)
-    schedule.every().day.at("6:00").do(at_six)
-    schedule.every().day.at("8:00").do(at_eight)
+    # schedule jobs, on the clock: virtual time with the simulator backend
+    jobs = Daily(CLOCK)
+    jobs.at("00:00", at_zero)
+    jobs.at("6:00", at_six)
+    jobs.at("8:00", at_eight)
     
     while True:
         
-        # capture values from all pins/channels and put into deque
-        inputs = {}
-        for name, sense in sensors.items():
-            inputs[name] = sense.read() 
+        # capture values from all pins/channels, in one request; the server keeps their
+        # recent history, see `Client.get_history()`
+        inputs = loop.read_inputs(sensors)
         # `inputs` will be dict of of "input/name": num or num[].
         
         print("inputs", inputs)
         # TODO: save inputs
         
         # activate handlers based on time scale (ms, s, minute, hour, day)
-        schedule.run_pending()
+        jobs.run_pending()
         
         # predict output for inputs
-        outputs = controller.predict(inputs)
+        outputs = loop.predict_outputs(controller, inputs)
         
         print("outputs", outputs)
         
         # dispatch outputs
-        for inst_name, val in outputs.items():
-            if instruments.get(inst_name, False):
-                instruments[inst_name].run(val)
-            
-        sleep(5)
+        loop.dispatch_outputs(instruments, outputs)
+        
+        CLOCK.sleep(5)
 
 if __name__ == '__main__':
     try:
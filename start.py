@@ -1,15 +1,35 @@
 
+import argparse
+
 import embed.config as config
-from embed.gpio import Server
+from embed import utils
+from embed.gpio import Server, AsyncServer
+
+ENGINES = {
+    'thread'    : Server,
+    'asyncio'   : AsyncServer
+}
 
 def main():
     """Main boilerplate."""
-    server = Server.from_file(
+    parser = argparse.ArgumentParser(description="Starts the GPIO server.")
+    parser.add_argument(
+        '--engine', choices=sorted(ENGINES.keys()),
+        default=config.NetworkConfig.ENGINE,
+        help="thread-pool accept loop, or a single asyncio event loop"
+    )
+    args = parser.parse_args()
+    
+    utils.configure_logging('GPIO/server')
+    server = ENGINES[args.engine].from_file(
         fname=config.GPIOConfig.FILENAME,
         addr=config.NetworkConfig.HOST,
         num_workers=5
     )
-    server.listen(port=config.NetworkConfig.PORT)
+    try:
+        server.listen(port=config.NetworkConfig.PORT)
+    finally:
+        server.close()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,92 @@
+"""
+Shared fixtures: a GPIO server on the stub devices (off the Pi), listening on
+a free port, and clients of it.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from embed import config
+
+# the tests run anywhere, on the stub devices
+config.GPIOConfig.BACKEND = 'stub'
+
+def free_port():
+    """@return  int     a TCP port nothing listens on"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def wait_listening(port=None, path=None, timeout=5):
+    """Waits until something accepts connections on the port or unix socket."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if path is None:
+                socket.create_connection(('127.0.0.1', port), timeout=timeout).close()
+            else:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(path)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+ENGINES = ['thread', 'asyncio']
+
+@pytest.fixture(params=ENGINES)
+def server(request, tmp_path, monkeypatch):
+    """A GPIO server of each engine, with its state file, shared memory,
+    metrics and traces in temporary directories."""
+    from embed.gpio import Server, AsyncServer
+
+    cls = AsyncServer if request.param == 'asyncio' else Server
+    # unix socket paths are short, the test's temporary directory may not be
+    sockdir = tempfile.mkdtemp(prefix='gpio-')
+    request.addfinalizer(lambda: shutil.rmtree(sockdir, ignore_errors=True))
+    monkeypatch.setattr(config.GPIOConfig, 'SHM_PATH', os.path.join(sockdir, 'gpio.shm'))
+    monkeypatch.setattr(config.GPIOConfig, 'METRICS_FILE', str(tmp_path / 'gpio.prom'))
+    monkeypatch.setattr(config.GPIOConfig, 'TRACE_FILE', str(tmp_path / 'gpio.trace'))
+    gpio = cls(addr='127.0.0.1', fname=str(tmp_path / 'gpio_states.json'),
+               path=os.path.join(sockdir, 'gpio.sock'))
+    gpio.port = free_port()
+    threading.Thread(target=gpio.listen, kwargs={'port' : gpio.port}, daemon=True).start()
+    wait_listening(port=gpio.port)
+    wait_listening(path=gpio.path)
+    yield gpio
+    gpio.close()
+
+@pytest.fixture
+def client(server):
+    """A client of `server`, closed after the test."""
+    from embed.gpio import Client
+
+    gpio = Client(addr='127.0.0.1', port=server.port, path='')
+    yield gpio
+    gpio.close()
+
+@pytest.fixture
+def raw(server):
+    """A framed socket connected to `server`."""
+    from embed.gpio import sock
+
+    conn = sock.Socket(socket.AF_INET, socket.SOCK_STREAM)
+    conn.connect(('127.0.0.1', server.port))
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def local_client(server):
+    """A client of `server` over its unix socket, closed after the test."""
+    from embed.gpio import Client
+
+    gpio = Client(path=server.path)
+    yield gpio
+    gpio.close()
@@ -0,0 +1,35 @@
+import asyncio
+
+from embed.gpio import AsyncClient
+
+def run(server, coro_fn, **kwargs):
+    async def main():
+        async with AsyncClient(addr='127.0.0.1', port=server.port, **kwargs) as gpio:
+            return await coro_fn(gpio)
+    return asyncio.run(main())
+
+def test_pipelined_replies_match_their_requests(server):
+    async def work(gpio):
+        pins = sorted(int(pin) for pin in await gpio.get_pins())
+        await asyncio.gather(*(gpio.set_pin(pin, i % 2) for i, pin in enumerate(pins)))
+        # many requests in flight on one connection
+        vals = await asyncio.gather(*(gpio.get_pin(pin) for pin in pins * 5))
+        return pins, vals, len(gpio.conns)
+
+    pins, vals, conns = run(server, work, connections=1)
+    assert vals == [i % 2 for i in range(len(pins))] * 5
+    assert conns == 1
+
+def test_connections_are_opened_as_needed(server):
+    async def work(gpio):
+        chnls = list(await gpio.get_channels())
+        await asyncio.gather(*(gpio.get_channel(n) for n in chnls * 20))
+        return len(gpio.conns)
+
+    assert 1 <= run(server, work, connections=3) <= 3
+
+def test_over_the_unix_socket(server):
+    async def work(gpio):
+        return await gpio.get_pins()
+
+    assert run(server, work, path=server.path)
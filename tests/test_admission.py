@@ -0,0 +1,68 @@
+import pytest
+
+from embed.gpio import Client, server as gpio_server
+from embed.gpio.server import Session, busy
+
+PLIST = {"type" : "PLIST", "params" : {}}
+
+def fill(server):
+    """Takes every admission slot, as that many queued requests would."""
+    taken = 0
+    while server.admission.acquire(blocking=False):
+        taken += 1
+    return taken
+
+def test_busy_response():
+    assert busy() == {"ok" : False, "error" : {"message" : "Server busy, try again later.", "busy" : True}}
+    assert busy({"type" : "PGET", "id" : 7})["id"] == 7
+    assert "id" not in busy("not an action")
+
+def test_submit_admits_up_to_max_pending(server):
+    session = Session('test')
+    assert fill(server) == server.max_pending
+
+    busy_before = gpio_server.METRICS.snapshot().get('gpio_requests_busy_total', {}).get('', 0)
+    assert server.submit(PLIST, session) is None
+    assert gpio_server.METRICS.snapshot()['gpio_requests_busy_total'][''] == busy_before + 1
+
+    server.admission.release()
+    work = server.submit(PLIST, session)
+    assert work is not None
+    assert work.result(timeout=5)["ok"] is True
+
+def test_client_told_busy(server, client):
+    assert client.send("PLIST")["ok"] is True
+
+    taken = fill(server)
+    try:
+        resp = client.send("PLIST")
+        assert resp["ok"] is False
+        assert resp["error"]["busy"] is True
+    finally:
+        for _ in range(taken):
+            server.admission.release()
+
+    # the connection stays usable
+    assert client.send("PLIST")["ok"] is True
+
+def test_connections_beyond_the_limit_are_refused(server, client):
+    assert client.send("PLIST")["ok"] is True
+    server.max_connections = len(server.socks)
+
+    refused = Client(addr='127.0.0.1', port=server.port, path='')
+    with pytest.raises(ConnectionError):
+        refused.send("PLIST")
+    refused.close()
+
+    # open connections are still served
+    assert client.send("PLIST")["ok"] is True
+
+def test_engines_have_their_own_connection_limits(server):
+    from embed import config
+    from embed.gpio import AsyncServer
+
+    if isinstance(server, AsyncServer):
+        assert server.max_connections == config.NetworkConfig.ASYNC_MAX_CONNECTIONS
+    else:
+        assert server.max_connections == config.NetworkConfig.MAX_CONNECTIONS
+    assert config.NetworkConfig.ASYNC_MAX_CONNECTIONS > config.NetworkConfig.MAX_CONNECTIONS
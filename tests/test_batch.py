@@ -0,0 +1,47 @@
+def first_pin(client):
+    return int(next(iter(client.get_pins())))
+
+def test_batch_runs_in_order(client):
+    pin = first_pin(client)
+    with client.batch() as batch:
+        batch.set_pin(pin, 1)
+        batch.get_pin(pin)
+        batch.set_pin(pin, 0)
+        batch.get_pin(pin)
+    assert batch.results == [1, 1, 0, 0]
+    assert client.get_pin(pin) == 0
+
+def test_failing_step_does_not_stop_the_rest(client):
+    pin = first_pin(client)
+    with client.batch() as batch:
+        batch.get_pin(250)
+        batch.set_pin(pin, 1)
+    assert batch.results == [None, 1]
+
+def test_invalid_step_rejects_the_batch(client):
+    pin = first_pin(client)
+    client.set_pin(pin, 0)
+    res = client.send("BATCH", {"actions" : [
+        {"type" : "PSET", "params" : {"pin" : pin, "val" : 1}},
+        {"type" : "BATCH", "params" : {"actions" : []}},
+    ]})
+    assert res["ok"] is False
+    assert client.get_pin(pin) == 0
+
+def test_step_without_a_number_rejects_the_batch(client):
+    pin = first_pin(client)
+    client.set_pin(pin, 0)
+    for step in ({"type" : "CGET", "params" : {}},
+                 {"type" : "PGET", "params" : {"pin" : "two"}}):
+        res = client.send("BATCH", {"actions" : [
+            {"type" : "PSET", "params" : {"pin" : pin, "val" : 1}},
+            step,
+        ]})
+        assert res["ok"] is False
+        assert res["error"]["message"] == "Invalid batched action."
+    assert client.get_pin(pin) == 0
+
+def test_empty_batch(client):
+    with client.batch() as batch:
+        pass
+    assert batch.results == []
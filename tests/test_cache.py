@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from embed.gpio import Client
+from embed.gpio.cache import ReadCache
+from embed.gpio.pubsub import PIN, CHANNEL
+
+def test_values_expire_after_their_ttl():
+    cache = ReadCache(ttl=60, ttls={CHANNEL : 0.01, (PIN, 5) : 0})
+    cache.put(PIN, 1, 1)
+    cache.put(CHANNEL, 0, 0.5)
+    cache.put(PIN, 5, 1)
+
+    assert cache.get(PIN, 1) == (True, 1)
+    assert cache.get(PIN, 5) == (False, None)
+    time.sleep(0.02)
+    assert cache.get(CHANNEL, 0) == (False, None)
+    assert cache.get(PIN, 1, max_age=0.01) == (False, None)
+
+def test_newer_version_drops_the_pins():
+    cache = ReadCache(ttl=60)
+    cache.observe(3)
+    cache.put(PIN, 1, 1, version=3)
+    cache.put(CHANNEL, 0, 0.5)
+    cache.observe(3)
+    assert cache.get(PIN, 1) == (True, 1)
+
+    cache.observe(4)
+    assert cache.get(PIN, 1) == (False, None)
+    assert cache.get(CHANNEL, 0) == (True, 0.5)
+    # read before the version already seen, so possibly stale
+    cache.put(PIN, 1, 0, version=3)
+    assert cache.get(PIN, 1) == (False, None)
+
+def test_invalidate():
+    cache = ReadCache(ttl=60)
+    for num in range(3):
+        cache.put(PIN, num, 1)
+        cache.put(CHANNEL, num, 0.5)
+    cache.invalidate(PIN, 0)
+    assert cache.get(PIN, 0)[0] is False and cache.get(PIN, 1)[0] is True
+    cache.invalidate(CHANNEL)
+    assert not any(cache.get(CHANNEL, num)[0] for num in range(3))
+    cache.invalidate()
+    assert cache.entries == {}
+
+@pytest.fixture
+def cached(server):
+    gpio = Client(addr='127.0.0.1', port=server.port, path='', cache=ReadCache(ttl=60))
+    yield gpio
+    gpio.close()
+
+def test_client_answers_repeated_reads_from_the_cache(cached):
+    pin = int(next(iter(cached.get_pins())))
+    sent = []
+    send = cached.send
+    cached.send = lambda *args: sent.append(args) or send(*args)
+
+    cached.get_pin(pin)
+    cached.get_pin(pin)
+    assert sent == []
+
+def test_setting_a_pin_drops_its_cached_value(cached, client):
+    pin = int(next(iter(cached.get_pins())))
+    cached.set_pin(pin, 0)
+    assert cached.get_pin(pin) == 0
+    cached.set_pin(pin, 1)
+    assert cached.get_pin(pin) == 1
+
+def test_changes_by_others_drop_the_pins(cached, client):
+    pins = sorted(int(pin) for pin in cached.get_pins())
+    client.set_pin(pins[0], 0)
+    cached.get_pins()
+    assert cached.get_pin(pins[0]) == 0
+
+    # another client's change is noticed by the next versioned response
+    client.set_pin(pins[0], 1)
+    cached.get_many(pins=[pins[1]])
+    assert cached.get_pin(pins[0]) == 1
@@ -0,0 +1,99 @@
+import pytest
+
+from embed.gpio import codec
+
+ACTIONS = [
+    {"type" : "PSET", "params" : {"pin" : 3, "val" : 1}},
+    {"type" : "PSET", "params" : {"pin" : 3, "val" : 0.25}},
+    {"type" : "PGET", "params" : {"pin" : 255}},
+    {"type" : "PLIST", "params" : {}},
+    {"type" : "CGET", "params" : {"channel" : 2}},
+    {"type" : "CLIST", "params" : {}},
+    # not in the binary layouts, so escaped to JSON
+    {"type" : "CGET", "params" : {"channel" : 2, "max_age" : 0.5}},
+    {"type" : "PSET", "params" : {"pin" : 256, "val" : 1}},
+    {"type" : "PSET", "params" : {"pin" : 3, "val" : "on"}},
+    {"type" : "BATCH", "params" : {"actions" : [{"type" : "PLIST", "params" : {}}]}},
+]
+ESCAPED = ACTIONS[6:]
+
+# as the server answers, with int keys, which decode as strings
+RESPONSES = [
+    {"ok" : True, "data" : {3 : 1}},
+    {"ok" : True, "data" : {0 : 0.5, 1 : None, 2 : 0.125}},
+    {"ok" : True, "data" : [{0 : 1}, {1 : 0}]},
+    {"ok" : True, "data" : {}},
+    {"ok" : False, "error" : {"message" : "Invalid action."}},
+    {"ok" : True, "data" : [{"ok" : True, "data" : {"1" : 0}}]},
+]
+
+def decoded(resp):
+    """What a response decodes to: JSON object keys are strings."""
+    data = resp.get("data")
+    if isinstance(data, dict):
+        data = {str(key) : val for key, val in data.items()}
+    elif isinstance(data, list) and all(len(item) == 1 for item in data):
+        data = [{str(key) : val for key, val in item.items()} for item in data]
+    else:
+        return resp
+    return dict(resp, data=data)
+
+@pytest.mark.parametrize('name', sorted(codec.CODECS))
+@pytest.mark.parametrize('action', ACTIONS)
+def test_action_round_trip(name, action):
+    conn_codec = codec.CODECS[name]
+    assert conn_codec.decode_action(conn_codec.encode_action(action)) == action
+
+@pytest.mark.parametrize('name', sorted(codec.CODECS))
+@pytest.mark.parametrize('resp', RESPONSES)
+def test_response_round_trip(name, resp):
+    conn_codec = codec.CODECS[name]
+    assert conn_codec.decode_response(conn_codec.encode_response(resp)) == decoded(resp)
+
+def test_binary_layouts_used():
+    for action in ACTIONS[:6]:
+        assert codec.BINARY.encode_action(action)[0] != codec.BinaryCodec.ESCAPE
+    for resp in RESPONSES[:4]:
+        assert codec.BINARY.encode_response(resp)[0] != codec.BinaryCodec.ESCAPE
+    # an opcode and two numbers, where JSON takes dozens of bytes
+    assert len(codec.BINARY.encode_action(ACTIONS[0])) < len(codec.JSON.encode_action(ACTIONS[0])) // 4
+
+@pytest.mark.parametrize('action', ESCAPED)
+def test_binary_escapes_what_does_not_fit(action):
+    assert codec.BINARY.encode_action(action)[0] == codec.BinaryCodec.ESCAPE
+
+def test_binary_values_are_exact():
+    action = {"type" : "PSET", "params" : {"pin" : 3, "val" : 0.1}}
+    assert codec.BINARY.decode_action(codec.BINARY.encode_action(action)) == action
+
+    resp = {"ok" : True, "data" : {0 : 0.4512, 1 : 1 / 3}}
+    assert codec.BINARY.decode_response(codec.BINARY.encode_response(resp)) == \
+        codec.JSON.decode_response(codec.JSON.encode_response(resp))
+
+@pytest.mark.parametrize('raw', [b'', b'\x7f', b'\x01\x03'])
+def test_binary_malformed_action(raw):
+    with pytest.raises(ValueError):
+        codec.BINARY.decode_action(raw)
+
+def test_binary_malformed_response():
+    raw = codec.BINARY.encode_response(RESPONSES[1])
+    with pytest.raises(ValueError):
+        codec.BINARY.decode_response(raw[:-1])
+
+def test_negotiate():
+    assert codec.negotiate(['bin', 'json']) is codec.BINARY
+    assert codec.negotiate(['json', 'bin']) is codec.JSON
+    assert codec.negotiate(['msgpack']) is codec.JSON
+
+@pytest.mark.parametrize('name', sorted(codec.CODECS))
+def test_client_speaks_codec(server, name):
+    from embed.gpio import Client
+
+    with Client(addr='127.0.0.1', port=server.port, path='', codecs=[name]) as gpio:
+        pin = int(next(iter(gpio.get_pins())))
+        gpio.set_pin(pin, 1)
+        assert gpio.get_pin(pin) == 1
+        assert gpio.get_channels()
+        with gpio.batch() as batch:
+            batch.set_pin(pin, 0)
+        assert batch.results == [0]
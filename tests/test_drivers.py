@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from embed.gpio import drivers, server as gpio_server
+
+class Device(object):
+    def __init__(self, value=0):
+        self.value = value
+
+def test_stub_driver_holds_values():
+    driver = drivers.StubDriver({0 : 0, 1 : 1})
+    assert driver.read_many([0, 1]) == {0 : 0, 1 : 1}
+    assert driver.write_many({0 : 1}) == {0 : 1}
+    assert driver.read_many([0]) == {0 : 1}
+
+def test_device_driver_reads_only_what_is_asked():
+    devices = {num : Device(num / 10) for num in range(4)}
+    driver = drivers.DeviceDriver(devices)
+    assert driver.nums == [0, 1, 2, 3]
+    assert driver.read_many([3, 1]) == {3 : 0.3, 1 : 0.1}
+
+    driver.write_many({2 : 1})
+    assert devices[2].value == 1
+
+class ReadOnly(drivers.Driver):
+    def read_many(self, nums):
+        return {num : 0 for num in nums}
+
+def test_drivers_must_read_but_may_be_read_only():
+    with pytest.raises(TypeError):
+        drivers.Driver([0])
+    driver = ReadOnly([0])
+    assert driver.read_many([0]) == {0 : 0}
+    with pytest.raises(NotImplementedError, match="ReadOnly is a read-only driver"):
+        driver.write_many({0 : 1})
+
+def test_group_by_driver():
+    first, second = drivers.StubDriver({0 : 0, 1 : 0}), drivers.StubDriver({2 : 0, 3 : 0})
+    table = drivers.by_number([first, second])
+    assert table == {0 : first, 1 : first, 2 : second, 3 : second}
+    assert drivers.group(table, [2, 0, 3, 1]) == [(second, [2, 3]), (first, [0, 1])]
+    assert drivers.group(table, []) == []
+
+def test_channel_lists_read_each_driver_once(client, monkeypatch):
+    bursts = []
+    for driver in gpio_server.CHNL_DRIVERS:
+        read_many = driver.read_many
+        def counted(nums, read_many=read_many):
+            # the sampler reads on its own schedule
+            if threading.current_thread().name != 'sampler':
+                bursts.append(list(nums))
+            return read_many(nums)
+        monkeypatch.setattr(driver, 'read_many', counted)
+
+    chnls = client.get_channels(max_age=0)
+    assert len(bursts) <= len(gpio_server.CHNL_DRIVERS)
+    assert sorted(num for burst in bursts for num in burst) == sorted(int(n) for n in chnls)
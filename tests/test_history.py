@@ -0,0 +1,58 @@
+import pytest
+
+from embed.gpio import history
+
+@pytest.fixture
+def ring():
+    ring = history.RingBuffer(4)
+    for i in range(6):
+        ring.append(float(i), i * 10)
+    return ring
+
+def test_keeps_the_most_recent(ring):
+    assert len(ring) == 4
+    assert ring.window() == [(2.0, 20), (3.0, 30), (4.0, 40), (5.0, 50)]
+
+@pytest.mark.parametrize('since, times', [
+    (None, [2.0, 3.0, 4.0, 5.0]),
+    (0.0, [2.0, 3.0, 4.0, 5.0]),
+    (3.0, [3.0, 4.0, 5.0]),
+    (3.5, [4.0, 5.0]),
+    (5.0, [5.0]),
+    (5.5, []),
+])
+def test_window_since(ring, since, times):
+    assert [stamp for stamp, _ in ring.window(since)] == times
+
+def test_aggregate_since(ring):
+    agg = ring.aggregate(3.5)
+    assert agg == {"count" : 2, "min" : 40, "max" : 50, "mean" : 45.0, "last" : 50,
+                   "start" : 4.0, "end" : 5.0}
+    empty = ring.aggregate(6.0)
+    assert empty["count"] == 0
+    assert empty["mean"] is None and empty["start"] is None
+
+def test_missing_values(ring):
+    ring.append(6.0, None)
+    assert ring.window(6.0) == [(6.0, None)]
+    agg = ring.aggregate(5.0)
+    assert agg["count"] == 1 and agg["last"] == 50 and agg["end"] == 6.0
+
+def test_late_sample_keeps_order(ring):
+    ring.append(1.0, 60)
+    assert ring.window(5.0) == [(5.0, 50), (5.0, 60)]
+
+def test_empty():
+    ring = history.RingBuffer(3)
+    assert ring.window() == []
+    assert ring.window(1.0) == []
+    assert ring.aggregate()["count"] == 0
+
+def test_chist_answers_from_the_samples(client):
+    chnl = int(next(iter(client.get_channels())))
+    client.get_channel(chnl, max_age=0)
+    hist = client.get_history(chnl)
+    assert hist["channel"] == chnl
+    assert hist["count"] == len(hist["samples"]) >= 1
+    assert hist["last"] == hist["samples"][-1][1]
+    assert "samples" not in client.get_history(chnl, window=60, samples=False)
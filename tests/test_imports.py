@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+def loaded_after(statement):
+    """The embed.gpio modules a fresh interpreter has loaded after `statement`."""
+    out = subprocess.run(
+        [sys.executable, '-c', statement + '\n'
+         'import sys\n'
+         'print(" ".join(m for m in sys.modules if m.startswith("embed.gpio")))'],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return set(out.split())
+
+def test_control_does_not_load_the_server():
+    loaded = loaded_after('import embed.control')
+    assert 'embed.gpio.client' in loaded
+    assert 'embed.gpio.server' not in loaded
+    assert 'embed.gpio.aserver' not in loaded
+
+def test_client_does_not_load_the_server():
+    loaded = loaded_after('from embed.gpio import Client; Client()')
+    assert 'embed.gpio.server' not in loaded
+
+def test_server_loads_on_first_use():
+    loaded = loaded_after('from embed.gpio import Server')
+    assert 'embed.gpio.server' in loaded
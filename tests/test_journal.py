@@ -0,0 +1,97 @@
+import os
+import threading
+
+from embed.gpio import journal, pubsub
+
+def test_append_and_replay(tmp_path):
+    fname = str(tmp_path / 'gpio.journal')
+    log = journal.Journal(fname, state={})
+    log.append(1, 1)
+    log.append(2, 0.25)
+    log.append(1, 0)
+    log.close()
+
+    records, valid = journal.read(fname)
+    assert [(pin, val) for _, pin, val in records] == [(1, 1), (2, 0.25), (1, 0)]
+    assert valid == os.path.getsize(fname) == 3 * journal.RECORD.size
+    assert journal.replay(fname) == {1 : 0, 2 : 0.25}
+
+def test_replay_missing_file(tmp_path):
+    assert journal.replay(str(tmp_path / 'none.journal')) == {}
+
+def test_offer_journals_pins_only(tmp_path):
+    fname = str(tmp_path / 'gpio.journal')
+    log = journal.Journal(fname, state={})
+    log.offer(pubsub.PIN, 4, 1)
+    log.offer(pubsub.CHANNEL, 0, 0.5)
+    log.offer(pubsub.PIN, 5, "on")
+    log.close()
+    assert journal.replay(fname) == {4 : 1}
+
+def test_torn_tail_dropped(tmp_path):
+    fname = str(tmp_path / 'gpio.journal')
+    log = journal.Journal(fname, state={})
+    log.append(1, 1)
+    log.append(2, 1)
+    log.close()
+    # a power cut mid-append
+    with open(fname, 'ab') as file:
+        file.write(journal.pack(0.0, 3, 1)[:7])
+
+    assert journal.replay(fname) == {1 : 1, 2 : 1}
+    # reopening truncates the torn record, so new ones stay aligned
+    log = journal.Journal(fname, state={})
+    assert log.records == 2
+    log.append(3, 0)
+    log.close()
+    assert journal.replay(fname) == {1 : 1, 2 : 1, 3 : 0}
+
+def test_corrupt_record_stops_replay(tmp_path):
+    fname = str(tmp_path / 'gpio.journal')
+    with open(fname, 'wb') as file:
+        file.write(journal.pack(0.0, 1, 1))
+        bad = bytearray(journal.pack(0.0, 2, 1))
+        bad[-1] ^= 0xff
+        file.write(bytes(bad))
+        file.write(journal.pack(0.0, 3, 1))
+
+    records, valid = journal.read(fname)
+    assert [pin for _, pin, _ in records] == [1]
+    assert valid == journal.RECORD.size
+
+def test_commit_and_compact(tmp_path):
+    fname = str(tmp_path / 'gpio.journal')
+    log = journal.Journal(fname, state={1 : 0})
+    log.append(1, 1)
+    log.append(2, 1)
+    assert log.unsynced == 2
+    log.commit()
+    assert log.unsynced == 0
+
+    snapshots = []
+    log.compact(snapshots.append)
+    assert snapshots == [{1 : 1, 2 : 1}]
+    assert log.records == 0
+    assert os.path.getsize(fname) == 0
+    log.close()
+
+def test_appends_during_compaction_are_kept(tmp_path):
+    fname = str(tmp_path / 'gpio.journal')
+    log = journal.Journal(fname, state={})
+    log.append(1, 1)
+
+    def write_snapshot(states):
+        # appends go on while the snapshot is written
+        appender = threading.Thread(target=log.append, args=(2, 1))
+        appender.start()
+        appender.join(1)
+        assert not appender.is_alive()
+        snapshots.append(states)
+
+    snapshots = []
+    log.compact(write_snapshot)
+    assert snapshots == [{1 : 1}]
+    assert log.records == 1
+    log.append(3, 0)
+    log.close()
+    assert journal.replay(fname) == {2 : 1, 3 : 0}
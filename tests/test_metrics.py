@@ -0,0 +1,66 @@
+import os
+
+from embed.gpio import metrics
+
+def registry():
+    reg = metrics.Registry()
+    reg.describe('requests_total', metrics.COUNTER, 'Requests.')
+    reg.describe('request_seconds', metrics.HISTOGRAM, 'Request latency.')
+    reg.describe('queued', metrics.GAUGE, 'Queued requests.')
+    return reg
+
+def test_counters_and_gauges():
+    reg = registry()
+    reg.count('requests_total', action='PGET')
+    reg.count('requests_total', 2, action='PGET')
+    reg.count('requests_total', action='PSET')
+    reg.gauge('queued', lambda: 5)
+
+    snap = reg.snapshot()
+    assert snap['requests_total'] == {'action=PGET' : 3, 'action=PSET' : 1}
+    assert snap['queued'] == {'' : 5}
+
+def test_histogram_summary():
+    hist = metrics.Histogram(buckets=(1.0, 2.0, 4.0))
+    for val in (0.5, 1.5, 1.5, 3.0):
+        hist.observe(val)
+    summary = hist.summary()
+    assert summary["count"] == 4 and summary["sum"] == 6.5 and summary["max"] == 3.0
+    assert 1.0 <= summary["p50"] <= 2.0
+    assert summary["p99"] <= 3.0
+    assert metrics.Histogram().summary()["p50"] is None
+
+def test_failing_gauge_is_skipped():
+    reg = registry()
+    reg.gauge('queued', lambda: 1 / 0)
+    assert reg.snapshot()['queued'] == {}
+
+def test_render_prometheus_text():
+    reg = registry()
+    reg.count('requests_total', action='PGET')
+    reg.observe('request_seconds', 0.0003, action='PGET')
+    text = reg.render()
+
+    assert '# TYPE requests_total counter\n' in text
+    assert 'requests_total{action="PGET"} 1\n' in text
+    assert 'request_seconds_bucket{action="PGET",le="0.0005"} 1\n' in text
+    assert 'request_seconds_bucket{action="PGET",le="+Inf"} 1\n' in text
+    assert 'request_seconds_count{action="PGET"} 1\n' in text
+
+def test_exporter_writes_the_file(tmp_path):
+    reg = registry()
+    reg.count('requests_total')
+    fname = str(tmp_path / 'metrics.prom')
+    exporter = metrics.Exporter(reg, fname, interval=60)
+    exporter.start()
+    exporter.stop()
+    with open(fname) as file:
+        assert file.read() == reg.render()
+    assert not os.path.exists(fname + '.tmp')
+
+def test_stats_counts_requests(client):
+    client.get_pins()
+    stats = client.stats()
+    assert stats['gpio_requests_total']
+    latency = next(iter(stats['gpio_request_seconds'].values()))
+    assert latency["count"] >= 1
@@ -0,0 +1,96 @@
+import json
+import time
+
+from embed.gpio import tracing
+from embed.gpio.middleware import Middleware
+
+class Recorder(Middleware):
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def before(self, action):
+        self.calls.append((self.name, 'before', action['type']))
+
+    def after(self, action, result):
+        self.calls.append((self.name, 'after', action['type']))
+        return result
+
+    def error(self, action, err):
+        self.calls.append((self.name, 'error', action['type']))
+
+def test_hooks_run_in_chain_order(server, client):
+    calls = []
+    server.use(Recorder('outer', calls))
+    server.use(Recorder('inner', calls))
+
+    client.get_pins()
+    assert calls == [
+        ('outer', 'before', 'PLIST'), ('inner', 'before', 'PLIST'),
+        ('inner', 'after', 'PLIST'), ('outer', 'after', 'PLIST'),
+    ]
+
+    calls.clear()
+    assert client.get_pin(250) is None
+    assert [hook for _, hook, _ in calls] == ['before', 'before', 'error', 'error']
+
+def test_before_can_reject_and_after_can_rewrite(server, client):
+    pin = int(next(iter(client.get_pins())))
+
+    class ReadOnly(Middleware):
+        def before(self, action):
+            if action['type'] == 'PSET':
+                raise PermissionError("read only")
+
+    class Masked(Middleware):
+        def after(self, action, result):
+            return {key : -1 for key in result} if action['type'] == 'CGET' else result
+
+    chnl = int(next(iter(client.get_channels())))
+    client.set_pin(pin, 0)
+    server.use(ReadOnly())
+    server.use(Masked())
+    assert client.send("PSET", {"pin" : pin, "val" : 1})["ok"] is False
+    assert client.get_pin(pin) == 0
+    assert client.get_channel(chnl) == -1
+
+def test_sampled_requests_are_traced(server, client, tmp_path):
+    fname = str(tmp_path / 'all.trace')
+    server.tracer.close()
+    server.tracer = tracing.Tracer(fname, rate=1.0, max_size=1 << 20)
+
+    client.get_pins()
+    # the trace is finished once the response is sent
+    deadline = time.monotonic() + 5
+    while True:
+        with open(fname) as file:
+            traces = [json.loads(line) for line in file]
+        traces = [trace for trace in traces if trace["attrs"].get("action") == "PLIST"]
+        if traces or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+
+    trace = traces[0]
+    assert trace["attrs"]["ok"] is True
+    names = [event["name"] for event in trace["events"]]
+    assert names and all(event["at"] >= 0 for event in trace["events"])
+
+def test_unsampled_requests_cost_nothing(tmp_path):
+    tracer = tracing.Tracer(str(tmp_path / 'none.trace'), rate=0.0, max_size=1 << 20)
+    assert tracer.start() is tracing.NULL
+    with tracing.activate(tracer.start()):
+        with tracing.span('hardware'):
+            pass
+        assert tracing.current() is tracing.NULL
+    tracer.close()
+
+def test_trace_file_rotates(tmp_path):
+    fname = str(tmp_path / 'small.trace')
+    tracer = tracing.Tracer(fname, rate=1.0, max_size=400)
+    for _ in range(5):
+        trace = tracer.start(action='PGET')
+        with trace.span('hardware'):
+            pass
+        trace.finish()
+    tracer.close()
+    assert (tmp_path / 'small.trace.1').exists()
@@ -0,0 +1,62 @@
+import json
+import time
+
+from embed.gpio import persist
+
+def test_changes_are_coalesced():
+    writes = []
+    writer = persist.DeferredWriter(lambda: writes.append(time.monotonic()), 0.05)
+    writer.start()
+    for _ in range(20):
+        writer.mark_dirty()
+    time.sleep(0.2)
+    writer.stop()
+    # one write for the burst, one more on stop
+    assert 1 <= len(writes) <= 2
+
+def test_nothing_written_while_clean():
+    writes = []
+    writer = persist.DeferredWriter(lambda: writes.append(1), 0.01)
+    writer.flush()
+    assert writes == []
+    writer.mark_dirty()
+    writer.flush()
+    writer.flush()
+    assert writes == [1]
+
+def test_stop_writes_pending_changes():
+    writes = []
+    writer = persist.DeferredWriter(lambda: writes.append(1), 60)
+    writer.start()
+    writer.mark_dirty()
+    writer.stop()
+    assert writes == [1]
+
+def test_write_errors_do_not_stop_the_writer():
+    calls = []
+    def write():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("disk full")
+    writer = persist.DeferredWriter(write, 0.01)
+    writer.mark_dirty()
+    writer.flush()
+    writer.mark_dirty()
+    writer.flush()
+    assert len(calls) == 2
+
+def test_server_saves_changes_on_stop(client, server):
+    pin = int(next(iter(client.get_pins())))
+    client.set_pin(pin, 1)
+    server.writer.stop()
+    with open(server.fname) as f:
+        pins = {k : v for state in json.load(f)["pins"] for k, v in state.items()}
+    assert pins[str(pin)] == 1
+
+def test_write_atomic_replaces_the_file(tmp_path):
+    fname = str(tmp_path / 'state.json')
+    persist.write_atomic(fname, 'old')
+    persist.write_atomic(fname, 'new')
+    with open(fname) as f:
+        assert f.read() == 'new'
+    assert [path.name for path in tmp_path.iterdir()] == ['state.json']
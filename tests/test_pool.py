@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+
+from embed.gpio import Client, actions, codec, pool
+
+class FakeConnection(object):
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.generation = 0
+        self.requests = 0
+
+    def healthy(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def opened():
+    return []
+
+@pytest.fixture
+def conns(opened):
+    def open_fn():
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+    return pool.Pool(open_fn, size=2, timeout=0.05)
+
+def test_idle_connections_are_reused(conns, opened):
+    conn = conns.checkout()
+    conns.checkin(conn)
+    assert conns.checkout() is conn
+    assert len(opened) == 1
+
+def test_checkout_waits_then_times_out(conns):
+    conns.checkout()
+    held = conns.checkout()
+    with pytest.raises(TimeoutError):
+        conns.checkout()
+
+    timer = threading.Timer(0.01, conns.checkin, args=(held,))
+    conns.timeout = 1
+    timer.start()
+    assert conns.checkout() is held
+
+def test_unhealthy_connections_are_dropped(conns, opened):
+    conn = conns.checkout()
+    conns.checkin(conn)
+    conn.alive = False
+    assert conns.checkout() is not conn
+    assert conn.closed
+    assert conns.total == 1
+
+def test_discarded_connections_free_their_slot(conns, opened):
+    conns.discard(conns.checkout())
+    conns.discard(conns.checkout())
+    conns.checkout()
+    conns.checkout()
+    assert len(opened) == 4 and opened[0].closed
+
+def test_close_drops_checked_out_connections_on_checkin(conns):
+    idle, busy = conns.checkout(), conns.checkout()
+    conns.checkin(idle)
+    conns.close()
+    assert idle.closed and not busy.closed
+    conns.checkin(busy)
+    assert busy.closed
+    assert conns.total == 0
+
+def test_threads_share_a_clients_connections(server):
+    gpio = Client(addr='127.0.0.1', port=server.port, path='', pool_size=2)
+    pin = int(next(iter(gpio.get_pins())))
+    errors = []
+
+    def work():
+        try:
+            for _ in range(20):
+                assert gpio.get_pin(pin) in (0, 1)
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert errors == []
+    assert gpio.pool.total <= 2
+    gpio.close()
+
+class Dropped(object):
+    """A pooled connection the server closes after its first request."""
+
+    codec = codec.JSON
+
+    def __init__(self, sent):
+        self.sent = sent
+        self.generation = 0
+        self.requests = 0
+
+    def request(self, action):
+        self.sent.append(action['type'])
+        self.requests += 1
+        if self.requests > 1:
+            raise ConnectionResetError("connection reset by peer")
+        return codec.JSON.encode_response({"ok" : True, "data" : {"1" : 0}})
+
+    def healthy(self):
+        return True
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def dropping():
+    """A client whose connections fail on reuse, and the actions it sent."""
+    sent = []
+    gpio = Client(addr='127.0.0.1', port=1)
+    gpio.pool = pool.Pool(lambda: Dropped(sent), size=1)
+    gpio.get_pin(1)
+    return gpio, sent
+
+def test_reads_are_retried_on_a_fresh_connection(dropping):
+    gpio, sent = dropping
+    assert gpio.get_pin(1) == 0
+    assert sent == ['PGET', 'PGET', 'PGET']
+
+def test_writes_are_not_retried(dropping):
+    gpio, sent = dropping
+    with pytest.raises(ConnectionError):
+        gpio.set_pin(1, 1)
+    assert sent == ['PGET', 'PSET']
+
+@pytest.mark.parametrize('action, reads', [
+    ({"type" : "PGET", "params" : {"pin" : 1}}, True),
+    ({"type" : "CLIST", "params" : {}}, True),
+    ({"type" : "PSET", "params" : {"pin" : 1, "val" : 1}}, False),
+    ({"type" : "BATCH", "params" : {"actions" : [{"type" : "PGET"}, {"type" : "CGET"}]}}, True),
+    ({"type" : "BATCH", "params" : {"actions" : [{"type" : "PGET"}, {"type" : "PSET"}]}}, False),
+    ({"type" : "BATCH", "params" : {}}, False),
+])
+def test_reads_only(action, reads):
+    assert actions.reads_only(action) is reads
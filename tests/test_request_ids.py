@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from embed.gpio import server as gpio_server, codec, AsyncClient
+
+@pytest.fixture
+def slow_channels(monkeypatch):
+    """CGET takes a while, until the returned event is set."""
+    release = threading.Event()
+    read = gpio_server.HANDLERS["CGET"]
+    def slow(*args, **kwargs):
+        release.wait(5)
+        return read(*args, **kwargs)
+    monkeypatch.setitem(gpio_server.HANDLERS, "CGET", slow)
+    yield release
+    release.set()
+
+def request(raw, action):
+    raw.send_var(codec.JSON.encode_action(action))
+
+def reply(raw):
+    return codec.JSON.decode_response(raw.recv_var())
+
+def test_ids_are_echoed(raw):
+    request(raw, {"type" : "PLIST", "params" : {}, "id" : 7})
+    resp = reply(raw)
+    assert resp["ok"] and resp["id"] == 7
+
+    request(raw, {"type" : "PLIST", "params" : {}})
+    assert "id" not in reply(raw)
+
+def test_identified_requests_are_answered_out_of_order(raw, client, slow_channels):
+    chnl = int(next(iter(client.get_channels())))
+    pin = int(next(iter(client.get_pins())))
+
+    request(raw, {"type" : "CGET", "params" : {"channel" : chnl, "max_age" : 0}, "id" : 1})
+    request(raw, {"type" : "PGET", "params" : {"pin" : pin}, "id" : 2})
+    # the pin read is not held up by the slow channel read before it
+    assert reply(raw)["id"] == 2
+    slow_channels.set()
+    assert reply(raw)["id"] == 1
+
+def test_binary_ids_round_trip():
+    action = {"type" : "PGET", "params" : {"pin" : 3}, "id" : 42}
+    data = codec.BINARY.encode_action(action)
+    assert data[0] & codec.BinaryCodec.IDENTIFIED
+    assert codec.BINARY.decode_action(data) == action
+
+    resp = {"ok" : True, "data" : {3 : 1}, "id" : 42}
+    decoded = codec.BINARY.decode_response(codec.BINARY.encode_response(resp))
+    assert decoded["id"] == 42 and decoded["data"] == {"3" : 1}
+
+def test_async_client_matches_replies_by_id(server, slow_channels):
+    async def main():
+        async with AsyncClient(addr='127.0.0.1', port=server.port, connections=1) as gpio:
+            chnl = int(next(iter(await gpio.get_channels())))
+            pin = int(next(iter(await gpio.get_pins())))
+            slow = asyncio.ensure_future(gpio.get_channel(chnl, max_age=0))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            val = await gpio.get_pin(pin)
+            fast = time.monotonic() - started
+            slow_channels.set()
+            return val, await slow, fast
+
+    val, chnl_val, fast = asyncio.run(main())
+    assert val in (0, 1)
+    assert isinstance(chnl_val, (int, float))
+    assert fast < 1
@@ -0,0 +1,71 @@
+import time
+
+from embed.clock import ScaledClock
+from embed.gpio.sampler import Sampler
+
+def test_latest_respects_max_age():
+    sampler = Sampler(lambda nums: {}, {})
+    assert sampler.latest(0) is None
+
+    sampler.record(0, 0.5)
+    assert sampler.latest(0)[1] == 0.5
+    assert sampler.latest(0, max_age=60)[1] == 0.5
+
+    time.sleep(0.02)
+    assert sampler.latest(0, max_age=0.01) is None
+
+def test_samples_each_channel_at_its_rate():
+    reads = {0 : 0, 1 : 0}
+    def read(nums):
+        for n in nums:
+            reads[n] += 1
+        sampler.record_many({n : n for n in nums})
+
+    sampler = Sampler(read, {0 : 100, 1 : 0})
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    sampler.join(1)
+
+    assert reads[0] > 5
+    assert reads[1] == 0
+    assert sampler.latest(0)[1] == 0
+    assert sampler.latest(1) is None
+
+def test_on_sample_sees_every_sample():
+    seen = []
+    sampler = Sampler(lambda nums: {}, {}, on_sample=lambda n, ts, val: seen.append((n, val)))
+    sampler.record(3, 0.25)
+    assert seen == [(3, 0.25)]
+
+def test_channel_reads_accept_max_age(client):
+    chnl = int(next(iter(client.get_channels())))
+    assert isinstance(client.get_channel(chnl, max_age=0), (int, float))
+    assert isinstance(client.get_channel(chnl), (int, float))
+
+def test_channels_due_together_are_read_together():
+    batches = []
+    def read(nums):
+        batches.append(sorted(nums))
+        sampler.record_many({n : 0 for n in nums})
+
+    sampler = Sampler(read, {0 : 20, 1 : 20, 2 : 20})
+    sampler.start()
+    time.sleep(0.12)
+    sampler.stop()
+    sampler.join(1)
+
+    assert batches and all(batch == [0, 1, 2] for batch in batches)
+
+def test_samples_are_stamped_with_monotonic_time():
+    sampler = Sampler(lambda nums: None, {})
+    before = time.monotonic()
+    stamp, _ = sampler.record(0, 0.5)
+    assert before <= stamp <= time.monotonic()
+    assert abs(sampler.timestamp(stamp) - time.time()) < 1
+
+def test_ages_are_in_the_clocks_time():
+    sampler = Sampler(lambda nums: None, {}, clock=ScaledClock(speed=60))
+    assert abs(sampler.since(60) - (time.monotonic() - 1)) < 0.1
+    stamp, _ = sampler.record(0, 0.5)
+    assert abs(sampler.timestamp(stamp) - sampler.clock.time()) < 1
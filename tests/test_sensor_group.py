@@ -0,0 +1,28 @@
+from embed.control.sensor import Sensor, SensorGroup
+
+def test_get_many(client):
+    pin = int(next(iter(client.get_pins())))
+    chnls = sorted(int(n) for n in client.get_channels())
+    client.set_pin(pin, 1)
+
+    data = client.get_many(pins=[pin], channels=chnls, max_age=60)
+    assert data["pins"] == {str(pin) : 1}
+    assert sorted(data["channels"]) == sorted(str(n) for n in chnls)
+
+def test_get_many_refuses_invalid_numbers(client):
+    assert client.get_many(pins=[250]) is None
+
+def test_group_reads_in_one_request(client):
+    pin = int(next(iter(client.get_pins())))
+    chnl = int(next(iter(client.get_channels())))
+    client.set_pin(pin, 1)
+
+    sent = []
+    send = client.send
+    client.send = lambda *args: sent.append(args) or send(*args)
+
+    group = SensorGroup({"pump" : Sensor(pin=pin), "temp" : Sensor(channel=chnl)}, client=client)
+    values = group.read()
+    assert values["pump"] == 1
+    assert isinstance(values["temp"], (int, float))
+    assert len(sent) == 1
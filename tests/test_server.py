@@ -0,0 +1,68 @@
+import json
+import socket
+
+import pytest
+
+def test_keep_alive(client):
+    pins = client.get_pins()
+    assert pins
+    pin = int(next(iter(pins)))
+    for val in (1, 0, 1):
+        client.set_pin(pin, val)
+        assert client.get_pin(pin) == val
+
+def test_many_requests_one_connection(raw):
+    for _ in range(5):
+        raw.send_var(json.dumps({"type" : "PLIST", "params" : {}}).encode())
+        assert json.loads(raw.recv_var())["ok"] is True
+
+def test_malformed_action_answered(raw):
+    raw.send_var(b'not json')
+    assert json.loads(raw.recv_var())["ok"] is False
+    raw.send_var(json.dumps({"type" : "NOPE", "params" : {}}).encode())
+    assert json.loads(raw.recv_var())["ok"] is False
+    # the connection stays usable
+    raw.send_var(json.dumps({"type" : "PLIST", "params" : {}}).encode())
+    assert json.loads(raw.recv_var())["ok"] is True
+
+def test_large_message(raw):
+    # well beyond the old 1 KiB limit
+    raw.send_var(json.dumps({"type" : "PLIST", "params" : {"pad" : "x" * 100000}}).encode())
+    assert json.loads(raw.recv_var())
+
+def test_concurrent_clients(server):
+    from concurrent.futures import ThreadPoolExecutor
+    from embed.gpio import Client
+
+    def session(_):
+        with Client(addr='127.0.0.1', port=server.port, path='') as gpio:
+            return [gpio.get_pins() for _ in range(5)]
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(session, range(8)))
+    assert all(pins for result in results for pins in result)
+
+def test_unix_socket(client, local_client):
+    pin = int(next(iter(local_client.get_pins())))
+    local_client.set_pin(pin, 1)
+    assert client.get_pin(pin) == 1
+    local_client.set_pin(pin, 0)
+    assert client.get_pin(pin) == 0
+
+def test_close_stops_accepting(server, raw):
+    server.close()
+    with pytest.raises(OSError):
+        socket.create_connection(('127.0.0.1', server.port), timeout=1).close()
+    with pytest.raises(OSError), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        probe.connect(server.path)
+
+    # a connection left open is turned away, rather than failing in the closed
+    # worker pool; one accepted while closing is closed
+    try:
+        raw.send_var(json.dumps({"type" : "PLIST", "params" : {}}).encode())
+        resp = raw.recv_var()
+    except OSError:
+        resp = None
+    if resp is not None:
+        assert json.loads(resp)["error"]["busy"] is True
+    server.close()
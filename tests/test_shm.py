@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from embed.gpio import shm, pubsub, Client
+
+@pytest.fixture
+def shared(tmp_path):
+    shared = shm.SharedState(str(tmp_path / 'gpio.shm'), pins=[0, 1], channels=[0])
+    yield shared
+    if not shared.mm.closed:
+        shared.close()
+
+@pytest.fixture
+def reader(shared):
+    reader = shm.LocalReader(path=shared.path, client=Client(path='/nonexistent'))
+    yield reader
+    reader.close()
+
+def test_reads_what_was_written(shared, reader):
+    assert reader.get_pins() == {'0' : None, '1' : None}
+    assert reader.get_channel(0) is None
+
+    shared.write_pin(1, 1)
+    shared.offer(pubsub.CHANNEL, 0, 0.5)
+    assert reader.get_pin(1) == 1
+    assert reader.get_pins() == {'0' : None, '1' : 1}
+    assert reader.get_channel(0) == 0.5
+    assert reader.get_channels() == {'0' : 0.5}
+
+def test_reader_waits_out_a_write(shared, reader):
+    shared.write_pin(0, 0)
+    reader.get_pin(0)
+
+    # a write in progress: the sequence is odd until it ends
+    with shared.lock:
+        shared._begin()
+        pin_offset = shm.HEADER.size
+        shm.PIN_SLOT.pack_into(shared.mm, pin_offset, 0, 1.0)
+
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(reader.get_pin(0)))
+        thread.start()
+        time.sleep(0.05)
+        assert seen == []
+
+        shared._end()
+    thread.join(1)
+    assert seen == [1]
+
+def test_closed_segment_is_refused(shared, reader):
+    reader.get_pins()
+    shared.close()
+    with pytest.raises(ConnectionError):
+        reader.get_pins()
+
+def test_server_mirrors_its_state(client, server):
+    pin = int(next(iter(client.get_pins())))
+    with shm.LocalReader(path=server.shared.path, client=client) as reader:
+        client.set_pin(pin, 1)
+        assert reader.get_pin(pin) == 1
+        reader.set_pin(pin, 0)
+        assert reader.get_pin(pin) == 0
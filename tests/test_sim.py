@@ -0,0 +1,81 @@
+import time
+
+from embed.clock import Clock, ManualClock, ScaledClock, Daily
+from embed.gpio import sim
+
+START = 1_700_000_000
+
+def run(hours, outputs=()):
+    """Readings of a greenhouse on a manual clock, every simulated hour."""
+    clock = ManualClock(start=START)
+    house = sim.Greenhouse(clock, step=10, seed=1)
+    for output in outputs:
+        house.set(output, 1)
+
+    readings = []
+    for _ in range(hours):
+        clock.advance(3600)
+        readings.append([house.read(quantity) for quantity in sim.QUANTITIES])
+    return house, readings
+
+def test_replays_are_deterministic():
+    assert run(6)[1] == run(6)[1]
+
+def test_time_only_moves_with_the_clock():
+    clock = ManualClock(start=START)
+    house = sim.Greenhouse(clock, step=10, seed=1)
+    first = house.snapshot()
+    assert house.snapshot() == first
+    clock.advance(60)
+    assert house.snapshot()["time"] == START + 60
+
+def test_outputs_drive_the_model():
+    idle, _ = run(4)
+    heated, _ = run(4, outputs=['heat'])
+    watered, _ = run(4, outputs=['pump'])
+
+    assert heated.temp > idle.temp
+    assert watered.moist > idle.moist
+    assert watered.tank < idle.tank == 1.0
+
+def test_readings_stay_in_range():
+    _, readings = run(48, outputs=['heat', 'pump'])
+    assert all(0.0 <= val <= 1.0 for reading in readings for val in reading)
+
+def test_configured_names_map_to_devices():
+    house = sim.Greenhouse(ManualClock(start=START), step=10, seed=1)
+    pump = house.pin('pump/enable', 5)
+    pump.value = 1
+    assert house.outputs['pump'] == 1
+    assert isinstance(house.channel('temp/front', 0), sim.Input)
+    # anything the model does not know is a plain stub
+    assert not isinstance(house.pin('unknown', 6), sim.Output)
+
+def test_daily_jobs_run_once_per_day():
+    clock = ManualClock(start=START)
+    jobs = Daily(clock)
+    runs = []
+    jobs.at("06:00", lambda: runs.append(clock.time()))
+
+    for _ in range(3 * 24):
+        clock.advance(3600)
+        jobs.run_pending()
+    assert len(runs) == 3
+
+    # several days at once still run the job once
+    clock.advance(5 * 86400)
+    jobs.run_pending()
+    assert len(runs) == 4
+
+def test_clocks_follow_another_processes():
+    server_clock = ScaledClock(speed=3600, start=START, origin=time.time() - 1)
+    clock = ScaledClock(speed=10)
+    clock.follow(server_clock.params())
+    assert abs(clock.time() - server_clock.time()) < 3600 * 0.1
+
+    # a server on real time
+    clock.follow(Clock().params())
+    assert clock.speed == 1 and abs(clock.time() - time.time()) < 1
+
+def test_client_gets_the_servers_clock(client):
+    assert client.clock() == {"speed" : 1, "start" : None, "origin" : None}
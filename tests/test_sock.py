@@ -0,0 +1,57 @@
+import socket
+
+import pytest
+
+from embed import config
+from embed.gpio import sock
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    left = sock.Socket(left.family, left.type, left.proto, fileno=left.detach())
+    right = sock.Socket(right.family, right.type, right.proto, fileno=right.detach())
+    yield left, right
+    left.close()
+    right.close()
+
+@pytest.mark.parametrize('msg', [b'', b'x', b'{"type": "PLIST", "params": {}}', bytes(range(256)) * 64])
+def test_frame_round_trip(pair, msg):
+    left, right = pair
+    left.send_var(msg)
+    assert right.recv_var() == msg
+
+def test_frames_in_a_row(pair):
+    left, right = pair
+    for msg in (b'one', b'two', b'three'):
+        left.send_var(msg)
+    assert [right.recv_var() for _ in range(3)] == [b'one', b'two', b'three']
+
+def test_clean_close_between_frames(pair):
+    left, right = pair
+    left.send_var(b'last')
+    left.close()
+    assert right.recv_var() == b'last'
+    assert right.recv_var() is None
+
+def test_close_mid_frame(pair):
+    left, right = pair
+    left.sendall(sock.HEADER.pack(10) + b'short')
+    left.close()
+    with pytest.raises(ConnectionError):
+        right.recv_var()
+
+def test_pack_var():
+    framed = sock.pack_var(b'abc')
+    assert framed == sock.HEADER.pack(3) + b'abc'
+    assert sock.unpack_header(framed[:sock.HEADER.size]) == 3
+
+def test_oversized_header_rejected(pair, monkeypatch):
+    monkeypatch.setattr(config.NetworkConfig, 'MAX_MSG_SIZE', 16)
+    assert sock.unpack_header(sock.HEADER.pack(16)) == 16
+    with pytest.raises(ValueError):
+        sock.unpack_header(sock.HEADER.pack(17))
+
+    left, right = pair
+    left.sendall(sock.HEADER.pack(1 << 30))
+    with pytest.raises(ValueError):
+        right.recv_var()
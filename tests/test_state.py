@@ -0,0 +1,81 @@
+import threading
+import time
+
+from embed.gpio import state
+
+def test_readers_share_the_lock():
+    lock = state.RWLock()
+    inside = threading.Barrier(3, timeout=1)
+
+    def read():
+        with lock.read():
+            inside.wait()
+
+    threads = [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    # only reached if both readers hold the lock at once
+    inside.wait()
+    for thread in threads:
+        thread.join(1)
+
+def test_writer_excludes_readers_and_waits_for_them():
+    lock = state.RWLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append('write')
+
+    with lock.read():
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        # the writer waits for the reader to leave
+        assert events == []
+    writer.join(1)
+    assert events == ['write']
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = state.RWLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append('write')
+
+    def read():
+        with lock.read():
+            events.append('read')
+
+    with lock.read():
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.05)
+        assert events == []
+    writer.join(1)
+    reader.join(1)
+    assert events == ['write', 'read']
+
+def test_versions_bump_on_every_change():
+    pins = state.VersionedState({0 : 0})
+    before = pins.snapshot()
+    assert before.data == {0 : 0} and before.version == 0
+
+    with pins.lock.write():
+        assert pins.set(0, 1) == 1
+        assert pins.set(1, 1) == 2
+
+    after = pins.snapshot()
+    assert after.data == {0 : 1, 1 : 1} and after.version == 2
+    # a snapshot is a copy
+    assert before.data == {0 : 0}
+
+def test_pin_lists_carry_the_version(client):
+    pin = int(next(iter(client.get_pins())))
+    first = client.send("PLIST")["version"]
+    client.set_pin(pin, 1)
+    assert client.send("PLIST")["version"] > first
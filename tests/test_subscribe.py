@@ -0,0 +1,33 @@
+import pytest
+
+from embed.gpio import Client
+
+def first_pin(client):
+    return int(next(iter(client.get_pins())))
+
+def test_first_update_holds_current_values(client, server):
+    pin = first_pin(client)
+    client.set_pin(pin, 1)
+    updates = Client(addr='127.0.0.1', port=server.port, path='').subscribe(pins=[pin], interval=0.01)
+    try:
+        assert next(updates)["pins"] == {str(pin) : 1}
+    finally:
+        updates.close()
+
+def test_changes_are_streamed(client, server):
+    pin = first_pin(client)
+    client.set_pin(pin, 0)
+    updates = Client(addr='127.0.0.1', port=server.port, path='').subscribe(pins=[pin], interval=0.01)
+    try:
+        next(updates)
+        client.set_pin(pin, 1)
+        assert next(updates)["pins"] == {str(pin) : 1}
+        client.set_pin(pin, 0)
+        assert next(updates)["pins"] == {str(pin) : 0}
+    finally:
+        updates.close()
+
+def test_invalid_subscription_is_refused(server):
+    updates = Client(addr='127.0.0.1', port=server.port, path='').subscribe()
+    with pytest.raises(ValueError):
+        next(updates)